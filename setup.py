@@ -0,0 +1,50 @@
+"""Build h-vialib, optionally compiling the hot modules with mypyc.
+
+Everything about the package is configured in pyproject.toml. This only
+exists to add the compiled modules when asked to with `H_VIALIB_MYPYC=1`:
+
+    pip install mypy setuptools setuptools_scm wheel
+    H_VIALIB_MYPYC=1 pip wheel --no-build-isolation --no-deps .
+
+The compiled modules sit next to the pure Python ones in the wheel, so
+Python picks them up when they can be loaded. The pure Python wheel is
+still built without the variable and is what's installed anywhere there's no
+compiled wheel for the platform.
+
+`make test-compiled` runs the unit tests against the compiled modules. They
+behave the same, except that arguments of the wrong type (like a `str` where
+an `int` is annotated) raise `TypeError` as soon as they are passed in.
+"""
+
+import os
+
+from setuptools import setup
+
+# Small pure Python modules on the per-request path. They are fully
+# annotated, as mypyc uses the annotations to generate faster code.
+COMPILED_MODULES = [
+    "src/h_vialib/_flat_dict.py",
+    "src/h_vialib/_params.py",
+    "src/h_vialib/configuration.py",
+    "src/h_vialib/secure/expiry.py",
+    "src/h_vialib/secure/token.py",
+    "src/h_vialib/secure/url.py",
+]
+
+
+def ext_modules():
+    if os.environ.get("H_VIALIB_MYPYC") != "1":
+        return []
+
+    try:
+        from mypyc.build import mypycify  # pylint:disable=import-outside-toplevel
+    except ImportError:
+        print("mypyc isn't installed, building pure Python modules only")
+        return []
+
+    # Only some modules are type checked here, so the override for the tests
+    # in pyproject.toml is unused, which mypyc would treat as an error
+    return mypycify(["--no-warn-unused-configs", *COMPILED_MODULES], opt_level="3")
+
+
+setup(ext_modules=ext_modules())
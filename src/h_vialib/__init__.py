@@ -1,4 +1,12 @@
 """Library functions for Via related products."""
 
-from h_vialib.client import ContentType, ViaClient, ViaDoc
+from h_vialib.client import (
+    ContentType,
+    ViaClient,
+    ViaClientRegistry,
+    ViaDoc,
+    ViaDocBatch,
+)
 from h_vialib.configuration import Configuration
+from h_vialib.content_type import ContentTypeClassifier
+from h_vialib.html_rewriter import HTMLLinkStripper
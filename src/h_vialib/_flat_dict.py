@@ -1,13 +1,15 @@
 """Tools for representing dicts as flat lists and converting them back."""
 
+from typing import Any, ClassVar, Mapping
+
 
 class FlatDict:
     """Convert from and to a flat format for dicts."""
 
-    SEPARATOR = "."
+    SEPARATOR: ClassVar[str] = "."
 
     @classmethod
-    def unflatten(cls, flat):
+    def unflatten(cls, flat: Mapping[str, Any]) -> dict[str, Any]:
         """Convert dot delimited flat data into nested dicts.
 
         This will convert a flat dict with keys like "a.b.c" into a nested
@@ -18,7 +20,7 @@ class FlatDict:
         :return: A nested dict
         """
 
-        nested = {}
+        nested: dict[str, Any] = {}
 
         for key, value in flat.items():
             parts = key.split(cls.SEPARATOR)
@@ -34,29 +36,31 @@ class FlatDict:
         return nested
 
     @classmethod
-    def flatten(cls, nested):
+    def flatten(cls, nested: Mapping[str, Any]) -> dict[str, Any]:
         """Flatten a nested dict into a flat dict with dot delimited keys.
 
         :param nested: A nested dict
         :return: A dict with dot delimited keys
         """
-        return cls._flatten(nested)
-
-    @classmethod
-    def _flatten(cls, nested, flat=None, key_prefix=None):
-        if key_prefix is None:
-            key_prefix = ""
-        else:
-            key_prefix += cls.SEPARATOR
-
-        if flat is None:
-            flat = {}
-
-        for key, value in nested.items():
-            flat_key = key_prefix + key
-            if isinstance(value, dict):
-                cls._flatten(value, flat=flat, key_prefix=flat_key)
+        flat: dict[str, Any] = {}
+
+        # The keys of the dicts we are in, and the items left in each. Keys
+        # are only joined for values, so the time taken grows linearly with
+        # the depth, and there's no recursion to run out of.
+        path: list[str] = []
+        stack = [iter(nested.items())]
+
+        while stack:
+            for key, value in stack[-1]:
+                if isinstance(value, dict):
+                    path.append(key)
+                    stack.append(iter(value.items()))
+                    break
+
+                flat[cls.SEPARATOR.join((*path, key))] = value
             else:
-                flat[flat_key] = value
+                stack.pop()
+                if path:
+                    path.pop()
 
         return flat
@@ -1,5 +1,7 @@
 """Logic for manipulating and separating Via, Client and non-Via params."""
 
+from typing import Any, ClassVar, Iterable
+
 
 class Params:
     """Split, separate and join Via parameters."""
@@ -8,7 +10,7 @@ class Params:
     # direct the user to. This would allow an attacker to craft a URL which
     # could do that to a user, so we whitelist harmless parameters instead
     # From: https://h.readthedocs.io/projects/client/en/latest/publishers/config/#config-settings
-    CLIENT_CONFIG_WHITELIST = {
+    CLIENT_CONFIG_WHITELIST: ClassVar[set[str]] = {
         # Things we use now
         "ignoreOtherConfiguration",
         "openSidebar",
@@ -23,10 +25,12 @@ class Params:
         "theme",
     }
 
-    KEY_PREFIX = "via"
+    KEY_PREFIX: ClassVar[str] = "via"
 
     @classmethod
-    def separate(cls, items):
+    def separate(
+        cls, items: Iterable[tuple[str, Any]]
+    ) -> tuple[list[tuple[str, Any]], list[tuple[str, Any]]]:
         """Separate params into via and non-via params.
 
         :param items: An iterable of key value pairs
@@ -45,7 +49,9 @@ class Params:
         return via_params, non_via_params
 
     @classmethod
-    def split(cls, merged_params, add_defaults=True):
+    def split(
+        cls, merged_params: dict[str, Any], add_defaults: bool = True
+    ) -> tuple[dict[str, Any], dict[str, Any]]:
         """Split merged nested Via and Client params.
 
         :param merged_params: Nested Via parameters
@@ -59,7 +65,12 @@ class Params:
         return cls._clean_params(via_params, client_params, add_defaults)
 
     @classmethod
-    def join(cls, via_params, client_params, add_defaults=True):
+    def join(
+        cls,
+        via_params: dict[str, Any],
+        client_params: dict[str, Any],
+        add_defaults: bool = True,
+    ) -> dict[str, Any]:
         """Join Via and Client params into a single nested structure.
 
         :param via_params: Params for Via
@@ -74,7 +85,12 @@ class Params:
         return {cls.KEY_PREFIX: dict(via_params, client=client_params)}
 
     @classmethod
-    def _clean_params(cls, via_params, client_params, add_defaults=True):
+    def _clean_params(
+        cls,
+        via_params: dict[str, Any],
+        client_params: dict[str, Any],
+        add_defaults: bool = True,
+    ) -> tuple[dict[str, Any], dict[str, Any]]:
         # Remove keys which are not in the whitelist
         for key in set(client_params.keys()) - cls.CLIENT_CONFIG_WHITELIST:
             client_params.pop(key)
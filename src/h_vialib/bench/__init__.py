@@ -0,0 +1 @@
+"""Tools for benchmarking and profiling h_vialib against a corpus of URLs."""
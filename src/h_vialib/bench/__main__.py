@@ -0,0 +1,5 @@
+import sys
+
+from h_vialib.bench.cli import main
+
+sys.exit(main())
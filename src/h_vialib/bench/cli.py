@@ -0,0 +1,519 @@
+"""Benchmark h_vialib operations over a corpus of URLs.
+
+Usage: python -m h_vialib.bench CORPUS [options]
+
+The corpus is a file (or "-" for stdin) with one URL per line, optionally
+followed by a tab and a JSON object of keyword arguments for
+`ViaClient.url_for` (e.g. `{"content_type": "pdf", "headers": {...}}`).
+Blank lines and lines starting with "#" are ignored.
+
+With `--load` the links generated for the corpus are instead requested from a
+local stand-in for Via (see `h_vialib.bench.server`), either in-process or
+over HTTP with `--http`, to measure the whole sign -> request -> verify round
+trip.
+
+With `--threads` the operations are shared between that many threads, to
+measure how throughput scales when one client is shared between them. This
+is mostly of interest on free-threaded builds of CPython, so whether the GIL
+is enabled is reported along with the results.
+
+Any of h_vialib's modules which are compiled (see `setup.py`) are listed
+after the results, so runs with and without them can be compared.
+"""
+
+import argparse
+import cProfile
+import io
+import json
+import pstats
+import sys
+import threading
+import tracemalloc
+from contextlib import nullcontext
+from importlib.machinery import EXTENSION_SUFFIXES
+from time import perf_counter_ns
+from typing import NamedTuple, Optional
+
+from h_vialib.bench.server import (
+    StandInVia,
+    request_in_process,
+    request_over_http,
+    run_load,
+    serve,
+)
+from h_vialib.client import ViaClient, ViaDoc
+from h_vialib.configuration import Configuration
+from h_vialib.secure import Encryption, SignedURLStore, ViaSecureURL
+
+
+class Entry(NamedTuple):
+    """A URL from the corpus and any arguments for `url_for`."""
+
+    url: str
+    kwargs: dict
+
+
+class Result(NamedTuple):
+    """Timings for one operation."""
+
+    operation: str
+    calls: int
+    total_ns: int
+    percentiles: dict
+    elapsed_ns: Optional[int] = None
+    """Wall clock time of a run across threads, which overlaps calls."""
+
+    @property
+    def throughput(self):
+        """Get the number of calls per second.
+
+        This is over the wall clock time for runs across threads, and over the
+        total time of the calls otherwise.
+        """
+        total_ns = self.elapsed_ns or self.total_ns
+        return self.calls * 1e9 / total_ns if total_ns else 0.0
+
+
+def load_corpus(lines):
+    """Read corpus entries from an iterable of lines.
+
+    :param lines: Lines of the corpus file
+    :return: A list of `Entry`
+    :raise ValueError: If the arguments for a URL are not a JSON object
+    """
+    entries = []
+
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        url, _, kwargs = line.partition("\t")
+        kwargs = json.loads(kwargs) if kwargs.strip() else {}
+        if not isinstance(kwargs, dict):
+            raise ValueError(f"Line {line_number}: expected a JSON object")
+
+        entries.append(Entry(url.strip(), kwargs))
+
+    return entries
+
+
+class Operations:
+    """The operations which can be benchmarked.
+
+    Each operation prepares its inputs from the corpus up front, so only the
+    operation itself is timed.
+    """
+
+    NAMES = (
+        "url_for",
+        "classify",
+        "verify",
+        "extract_from_url",
+        "strip_from_url",
+        "encrypt",
+        "decrypt",
+    )
+
+    def __init__(self, secret, service_url, html_service_url, signed_url_store=None):
+        self._client = ViaClient(
+            secret,
+            service_url=service_url,
+            html_service_url=html_service_url,
+            signed_url_store=signed_url_store,
+        )
+        self._secure_url = ViaSecureURL(secret)
+        self._encryption = Encryption(secret.encode("utf-8"))
+
+    def prepare(self, name, entries):
+        """Get the function to time for an operation and its inputs.
+
+        :param name: One of `NAMES`
+        :param entries: The corpus entries
+        :return: A tuple of a single argument function and a list of inputs
+        """
+        return getattr(self, f"_prepare_{name}")(entries)
+
+    def _prepare_url_for(self, entries):
+        return (
+            lambda entry: self._client.url_for(entry.url, **entry.kwargs),
+            entries,
+        )
+
+    def _prepare_classify(self, entries):
+        return ViaDoc.DEFAULT_CLASSIFIER.classify, [entry.url for entry in entries]
+
+    def _prepare_verify(self, entries):
+        return (
+            self._secure_url.verify,
+            [self._secure_url.create(entry.url) for entry in entries],
+        )
+
+    def _prepare_extract_from_url(self, entries):
+        return Configuration.extract_from_url, [entry.url for entry in entries]
+
+    def _prepare_strip_from_url(self, entries):
+        return Configuration.strip_from_url, [entry.url for entry in entries]
+
+    def _prepare_encrypt(self, entries):
+        return self._encryption.encrypt_dict, [self._payload(e) for e in entries]
+
+    def _prepare_decrypt(self, entries):
+        return (
+            self._encryption.decrypt_dict,
+            [self._encryption.encrypt_dict(self._payload(e)) for e in entries],
+        )
+
+    @staticmethod
+    def _payload(entry):
+        return entry.kwargs.get("headers") or {"url": entry.url}
+
+
+def time_calls(function, inputs, iterations):
+    """Call a function with every input repeatedly, timing each call.
+
+    :param function: A single argument function
+    :param inputs: The arguments to call it with
+    :param iterations: How many times to go through all of the inputs
+    :return: A list of the time each call took in nanoseconds
+    """
+    timings = []
+
+    for _ in range(iterations):
+        for item in inputs:
+            start = perf_counter_ns()
+            function(item)
+            timings.append(perf_counter_ns() - start)
+
+    return timings
+
+
+def time_threaded_calls(function, inputs, iterations, threads):
+    """Call a function with every input repeatedly from many threads.
+
+    The calls are split round-robin between the threads, so the same calls
+    are made whatever the number of threads.
+
+    :param function: A single argument function
+    :param inputs: The arguments to call it with
+    :param iterations: How many times to go through all of the inputs
+    :param threads: How many threads to make the calls from
+    :return: A tuple of a list of the time each call took in nanoseconds and
+        the wall clock time taken by all of them
+    """
+    calls = iterations * len(inputs)
+    timings = []
+    # Wait for every thread to start so they all run at once
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        barrier.wait()
+        thread_timings = []
+        for i in range(offset, calls, threads):
+            item = inputs[i % len(inputs)]
+            start = perf_counter_ns()
+            function(item)
+            thread_timings.append(perf_counter_ns() - start)
+
+        # list.extend is atomic, even without the GIL
+        timings.extend(thread_timings)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+
+    barrier.wait()
+    start = perf_counter_ns()
+    for thread in workers:
+        thread.join()
+
+    return timings, perf_counter_ns() - start
+
+
+def gil_enabled():
+    """Check if the GIL is enabled.
+
+    :return: False on a free-threaded build of CPython with the GIL disabled
+    """
+    # Only free-threading capable versions of Python (3.13+) have this
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+
+    return is_gil_enabled() if is_gil_enabled else True
+
+
+def summarise(operation, timings, percentiles=(50, 90, 99, 100), elapsed_ns=None):
+    """Summarise call timings.
+
+    :param operation: Name of the operation
+    :param timings: Call timings in nanoseconds
+    :param percentiles: The percentiles to calculate
+    :param elapsed_ns: Wall clock time taken by calls made across threads
+    :return: A `Result`
+    """
+    timings = sorted(timings)
+
+    return Result(
+        operation=operation,
+        calls=len(timings),
+        total_ns=sum(timings),
+        percentiles={
+            percentile: (
+                timings[min(len(timings) - 1, len(timings) * percentile // 100)]
+                if timings
+                else 0
+            )
+            for percentile in percentiles
+        },
+        elapsed_ns=elapsed_ns,
+    )
+
+
+def compiled_modules():
+    """Get the names of h_vialib's modules which are loaded and compiled.
+
+    :return: A sorted list of module names
+    """
+    return sorted(
+        name
+        for name, module in list(sys.modules.items())
+        if name.split(".")[0] == "h_vialib"
+        and (getattr(module, "__file__", None) or "").endswith(
+            tuple(EXTENSION_SUFFIXES)
+        )
+    )
+
+
+def format_results(results):
+    """Format results as a table.
+
+    :param results: An iterable of `Result`
+    :return: The table as a string
+    """
+    results = list(results)
+    percentiles = list(results[0].percentiles) if results else []
+
+    headings = ["operation", "calls", "ops/s"] + [
+        "max us" if p == 100 else f"p{p} us" for p in percentiles
+    ]
+    rows = [
+        [result.operation, str(result.calls), f"{result.throughput:,.0f}"]
+        + [f"{result.percentiles[p] / 1000:.1f}" for p in percentiles]
+        for result in results
+    ]
+
+    widths = [
+        max(len(row[i]) for row in [headings] + rows) for i in range(len(headings))
+    ]
+
+    return "\n".join(
+        "  ".join(
+            cell.rjust(width) if i else cell.ljust(width)
+            for i, (cell, width) in enumerate(zip(row, widths))
+        )
+        for row in [headings] + rows
+    )
+
+
+def main(argv=None, stdout=None):
+    """Run the benchmarks from the command line.
+
+    :param argv: Command line arguments (default: `sys.argv[1:]`)
+    :param stdout: Stream to write the report to (default: `sys.stdout`)
+    :return: The exit code
+    """
+    stdout = stdout or sys.stdout
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if args.threads > 1 and args.profile == "cprofile" and not args.load:
+        # cProfile only sees the thread it was enabled in
+        parser.error("--profile cprofile can't be used with --threads")
+
+    if args.corpus == "-":
+        entries = load_corpus(sys.stdin)
+    else:
+        with open(args.corpus, encoding="utf-8") as corpus:
+            entries = load_corpus(corpus)
+
+    if args.load:
+        return _load_test(args, entries, stdout)
+
+    operations = Operations(
+        args.secret,
+        args.service_url,
+        args.html_service_url,
+        SignedURLStore(args.signed_url_store) if args.signed_url_store else None,
+    )
+
+    profile = cProfile.Profile() if args.profile == "cprofile" else None
+    if args.profile == "tracemalloc":
+        tracemalloc.start()
+
+    results = [
+        _run_operation(operations, name, entries, args, profile)
+        for name in args.operation or Operations.NAMES
+    ]
+
+    print(format_results(results), file=stdout)
+    print(f"compiled: {', '.join(compiled_modules()) or 'none'}", file=stdout)
+    if args.threads > 1:
+        print(
+            f"threads: {args.threads} "
+            f"(GIL {'enabled' if gil_enabled() else 'disabled'})",
+            file=stdout,
+        )
+
+    if profile:
+        print(file=stdout)
+        _print_profile(profile, args.top, stdout)
+
+    if args.profile == "tracemalloc":
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        print(file=stdout)
+        _print_allocations(snapshot, args.top, stdout)
+
+    return 0
+
+
+def format_load_result(result, skipped=0):
+    """Format the result of a load run as a report.
+
+    :param result: A `LoadResult`
+    :param skipped: How many links were skipped as they don't go to Via
+    :return: The report as a string
+    """
+    verify = summarise("verify", result.verify_timings)
+    lines = [
+        f"requests      {result.requests:,} in {result.elapsed_ns / 1e9:.2f}s "
+        f"({result.requests_per_second:,.0f} requests/s)",
+        "statuses      "
+        + ", ".join(
+            f"{status}: {count:,}" for status, count in sorted(result.statuses.items())
+        ),
+        "verify        "
+        + ", ".join(
+            f"{'max' if p == 100 else f'p{p}'} {value / 1000:.1f}us"
+            for p, value in verify.percentiles.items()
+        ),
+        f"verify share  {result.verify_share:.0%} of elapsed time",
+    ]
+    if skipped:
+        lines.append(f"skipped       {skipped:,} links to Via HTML")
+
+    return "\n".join(lines)
+
+
+def _run_operation(operations, name, entries, args, profile):
+    function, inputs = operations.prepare(name, entries)
+
+    if args.threads > 1:
+        timings, elapsed_ns = time_threaded_calls(
+            function, inputs, args.iterations, args.threads
+        )
+        return summarise(name, timings, elapsed_ns=elapsed_ns)
+
+    if profile:
+        profile.enable()
+    timings = time_calls(function, inputs, args.iterations)
+    if profile:
+        profile.disable()
+
+    return summarise(name, timings)
+
+
+def _load_test(args, entries, stdout):
+    app = StandInVia(args.secret)
+
+    with serve(app) if args.http else nullcontext(args.service_url) as service_url:
+        client = ViaClient(
+            args.secret,
+            service_url=service_url,
+            html_service_url=args.html_service_url,
+        )
+        links = [client.url_for(entry.url, **entry.kwargs) for entry in entries]
+
+        # Links to Via HTML don't go to Via, so the stand-in can't serve them
+        via_links = [link for link in links if link.startswith(service_url)]
+        if not via_links:
+            print("No links to Via in the corpus", file=stdout)
+            return 1
+
+        result = run_load(
+            app,
+            via_links,
+            requests=args.iterations * len(via_links),
+            threads=args.threads,
+            send_request=request_over_http if args.http else request_in_process,
+        )
+
+    print(format_load_result(result, len(links) - len(via_links)), file=stdout)
+    return 0
+
+
+def _print_profile(profile, top, stdout):
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats("tottime").print_stats(top)
+    print(output.getvalue().strip(), file=stdout)
+
+
+def _print_allocations(snapshot, top, stdout):
+    print(f"Top {top} allocation sites:", file=stdout)
+    for stat in snapshot.statistics("lineno")[:top]:
+        print(stat, file=stdout)
+
+
+def _parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m h_vialib.bench",
+        description="Benchmark h_vialib operations over a corpus of URLs.",
+    )
+    parser.add_argument(
+        "corpus",
+        help="File with one URL per line, optionally followed by a tab and a "
+        "JSON object of url_for arguments ('-' for stdin)",
+    )
+    parser.add_argument(
+        "-o",
+        "--operation",
+        action="append",
+        choices=Operations.NAMES,
+        help="Operation to run, can be repeated (default: all)",
+    )
+    parser.add_argument(
+        "-n", "--iterations", type=int, default=100, help="Passes over the corpus"
+    )
+    parser.add_argument(
+        "--profile",
+        choices=("cprofile", "tracemalloc"),
+        help="Profile the runs (this slows them down)",
+    )
+    parser.add_argument(
+        "--top", type=int, default=20, help="How many profile entries to show"
+    )
+    parser.add_argument(
+        "--load",
+        action="store_true",
+        help="Request the generated links from a local stand-in for Via",
+    )
+    parser.add_argument(
+        "--http",
+        action="store_true",
+        help="With --load, make requests over HTTP rather than in-process",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=1,
+        help="How many threads to run the operations (or with --load, make "
+        "requests) from",
+    )
+    parser.add_argument(
+        "--signed-url-store",
+        metavar="PATH",
+        help="Share signed URLs for url_for through a SQLite file at PATH",
+    )
+    parser.add_argument("--secret", default="not_a_secret_only_for_benchmarking")
+    parser.add_argument("--service-url", default="http://via.example.com")
+    parser.add_argument("--html-service-url", default="http://viahtml.example.com")
+
+    return parser
@@ -0,0 +1,187 @@
+"""A local stand-in for Via to load test signed links end to end.
+
+This lets us measure the whole sign -> request -> verify round trip without a
+real Via deployment, either in-process or over HTTP on the loopback interface.
+"""
+
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from socketserver import ThreadingMixIn
+from time import perf_counter_ns
+from typing import NamedTuple
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from webob import Request, Response
+from webob.exc import HTTPNotFound, HTTPUnauthorized
+
+from h_vialib.configuration import Configuration
+from h_vialib.exceptions import TokenException
+from h_vialib.secure import ViaSecureURL
+
+
+class StandInVia:
+    """A WSGI app which behaves like the signed endpoints of Via.
+
+    Every request to `PATHS` has its `via.sec` token verified and its
+    configuration extracted, exactly as Via does, before returning a small
+    JSON description of what Via would have proxied. The time taken to verify
+    each request is kept in `verify_timings` (in nanoseconds).
+    """
+
+    PATHS = ("/route", "/pdf", "/video/youtube")
+
+    def __init__(self, secret):
+        """Initialise the app.
+
+        :param secret: The secret Via links are signed with
+        """
+        self._secure_url = ViaSecureURL(secret)
+        self.verify_timings = []
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        if request.path_info not in self.PATHS:
+            return HTTPNotFound()(environ, start_response)
+
+        start = perf_counter_ns()
+        try:
+            self._secure_url.verify(request.url)
+        except TokenException as err:
+            return HTTPUnauthorized(detail=str(err) or None)(environ, start_response)
+        finally:
+            # Appending to a list is thread safe, so we don't need a lock
+            self.verify_timings.append(perf_counter_ns() - start)
+
+        via_config, h_config = Configuration.extract_from_wsgi_environment(environ)
+
+        return Response(
+            json_body={
+                "endpoint": request.path_info,
+                "url": request.GET.get("url"),
+                "via": via_config,
+                "h": h_config,
+            }
+        )(environ, start_response)
+
+
+class LoadResult(NamedTuple):
+    """The outcome of a load run."""
+
+    requests: int
+    elapsed_ns: int
+    statuses: Counter
+    verify_timings: list
+
+    @property
+    def requests_per_second(self):
+        """Get the number of requests handled per second."""
+        return self.requests * 1e9 / self.elapsed_ns if self.elapsed_ns else 0.0
+
+    @property
+    def verify_share(self):
+        """Get the fraction of the elapsed time spent verifying tokens.
+
+        With more than one thread this is the total time spent verifying over
+        the wall clock time, so it can be more than 1.
+        """
+        return sum(self.verify_timings) / self.elapsed_ns if self.elapsed_ns else 0.0
+
+
+def request_in_process(app, link):
+    """Make a request to a WSGI app without any networking.
+
+    :param app: The WSGI app
+    :param link: The URL to request
+    :return: The HTTP status code
+    """
+    return Request.blank(link).get_response(app).status_code
+
+
+def request_over_http(_app, link):
+    """Make a request over HTTP to whichever server is in the link.
+
+    :param link: The URL to request
+    :return: The HTTP status code
+    """
+    try:
+        with urlopen(link) as response:  # nosec: We only request our own server
+            response.read()
+            return response.status
+    except HTTPError as err:
+        return err.code
+
+
+def run_load(app, links, requests, threads=1, send_request=request_in_process):
+    """Send requests for links to a `StandInVia` and time them.
+
+    The links are requested round-robin, split evenly across the threads.
+
+    :param app: The `StandInVia` to send requests to
+    :param links: The URLs to request
+    :param requests: The total number of requests to make
+    :param threads: How many threads to make requests from
+    :param send_request: Function to make one request with, called with
+        `app` and a link and returning the status code
+    :return: A `LoadResult`
+    """
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker(offset):
+        counts = Counter(
+            send_request(app, links[i % len(links)])
+            for i in range(offset, requests, threads)
+        )
+        with lock:
+            statuses.update(counts)
+
+    app.verify_timings.clear()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+
+    start = perf_counter_ns()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed_ns = perf_counter_ns() - start
+
+    return LoadResult(
+        requests=sum(statuses.values()),
+        elapsed_ns=elapsed_ns,
+        statuses=statuses,
+        verify_timings=list(app.verify_timings),
+    )
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        """Don't log every request to stderr."""
+
+
+@contextmanager
+def serve(app, host="127.0.0.1"):
+    """Serve a WSGI app over HTTP on a free port in a background thread.
+
+    :param app: The WSGI app to serve
+    :param host: The interface to listen on
+    :return: A context manager yielding the base URL of the server
+    """
+    server = make_server(
+        host, 0, app, server_class=_ThreadingWSGIServer, handler_class=_QuietHandler
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -1,52 +1,191 @@
 """Helper classes for clients using Via proxying."""
 
-import re
-from enum import Enum
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from hashlib import blake2b
 from typing import Optional
-from urllib.parse import parse_qsl, urlencode, urlparse
+from urllib.parse import unquote_plus, urlencode, urlparse, urlsplit, urlunsplit
 
-from webob.multidict import MultiDict
+from h_vialib.content_type import ContentType, ContentTypeClassifier
+from h_vialib.secure import (
+    SYSTEM_CLOCK,
+    CachedEncryption,
+    Encryption,
+    ViaSecureURL,
+    quantized_expiry,
+)
 
-from h_vialib.secure import Encryption, ViaSecureURL
 
+class ViaDoc:
+    """A doc we want to proxy with content type."""
 
-class ContentType(str, Enum):
-    PDF = "pdf"
-    HTML = "html"
-    YOUTUBE = "youtube"
+    # We can have a lot of these alive at once, so avoid a `__dict__` each
+    __slots__ = ("url", "content_type")
 
+    DEFAULT_CLASSIFIER = ContentTypeClassifier()
 
-class ViaDoc:
-    """A doc we want to proxy with content type."""
+    def __init__(self, url, content_type=None, classifier=None):
+        """Initialize a new doc with it's url and content_type if known.
+
+        :param url: URL of the document
+        :param content_type: Content type of the document if known
+        :param classifier: `ContentTypeClassifier` used to guess the content
+            type when it isn't given (default: `DEFAULT_CLASSIFIER`)
+        """
+        self.url, self.content_type = _classify(
+            url, content_type, classifier or self.DEFAULT_CLASSIFIER
+        )
+
+
+class ViaDocBatch:
+    """Many docs we want to proxy, stored as columns.
+
+    Rather than an object per document this keeps a list of URLs and a
+    parallel array with a byte per document for the content type, which is
+    much smaller when generating links for thousands of documents at once.
+    Pass it to `ViaClient.url_for_batch` to generate the links.
+    """
+
+    __slots__ = ("urls", "_type_codes", "_classifier")
+
+    # The content type each code in `_type_codes` stands for
+    _CONTENT_TYPES = (None, ContentType.PDF, ContentType.HTML, ContentType.YOUTUBE)
+    _TYPE_CODES = {
+        content_type: code for code, content_type in enumerate(_CONTENT_TYPES)
+    }
+
+    def __init__(self, urls=(), content_types=None, classifier=None):
+        """Initialize a batch of docs.
+
+        :param urls: URLs of the documents
+        :param content_types: Content types of the documents in the same
+            order as `urls`, with None for any which aren't known (default:
+            guess them all)
+        :param classifier: `ContentTypeClassifier` used to guess the content
+            type when it isn't given (default: `ViaDoc.DEFAULT_CLASSIFIER`)
+        :raise ValueError: If the number of content types doesn't match the
+            number of URLs, or any of them is not a `ContentType`
+        """
+        self.urls = []
+        self._type_codes = array("B")
+        self._classifier = classifier or ViaDoc.DEFAULT_CLASSIFIER
+
+        if content_types is None:
+            for url in urls:
+                self.append(url)
+            return
+
+        urls, content_types = list(urls), list(content_types)
+        if len(urls) != len(content_types):
+            raise ValueError("There must be a content type for every URL")
+
+        for url, content_type in zip(urls, content_types):
+            self.append(url, content_type)
+
+    def append(self, url, content_type=None):
+        """Add a doc to the batch.
+
+        :param url: URL of the document
+        :param content_type: Content type of the document if known
+        :raise ValueError: If the content type is not a `ContentType`
+        """
+        url, content_type = _classify(url, content_type, self._classifier)
+        if content_type is not None:
+            content_type = ContentType(content_type)
 
-    _GOOGLE_DRIVE_REGEX = re.compile(
-        r"^https://drive.google.com/uc\?id=(.*)&export=download$", re.IGNORECASE
-    )
+        self.urls.append(url)
+        self._type_codes.append(self._TYPE_CODES[content_type])
 
-    def __init__(self, url, content_type=None):
-        """Initialize a new doc with it's url and content_type if known."""
-        self.url = url
+    def __len__(self):
+        return len(self.urls)
 
-        if content_type is None and self._GOOGLE_DRIVE_REGEX.match(url):
-            content_type = ContentType.PDF
+    def __getitem__(self, index):
+        """Get a single doc from the batch as a `ViaDoc`."""
+        doc = ViaDoc.__new__(ViaDoc)
+        doc.url = self.urls[index]
+        doc.content_type = self._CONTENT_TYPES[self._type_codes[index]]
+        return doc
 
-        self.content_type = content_type
+    def __iter__(self):
+        """Iterate over `(url, content_type)` pairs without making `ViaDoc`s."""
+        content_types = self._CONTENT_TYPES
+        for url, code in zip(self.urls, self._type_codes):
+            yield url, content_types[code]
 
 
-class ViaClient:  # pylint: disable=too-few-public-methods
-    """A small wrapper to make calling Via easier."""
+def _classify(url, content_type, classifier):
+    if content_type is None:
+        content_type = classifier.classify(url)
 
-    def __init__(self, secret, service_url=None, html_service_url=None):
+    if content_type == ContentType.YOUTUBE:
+        # Make sure the same video always results in the same URL
+        url = classifier.canonicalize(url)
+
+    return url, content_type
+
+
+class ViaClient:  # pylint:disable=too-many-instance-attributes
+    """A small wrapper to make calling Via easier.
+
+    A single client can be shared between threads, as long as `options` is
+    not modified while it is in use.
+    """
+
+    # pylint:disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        secret,
+        service_url=None,
+        html_service_url=None,
+        classifier=None,
+        reuse_secrets=False,
+        compress_secrets_threshold=None,
+        signed_url_store=None,
+        clock=None,
+    ):
         """Initialize a ViaClient pointing to a `via_url` via server.
 
         :param secret: Shared secret to sign the URL
         :param service_url: Location of the via server
         :param html_service_url: Location of the Via HTML presenter
+        :param classifier: `ContentTypeClassifier` to guess content types
+            with when they aren't given (default: `ViaDoc.DEFAULT_CLASSIFIER`)
+        :param reuse_secrets: Reuse the encrypted `headers` and `query` for
+            identical values within an expiry window, so repeated links are
+            identical and can be cached
+        :param compress_secrets_threshold: Compress the encrypted `headers`
+            and `query` when they are at least this many bytes as JSON
+        :param signed_url_store: `SignedURLStore` to share signed URLs with
+            other processes. URLs with `headers` or `query` are never stored.
+        :param clock: `Clock` to create expiry times with (default: the
+            system clock)
         """
-        self._secure_secrets = Encryption(secret.encode("utf-8"))
-        self._secure_url = ViaSecureURL(secret)
+        self._clock = clock or SYSTEM_CLOCK
+
+        if reuse_secrets:
+            self._secure_secrets = CachedEncryption(
+                secret.encode("utf-8"),
+                max_age=ViaSecureURL.MAX_AGE,
+                compress_threshold=compress_secrets_threshold,
+                clock=self._clock,
+            )
+        else:
+            self._secure_secrets = Encryption(
+                secret.encode("utf-8"), compress_threshold=compress_secrets_threshold
+            )
+
+        self._secure_url = ViaSecureURL(secret, clock=self._clock)
+        self._signed_url_store = signed_url_store
+        # Store entries are keyed with the secret, so clients with different
+        # secrets sharing a store can't get each other's signed URLs
+        self._store_key = blake2b(
+            secret.encode("utf-8"), person=b"h_vialib.store"
+        ).digest()
         self._service_url = urlparse(service_url) if service_url else None
         self._html_service_url = html_service_url
+        self._classifier = classifier
 
         # Default via parameters
         self.options = {
@@ -84,8 +223,37 @@ class ViaClient:  # pylint: disable=too-few-public-methods
             python, ie only PDFs from certain sources.
         :return: Full Via URL suitable for redirecting a user to
         """
-        doc = ViaDoc(url, content_type)
+        doc = ViaDoc(url, content_type, self._classifier)
+
+        return self._url_for_doc(
+            doc.url,
+            doc.content_type,
+            self._params(options, blocked_for, query, headers),
+        )
+
+    def url_for_batch(
+        self, batch, options=None, blocked_for=None, query=None, headers=None
+    ):
+        """Generate Via URLs for every doc in a batch.
+
+        The options, query and headers apply to every doc, and the query and
+        headers are only encrypted once for the whole batch.
+
+        :param batch: A `ViaDocBatch` of the docs
+        :param options: Any additional params to add to the URLs
+        :param blocked_for: context for the blocked pages
+        :param query: Any extra query params needed to make the requests
+        :param headers: Any headers needed to make the requests
+        :return: A list of Via URLs in the same order as the docs
+        """
+        params = self._params(options, blocked_for, query, headers)
 
+        return [
+            self._url_for_doc(url, content_type, dict(params))
+            for url, content_type in batch
+        ]
+
+    def _params(self, options, blocked_for, query, headers):
         params = dict(self.options)
         if options:
             params.update(options)
@@ -99,15 +267,39 @@ class ViaClient:  # pylint: disable=too-few-public-methods
         if blocked_for:
             params["via.blocked_for"] = blocked_for
 
-        if doc.content_type == ContentType.HTML:
+        return params
+
+    def _url_for_doc(self, url, content_type, params):
+        if content_type == ContentType.HTML:
             # Optimisation to skip routing for documents we know are HTML
-            via_url = self._url_for_html(doc.url, params)
-        else:
-            via_url = self._secure_url.create(self._url_for(doc, params))
+            return self._url_for_html(url, params)
 
-        return via_url
+        has_secrets = "via.secret.query" in params or "via.secret.headers" in params
+        via_url = self._url_for(url, content_type, params)
 
-    def _url_for(self, doc, query):
+        # We don't want encrypted secrets written to disk
+        if self._signed_url_store is None or has_secrets:
+            return self._secure_url.create(via_url)
+
+        return self._stored_signed_url(url, via_url)
+
+    def _stored_signed_url(self, url, via_url):
+        # The Via URL has the path and all of the options in it
+        options_digest = blake2b(
+            via_url.encode("utf-8"), key=self._store_key, digest_size=16
+        ).digest()
+        expires = int(
+            quantized_expiry(ViaSecureURL.MAX_AGE, clock=self._clock).timestamp()
+        )
+
+        signed_url = self._signed_url_store.get(url, options_digest, expires)
+        if signed_url is None:
+            signed_url = self._secure_url.create(via_url)
+            self._signed_url_store.put(url, options_digest, expires, signed_url)
+
+        return signed_url
+
+    def _url_for(self, url, content_type, query):
         if self._service_url is None:
             raise ValueError("Cannot rewrite URLs without a service URL")
 
@@ -116,9 +308,9 @@ class ViaClient:  # pylint: disable=too-few-public-methods
             ContentType.PDF: "/pdf",
             ContentType.YOUTUBE: "/video/youtube",
         }
-        path = content_type_paths.get(doc.content_type, "/route")
+        path = content_type_paths.get(content_type, "/route")
 
-        query["url"] = doc.url
+        query["url"] = url
 
         return self._service_url._replace(path=path, query=urlencode(query)).geturl()
 
@@ -126,33 +318,108 @@ class ViaClient:  # pylint: disable=too-few-public-methods
         if self._html_service_url is None:
             raise ValueError("Cannot rewrite HTML URLs without an HTML service URL")
 
+        # This is called a lot, so we parse the URL exactly once and leave the
+        # query it came with as we found it, rather than re-encoding it
+        url_parts = urlsplit(url)
+
         # pywb is annoying. If we send a URL with a bare hostname and no path
         # it will issue a redirect to the same URL with a trailing slash, which
         # makes our token invalid. So we beat it to the punch
-        url = self._fix_bare_hostname(url)
+        if not url_parts.path:
+            url_parts = url_parts._replace(path="/")
 
-        rewriter_url = urlparse(f"{self._html_service_url}/{url}")
+        # Remove any already present signing parameters not needed for viahtml
+        query.pop("via.sec", None)
 
-        # Merge our options and the params from the URL
-        query = MultiDict(query)
+        # Merge our options and the params from the URL, with the URL winning
+        url_items = []
+        for item in url_parts.query.split("&"):
+            key = unquote_plus(item.partition("=")[0])
+            if not key or key == "via.sec":
+                continue
 
-        items = parse_qsl(rewriter_url.query)
-        for key, _ in items:
             query.pop(key, None)
+            url_items.append(item)
 
-        query.extend(items)
-        if "via.sec" in query:
-            # Remove any already present signing parameters not needed for viahtml
-            del query["via.sec"]
+        if query:
+            url_items.insert(0, urlencode(query))
+
+        return f"{self._html_service_url}/" + urlunsplit(
+            url_parts._replace(query="&".join(url_items))
+        )
+
+
+class ViaClientRegistry:
+    """A bounded cache of `ViaClient` objects, for serving many tenants.
+
+    Creating a client imports keys and parses URLs, which is wasted work if
+    it's done on every request for the same few configurations. This keeps
+    the most recently used clients, keyed on their configuration, and evicts
+    the least recently used once it's full.
+
+    Secrets aren't kept in the keys. They are replaced with a keyed digest,
+    using a key which is random for each registry.
 
-        return rewriter_url._replace(query=urlencode(query)).geturl()
+    Clients are shared between everyone who asks for the same configuration,
+    so their `options` shouldn't be modified.
+    """
 
-    @classmethod
-    def _fix_bare_hostname(cls, url):
-        """Add a trailing slash to URLs without a path."""
+    def __init__(self, max_size=128):
+        """Initialise the registry.
 
-        parsed_url = urlparse(url)
-        if parsed_url.path:
-            return url
+        :param max_size: How many clients to keep
+        """
+        self._max_size = max_size
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self._digest_key = os.urandom(32)
+
+    def get(self, secret, service_url=None, html_service_url=None, **kwargs):
+        """Get a client for a configuration, creating it if needed.
 
-        return parsed_url._replace(path="/").geturl()
+        :param secret: Shared secret to sign the URL
+        :param service_url: Location of the via server
+        :param html_service_url: Location of the Via HTML presenter
+        :param kwargs: Any other arguments for `ViaClient`, which must be
+            hashable
+        :return: A `ViaClient`
+        """
+        key = (
+            blake2b(secret.encode("utf-8"), key=self._digest_key).digest(),
+            service_url,
+            html_service_url,
+            tuple(sorted(kwargs.items())),
+        )
+
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+
+        # Outside of the lock, so one slow client doesn't hold up the others
+        client = ViaClient(
+            secret,
+            service_url=service_url,
+            html_service_url=html_service_url,
+            **kwargs,
+        )
+
+        with self._lock:
+            # Another thread might have beaten us to it, and we'd rather
+            # everyone got the same client
+            client = self._clients.setdefault(key, client)
+            self._clients.move_to_end(key)
+
+            while len(self._clients) > self._max_size:
+                self._clients.popitem(last=False)
+
+        return client
+
+    def clear(self):
+        """Remove all of the clients."""
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
@@ -1,11 +1,22 @@
 """Tools for reading and writing Via configuration."""
 
-from urllib.parse import parse_qsl, urlencode, urlparse
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, ClassVar, Iterable, Iterator, Mapping, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlsplit
+
+from mypy_extensions import mypyc_attr
 
 from h_vialib._flat_dict import FlatDict
 from h_vialib._params import Params
 
+# Via and client config, as returned by the `extract_*` methods
+Config = tuple[dict[str, Any], dict[str, Any]]
+
 
+# When compiled with mypyc, other code can still sub-class this
+@mypyc_attr(allow_interpreted_subclasses=True)
 class Configuration:
     """Extracts configuration from params.
 
@@ -35,8 +46,28 @@ class Configuration:
     mean a string.
     """
 
+    # How many distinct client configs to keep serialised JSON for. When it's
+    # full the least recently used one makes way for a new one.
+    CLIENT_CONFIG_JSON_CACHE_SIZE: ClassVar[int] = 1024
+    _client_config_json_cache: ClassVar["OrderedDict[str, str]"] = OrderedDict()
+    _client_config_json_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    # Characters which could end a <script> tag or start a comment in one, or
+    # end a line in older JavaScript, when embedded in a page
+    _HTML_UNSAFE_JSON: ClassVar[dict[int, str]] = str.maketrans(
+        {
+            "<": "\\u003c",
+            ">": "\\u003e",
+            "&": "\\u0026",
+            "\u2028": "\\u2028",
+            "\u2029": "\\u2029",
+        }
+    )
+
     @classmethod
-    def extract_from_params(cls, params, add_defaults=True):
+    def extract_from_params(
+        cls, params: Mapping[str, Any], add_defaults: bool = True
+    ) -> Config:
         """Extract Via and H config from query parameters.
 
         :param params: A mapping of query parameters
@@ -48,7 +79,9 @@ class Configuration:
         return Params.split(merged_params, add_defaults)
 
     @classmethod
-    def extract_from_wsgi_environment(cls, http_env, add_defaults=True):
+    def extract_from_wsgi_environment(
+        cls, http_env: Mapping[str, Any], add_defaults: bool = True
+    ) -> Config:
         """Extract Via and H config from a WSGI environment object.
 
         :param http_env: WSGI provided environment variable
@@ -60,19 +93,45 @@ class Configuration:
         return cls.extract_from_params(params, add_defaults)
 
     @classmethod
-    def extract_from_url(cls, url, add_defaults=True):
+    def extract_from_url(cls, url: Optional[str], add_defaults: bool = True) -> Config:
         """Extract Via and H config from a URL.
 
         :param url: A URL to extract config from
         :param add_defaults: Fill out sensible default values
         :return: A tuple of Via, and H config
         """
-        params = dict(parse_qsl(urlparse(url).query))
+        params = dict(parse_qsl(urlparse(url or "").query))
 
         return cls.extract_from_params(params, add_defaults)
 
     @classmethod
-    def strip_from_url(cls, url):
+    def extract_many(
+        cls, urls: Iterable[Optional[str]], add_defaults: bool = True
+    ) -> Iterator[Config]:
+        """Extract Via and H config from many URLs, like all links on a page.
+
+        This is a generator, so the URLs can be processed in one streaming
+        pass. Each distinct query string is only parsed once.
+
+        :param urls: An iterable of URLs to extract config from
+        :param add_defaults: Fill out sensible default values
+        :return: A generator of Via and H config tuples, one per URL
+        """
+        results: dict[str, Config] = {}
+
+        for url in urls:
+            query = urlsplit(url or "").query
+
+            result = results.get(query)
+            if result is None:
+                result = results[query] = cls.extract_from_params(
+                    dict(parse_qsl(query)), add_defaults
+                )
+
+            yield result
+
+    @classmethod
+    def strip_from_url(cls, url: str) -> str:
         """Remove any Via configuration parameters from the URL.
 
         If the URL has no parameters left, remove the query string entirely.
@@ -90,7 +149,36 @@ class Configuration:
         return url_parts._replace(query=urlencode(non_via)).geturl()
 
     @classmethod
-    def add_to_url(cls, url, via_params, client_params):
+    def strip_many(cls, urls: Iterable[str]) -> Iterator[str]:
+        """Remove any Via configuration parameters from many URLs.
+
+        This is a generator, so the URLs can be processed in one streaming
+        pass. Each distinct query string is only stripped once.
+
+        :param urls: An iterable of URLs to strip
+        :return: A generator of string URLs with the via parts removed
+        """
+        stripped_queries: dict[str, str] = {}
+
+        for url in urls:
+            # Quick exit if this cannot contain any of our params
+            if Params.KEY_PREFIX not in url:
+                yield url
+                continue
+
+            url_parts = urlparse(url)
+
+            query = stripped_queries.get(url_parts.query)
+            if query is None:
+                _, non_via = Params.separate(parse_qsl(url_parts.query))
+                query = stripped_queries[url_parts.query] = urlencode(non_via)
+
+            yield url_parts._replace(query=query).geturl()
+
+    @classmethod
+    def add_to_url(
+        cls, url: str, via_params: dict[str, Any], client_params: dict[str, Any]
+    ) -> str:
         """Add configuration parameters to a given URL.
 
         This will merge and preserve any parameters already on the URL.
@@ -108,3 +196,44 @@ class Configuration:
         non_via.extend(flat_params.items())
 
         return url_parts._replace(query=urlencode(non_via)).geturl()
+
+    @classmethod
+    def client_config_json(cls, client_params: Mapping[str, Any]) -> str:
+        """Serialise client config as JSON which is safe to embed in HTML.
+
+        The result can be placed directly inside a `<script>` tag. The few
+        distinct configs seen in practice are only serialised once per
+        process.
+
+        :param client_params: Client config (e.g. from `extract_from_url`)
+        :return: The config as a JSON string
+        """
+        # The repr is much quicker to make than any canonical form of the
+        # config, and it tells apart anything that serialises differently
+        # (like `True` and `1`). The same config with its keys in a different
+        # order gets its own entry, but that's rare and the output is the same.
+        key = repr(client_params)
+
+        cache = cls._client_config_json_cache
+
+        with cls._client_config_json_lock:
+            config_json = cache.get(key)
+            if config_json is not None:
+                cache.move_to_end(key)
+                return config_json
+
+        config_json = json.dumps(
+            client_params,
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        ).translate(cls._HTML_UNSAFE_JSON)
+
+        with cls._client_config_json_lock:
+            cache[key] = config_json
+            cache.move_to_end(key)
+
+            while len(cache) > cls.CLIENT_CONFIG_JSON_CACHE_SIZE:
+                cache.popitem(last=False)
+
+        return config_json
@@ -0,0 +1,139 @@
+"""Content types of proxied documents and guessing them from URLs."""
+
+import re
+from enum import Enum
+
+
+class ContentType(str, Enum):
+    PDF = "pdf"
+    HTML = "html"
+    YOUTUBE = "youtube"
+
+
+class ContentTypeClassifier:
+    """Guess the content type of a document from its URL alone.
+
+    The rules are compiled up front so that classifying a URL is at most one
+    match of a combined regex for the patterns, one match to split out the
+    host and path, a dict lookup per level of the host name and a dict lookup
+    for the file extension.
+
+    This allows us to skip the routing step in Via for documents we can
+    recognise, which saves an HTTP round trip and an upstream request.
+    """
+
+    DEFAULT_PDF_PATTERNS = (
+        # We know about Google Drive links and assume them to be PDF
+        r"https://drive\.google\.com/uc\?id=.*&export=download$",
+    )
+    # Plenty of links ending in ".pdf" serve an HTML login or paywall page,
+    # which Via can only find out by routing them. Deployments which know
+    # better can opt in with `pdf_extensions=("pdf",)`.
+    DEFAULT_PDF_EXTENSIONS = ()
+
+    # Case insensitive matching is slow, so we only allow lower case schemes
+    _URL_REGEX = re.compile(r"https?://(?:[^/?#@]*@)?([^/?#:]*)[^/?#]*([^?#]*)")
+
+    # All the shapes of YouTube video URL we know about, capturing the video id
+    _YOUTUBE_REGEX = re.compile(
+        r"https?://(?:(?:www|m|music)\.)?(?:"
+        # youtube.com/watch?v=ID, /embed/ID, /shorts/ID, /live/ID or /v/ID
+        r"youtube(?:-nocookie)?\.com/(?:watch/?\?(?:[^#]*&)?v=|(?:embed|shorts|live|v)/)"
+        # youtu.be/ID
+        r"|youtu\.be/"
+        r")([\w-]{11})(?![\w-])"
+    )
+    YOUTUBE_CANONICAL_URL = "https://www.youtube.com/watch?v={video_id}"
+
+    def __init__(
+        self,
+        pdf_hosts=(),
+        pdf_patterns=DEFAULT_PDF_PATTERNS,
+        pdf_extensions=DEFAULT_PDF_EXTENSIONS,
+        html_extensions=(),
+        youtube=True,
+    ):
+        """Initialise a classifier with rules for each content type.
+
+        :param pdf_hosts: Hosts which only serve PDFs, optionally with a path
+            prefix (e.g. "arxiv.org/pdf/"). Subdomains also match.
+        :param pdf_patterns: Regexes matching the start of PDF URLs
+        :param pdf_extensions: File extensions of PDF URL paths (none by
+            default)
+        :param html_extensions: File extensions of HTML URL paths
+        :param youtube: Detect YouTube video URLs
+        """
+        self._youtube = youtube
+
+        self._patterns = (
+            re.compile("|".join(pdf_patterns), re.IGNORECASE) if pdf_patterns else None
+        )
+
+        # Mapping of host name -> tuple of path prefixes within it
+        self._hosts = {}
+        for host in pdf_hosts:
+            host, slash, prefix = host.lower().partition("/")
+            self._hosts[host] = self._hosts.get(host, ()) + (slash + prefix,)
+
+        self._extensions = {
+            **{extension.lower(): ContentType.HTML for extension in html_extensions},
+            **{extension.lower(): ContentType.PDF for extension in pdf_extensions},
+        }
+
+    def classify(self, url):
+        """Get the content type of a URL if we can tell what it is.
+
+        :param url: URL of the document
+        :return: A `ContentType` or None if the URL matches no rules
+        """
+        if self._youtube and self._YOUTUBE_REGEX.match(url):
+            return ContentType.YOUTUBE
+
+        if self._patterns and self._patterns.match(url):
+            return ContentType.PDF
+
+        # With no host or extension rules there's no need to split the URL
+        match = (self._hosts or self._extensions) and self._URL_REGEX.match(url)
+        if not match:
+            return None
+
+        host, path = match.groups()
+
+        if self._hosts and self._match_host(host.lower(), path):
+            return ContentType.PDF
+
+        file_name = path[path.rfind("/") + 1 :]
+        dot = file_name.rfind(".")
+        if dot == -1:
+            return None
+
+        return self._extensions.get(file_name[dot + 1 :].lower())
+
+    def canonicalize(self, url):
+        """Get the canonical form of a URL.
+
+        Documents which can be reached by many different URLs (like YouTube
+        videos) are converted to a single form, so the same document always
+        results in the same Via URL. Any other URL is returned unchanged.
+
+        :param url: URL of the document
+        :return: The canonical URL
+        """
+        match = self._YOUTUBE_REGEX.match(url)
+        if not match:
+            return url
+
+        return self.YOUTUBE_CANONICAL_URL.format(video_id=match.group(1))
+
+    def _match_host(self, host, path):
+        # Walk up through the parent domains, so subdomains match too
+        while True:
+            prefixes = self._hosts.get(host)
+            if prefixes and path.startswith(prefixes):
+                return True
+
+            dot = host.find(".")
+            if dot == -1:
+                return False
+
+            host = host[dot + 1 :]
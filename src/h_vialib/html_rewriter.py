@@ -0,0 +1,421 @@
+"""Streaming removal of Via configuration from links in HTML."""
+
+import html
+import re
+from html.entities import html5
+
+from h_vialib._params import Params
+from h_vialib.configuration import Configuration
+
+# Elements whose contents are text rather than HTML, so a "<" in them can't
+# start a tag. These are the raw text and escapable raw text elements from
+# the HTML standard, and the obsolete ones which are parsed the same way.
+_TEXT_ELEMENTS = frozenset(
+    (
+        b"script",
+        b"style",
+        b"textarea",
+        b"title",
+        b"iframe",
+        b"xmp",
+        b"noembed",
+        b"noframes",
+    )
+)
+# The end tags of those, which are all that can end them
+_TEXT_ELEMENT_ENDS = {
+    name: re.compile(rb"</" + name + rb"[\s/>]", re.IGNORECASE)
+    for name in _TEXT_ELEMENTS
+}
+# Enough of a tag name to tell if it's one of those
+_NAME_LIMIT = max(len(name) for name in _TEXT_ELEMENTS) + 1
+
+# The attributes of a tag, following the tokenizer in the HTML standard so we
+# agree with browsers about where values and tags end. This also matches
+# attributes which are cut off by the end of the data.
+_ATTRIBUTES = rb"""(?:[\s/]+
+    | [^\s/>][^\s/>=]*
+        (?:\s*=\s*(?:"[^"]*(?:"|\Z)|'[^']*(?:'|\Z)|[^\s>"'][^\s>]*|(?=>|\Z)))?
+    )*"""
+
+# The next piece of markup in some text. A tag which is cut off by the end of
+# the data is matched without its closing ">".
+_MARKUP = re.compile(
+    rb"""<(?:
+        (?P<comment>!--)
+        | (?P<bogus>[!?]|/(?![A-Za-z]))
+        | (?P<end>/?)(?P<name>[A-Za-z][^\s/>]*)"""
+    + _ATTRIBUTES
+    + rb"""(?:(?P<close>>)|\Z)
+    )""",
+    re.VERBOSE,
+)
+
+# Text and complete tags which don't change what we are reading, which we can
+# skip over in one go when they have no Via params in them. The attributes
+# are in a lookahead, which stops the regex from backtracking into them to try
+# other ways of reading an unfinished tag.
+_PLAIN = re.compile(
+    rb"""(?:
+        [^<]+
+        | <(?=[^A-Za-z!?/])
+        | <(?!(?i:"""
+    + b"|".join(_TEXT_ELEMENTS)
+    + rb""")[\s/>])(?=(?P<tag>/?[A-Za-z][^\s/>]*"""
+    + _ATTRIBUTES
+    + rb"""))(?P=tag)>
+    )*""",
+    re.VERBOSE,
+)
+
+# One attribute in a tag
+_ATTRIBUTE = re.compile(
+    rb"[\s/]*(?P<name>[^\s/>][^\s/>=]*)"
+    rb"(?:\s*=\s*(?:\"(?P<double>[^\"]*)\"|'(?P<single>[^']*)'"
+    rb"|(?P<bare>[^\s>\"'][^\s>]*)))?"
+)
+
+# States of the tokenizer within a tag, used to follow tags which are too long
+# to hold back. The quoted value states are the quote they end with.
+_TAG_NAME, _BETWEEN, _NAME, _AFTER_NAME, _BEFORE_VALUE, _UNQUOTED = range(6)
+_DOUBLE, _SINGLE = b'"', b"'"
+# Where the states which can run over many bytes could next change
+_STATE_ENDS = {
+    _TAG_NAME: re.compile(rb"[\s/>]"),
+    _NAME: re.compile(rb"[\s/=>]"),
+    _UNQUOTED: re.compile(rb"[\s>]"),
+}
+_WHITESPACE = frozenset(b" \t\n\r\f\v")
+
+# A character reference, as matched by `html.unescape`
+_CHARACTER_REFERENCE = re.compile(
+    r"&(#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)"
+)
+# What stops a named reference without a ";" being decoded in an attribute
+_LITERAL_AFTER_REFERENCE = re.compile(r"[=A-Za-z0-9]")
+
+
+class HTMLLinkStripper:
+    """Strip Via configuration from URL attributes in a stream of HTML.
+
+    This applies `Configuration.strip_from_url` to every URL attribute (like
+    `href` or `src`) which might contain Via params, so they are not passed on
+    to other sites. The HTML is never parsed as a whole: chunks are rewritten
+    as they arrive, holding back only the end of a chunk which could be the
+    start of a tag continued in the next one.
+
+    Only the attributes of start tags are rewritten. Text, comments and the
+    contents of elements like `<script>` and `<style>` are passed through
+    unchanged, even if they look like they have attributes in them.
+    """
+
+    DEFAULT_ATTRIBUTES = ("href", "src")
+
+    def __init__(self, attributes=DEFAULT_ATTRIBUTES, max_carry=65536):
+        """Initialise the stripper.
+
+        :param attributes: Names of the attributes which hold URLs
+        :param max_carry: The most bytes to hold back waiting for the rest of
+            a tag. A tag longer than this which is split between chunks is
+            passed through unchanged.
+        """
+        self._attributes = frozenset(
+            name.lower().encode("ascii") for name in attributes
+        )
+        self._max_carry = max_carry
+        self._via = Params.KEY_PREFIX.encode("ascii")
+        self._find_via = re.compile(re.escape(self._via), re.IGNORECASE).search
+
+    def strip(self, chunks):
+        """Strip Via configuration from the links in some HTML.
+
+        :param chunks: An iterable of chunks of HTML as bytes
+        :return: A generator of chunks of the rewritten HTML as bytes
+        """
+        # Where we are in the HTML, as the name of the method which reads on
+        # from there and any arguments for it
+        state = ("_read_text",)
+        carry = b""
+
+        for chunk in chunks:
+            output, carry, state = self._feed(state, carry + chunk, final=False)
+            if output:
+                yield output
+
+        if carry:
+            output, _, _ = self._feed(state, carry, final=True)
+            yield output
+
+    def _feed(self, state, data, final):
+        """Rewrite as much of some data as we can.
+
+        Each of the `_read_*` methods reads from a position in the data,
+        adding what it has read to `parts`. They return the position they got
+        to and the state there, or None for the state if they need more data
+        to go any further. We stop early when they get to the end of the
+        data, as there's nothing more to read.
+
+        :return: A tuple of the rewritten data, the data to hold back for the
+            next chunk, and the state at the start of that
+        """
+        parts = []
+        position = 0
+
+        while True:
+            method, *args = state
+            position, next_state = getattr(self, method)(
+                data, position, parts, final, *args
+            )
+            if next_state is None:
+                return b"".join(parts), data[position:], state
+
+            state = next_state
+            if position == len(data):
+                return b"".join(parts), b"", state
+
+    def _read_text(self, data, position, parts, final):
+        # A "<" near the end could be the start of something we can't tell
+        # yet (e.g. "<!-" could be a comment), so we don't start on it
+        horizon = len(data) if final else len(data) - 3
+        via = self._find_via(data, position)
+
+        while True:
+            if via and via.start() < position:
+                via = self._find_via(data, position)
+
+            # Only the markup around a Via param needs a closer look
+            plain_end = _PLAIN.match(
+                data, position, via.start() if via else len(data)
+            ).end()
+            parts.append(data[position:plain_end])
+            position = plain_end
+
+            match = _MARKUP.search(data, position)
+            if not match or match.start() >= horizon:
+                lt = data.find(b"<", max(position, horizon))
+                split = lt if lt != -1 else len(data)
+                parts.append(data[position:split])
+                return split, None
+
+            parts.append(data[position : match.start()])
+
+            if match.group("comment"):
+                # The comment starts at the "--" so "<!-->" ends it straight away
+                parts.append(b"<!")
+                return match.start() + 2, ("_read_comment",)
+
+            if match.group("bogus"):
+                parts.append(match.group())
+                return match.end(), ("_read_bogus_comment",)
+
+            name = match.group("name")[:_NAME_LIMIT].lower()
+            is_start = not match.group("end")
+
+            if not match.group("close") and not final:
+                if len(data) - match.start() <= self._max_carry:
+                    # Wait for the rest of the tag
+                    return match.start(), None
+
+                # It's too long to hold back, so we pass it on unchanged
+                parts.append(match.group())
+                _, tag_state = _scan_tag(
+                    match.group(), match.end("name") - match.start(), _TAG_NAME
+                )
+                return match.end(), ("_read_long_tag", (name, is_start, tag_state))
+
+            parts.append(self._rewrite_tag(match) if is_start else match.group())
+            position = match.end()
+
+            if is_start and name in _TEXT_ELEMENTS:
+                return position, ("_read_text_element", name)
+
+    def _read_comment(self, data, position, parts, final):
+        end = data.find(b"-->", position)
+        if end != -1:
+            parts.append(data[position : end + 3])
+            return end + 3, ("_read_text",)
+
+        # Hold back anything which could be the start of "-->"
+        split = len(data) if final else max(position, len(data) - 2)
+        parts.append(data[position:split])
+        return split, None
+
+    @staticmethod
+    def _read_bogus_comment(data, position, parts, _final):
+        # Doctypes and the like, which end at the first ">"
+        end = data.find(b">", position)
+        if end != -1:
+            parts.append(data[position : end + 1])
+            return end + 1, ("_read_text",)
+
+        parts.append(data[position:])
+        return len(data), None
+
+    @staticmethod
+    def _read_text_element(data, position, parts, final, name):
+        match = _TEXT_ELEMENT_ENDS[name].search(data, position)
+        if match:
+            parts.append(data[position : match.start()])
+            return match.start(), ("_read_text",)
+
+        # Hold back anything which could be the start of the end tag
+        split = len(data)
+        if not final:
+            lt = data.find(b"<", max(position, len(data) - len(name) - 2))
+            split = lt if lt != -1 else split
+
+        parts.append(data[position:split])
+        return split, None
+
+    @staticmethod
+    def _read_long_tag(data, position, parts, _final, tag):
+        # What we know so far about the tag
+        name, is_start, tag_state = tag
+
+        if tag_state == _TAG_NAME:
+            # The name was cut off too, so this is the rest of it
+            name_end = _STATE_ENDS[_TAG_NAME].search(data, position)
+            name += data[position : name_end.start() if name_end else len(data)]
+            name = name[:_NAME_LIMIT].lower()
+
+        end, tag_state = _scan_tag(data, position, tag_state)
+        if end == -1:
+            parts.append(data[position:])
+            return len(data), ("_read_long_tag", (name, is_start, tag_state))
+
+        parts.append(data[position:end])
+        if is_start and name in _TEXT_ELEMENTS:
+            return end, ("_read_text_element", name)
+
+        return end, ("_read_text",)
+
+    def _rewrite_tag(self, match):
+        tag = match.group()
+
+        # Quick exit if this cannot contain any of our params
+        if self._via not in tag.lower():
+            return tag
+
+        parts = []
+        start = 0
+        position = match.end("name") - match.start()
+
+        while True:
+            attribute = _ATTRIBUTE.match(tag, position)
+            if not attribute:
+                break
+            position = attribute.end()
+
+            value_group = attribute.lastgroup
+            if (
+                value_group == "name"
+                or attribute.group("name").lower() not in self._attributes
+            ):
+                continue
+
+            stripped_value = self._strip_value(attribute.group(value_group))
+            if stripped_value is not None:
+                value_start, value_end = attribute.span(value_group)
+                parts.extend((tag[start:value_start], stripped_value))
+                start = value_end
+
+        parts.append(tag[start:])
+
+        return b"".join(parts)
+
+    def _strip_value(self, value):
+        if self._via not in value.lower():
+            return None
+
+        # Attribute values can have entities in them (usually `&amp;`)
+        url = _unescape_attribute(value.decode("utf-8", "surrogateescape"))
+        try:
+            stripped_url = Configuration.strip_from_url(url)
+        except UnicodeEncodeError:
+            # The page isn't UTF-8, and we can't re-encode the query without
+            # knowing what it is. Better a Via param left in than a crash.
+            return None
+
+        if stripped_url == url:
+            return None
+
+        return html.escape(stripped_url).encode("utf-8", "surrogateescape")
+
+
+def _scan_tag(data, position, state):
+    """Follow the HTML tokenizer through part of a tag.
+
+    :param data: The data to scan
+    :param position: Where to start in the data
+    :param state: The state of the tokenizer at `position`
+    :return: A tuple of the position after the ">" which ends the tag (or -1
+        if it doesn't end in the data) and the state of the tokenizer there
+    """
+    while position < len(data):
+        if state in (_DOUBLE, _SINGLE):
+            quote = data.find(state, position)
+            if quote == -1:
+                return -1, state
+
+            position, state = quote + 1, _BETWEEN
+            continue
+
+        if state in _STATE_ENDS:
+            match = _STATE_ENDS[state].search(data, position)
+            if not match:
+                return -1, state
+            position = match.start()
+
+        char = data[position]
+        position += 1
+        if char == ord(">"):
+            return position, state
+
+        state = _next_tag_state(state, char)
+
+    return -1, state
+
+
+def _next_tag_state(state, char):
+    if state == _BEFORE_VALUE:
+        if char in _WHITESPACE:
+            return _BEFORE_VALUE
+        return bytes((char,)) if char in b"\"'" else _UNQUOTED
+
+    if char in _WHITESPACE:
+        return _AFTER_NAME if state in (_NAME, _AFTER_NAME) else _BETWEEN
+
+    if char == ord("/"):
+        return _BETWEEN
+
+    if char == ord("=") and state in (_NAME, _AFTER_NAME):
+        return _BEFORE_VALUE
+
+    return _NAME
+
+
+def _unescape_attribute(value):
+    """Decode the character references in an attribute value.
+
+    This is `html.unescape`, except for the rule that a named reference
+    without a ";" in an attribute is left alone if it's followed by "=" or
+    a letter or digit. Without it "?a=1&region=eu" would become
+    "?a=1®ion=eu".
+    """
+    return _CHARACTER_REFERENCE.sub(_replace_reference, value)
+
+
+def _replace_reference(match):
+    reference = match.group(1)
+    if reference.startswith("#") or reference in html5:
+        return html.unescape(match.group())
+
+    # The longest name it starts with, like `html.unescape` does
+    for length in range(len(reference) - 1, 1, -1):
+        if reference[:length] in html5:
+            if _LITERAL_AFTER_REFERENCE.match(reference, length):
+                return match.group()
+
+            return html5[reference[:length]] + reference[length:]
+
+    return match.group()
@@ -0,0 +1,54 @@
+"""WSGI middleware for checking signed Via URLs."""
+
+from webob import Request
+from webob.exc import HTTPUnauthorized
+
+from h_vialib.configuration import Configuration
+from h_vialib.exceptions import TokenException
+
+
+class ViaSecureURLMiddleware:
+    """Verify `via.sec` and extract configuration once per request.
+
+    Several layers of a Via app need to know if a request is signed and what
+    configuration it carries. This does both up front and stores the results
+    in the WSGI environment for anything downstream to read:
+
+     * `CLAIMS_KEY`: The claims from the verified token (None for exempt
+       paths)
+     * `CONFIG_KEY`: A tuple of Via and H config as returned by
+       `Configuration.extract_from_wsgi_environment`
+
+    Requests without a valid token are rejected with a 401 before any
+    downstream work is done.
+    """
+
+    CLAIMS_KEY = "h_vialib.claims"
+    CONFIG_KEY = "h_vialib.config"
+
+    def __init__(self, app, secure_url, exempt_paths=()):
+        """Wrap a WSGI app.
+
+        :param app: The WSGI app to wrap
+        :param secure_url: `ViaSecureURL` instance to verify requests with
+        :param exempt_paths: Paths which do not require a token
+        """
+        self._app = app
+        self._secure_url = secure_url
+        self._exempt_paths = frozenset(exempt_paths)
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") in self._exempt_paths:
+            claims = None
+        else:
+            try:
+                claims = self._secure_url.verify(Request(environ).url)
+            except TokenException as err:
+                return HTTPUnauthorized(detail=str(err) or None)(
+                    environ, start_response
+                )
+
+        environ[self.CLAIMS_KEY] = claims
+        environ[self.CONFIG_KEY] = Configuration.extract_from_wsgi_environment(environ)
+
+        return self._app(environ, start_response)
@@ -1,6 +1,11 @@
 """Security helpers."""
 
-from h_vialib.secure.encryption import Encryption
+from h_vialib.secure.clock import SYSTEM_CLOCK, Clock, FrozenClock, SystemClock
+from h_vialib.secure.encryption import CachedEncryption, Encryption, EncryptionResult
 from h_vialib.secure.expiry import quantized_expiry
+from h_vialib.secure.prewarm import PrewarmedViaSecureURL
+from h_vialib.secure.revocation import RevocationList
+from h_vialib.secure.store import SignedURLStore
 from h_vialib.secure.token import SecureToken
 from h_vialib.secure.url import SecureURL, ViaSecureURL
+from h_vialib.secure.verification_cache import VerificationCache
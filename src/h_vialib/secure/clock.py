@@ -0,0 +1,105 @@
+"""Sources of the current time for creating and checking tokens."""
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Union
+
+# An arbitrary time in the past to quantize our expiry times to
+YEAR_ZERO = datetime(year=2020, month=1, day=1, tzinfo=timezone.utc)
+_YEAR_ZERO_TIMESTAMP = int(YEAR_ZERO.timestamp())
+
+
+class Clock:
+    """The current time in whole epoch seconds.
+
+    Everything which needs the time when creating or checking tokens can be
+    given a clock, so it can be frozen or moved on in tests and benchmarks.
+    Sub-classes only need to provide `now`.
+    """
+
+    def __init__(self) -> None:
+        # Mapping of (max_age, divisions) -> (start, end, expires) of the
+        # window we are in
+        self._windows: dict[tuple[int, int], tuple[int, int, int]] = {}
+
+    def now(self) -> int:
+        """Get the current time in epoch seconds."""
+        raise NotImplementedError()
+
+    def window_expiry(self, max_age: int, divisions: int = 2) -> int:
+        """Get the quantized expiry time for the current window.
+
+        See `quantized_expiry` for what this means. The expiry only changes
+        when the window does, so it is cached until the window is over.
+
+        :param max_age: The maximum age to issue in seconds
+        :param divisions: How many subdivisions of the max age to quantize to
+        :return: The expiry time in epoch seconds
+        """
+        now = self.now()
+
+        window = self._windows.get((max_age, divisions))
+        # The clock can go backwards, so we check both ends
+        if window and window[0] <= now < window[1]:
+            return window[2]
+
+        quantization = max_age // divisions
+        start = now - (now - _YEAR_ZERO_TIMESTAMP) % quantization
+        expires = start + max_age
+
+        # A single assignment, so other threads see all of it or none of it
+        self._windows[(max_age, divisions)] = (start, start + quantization, expires)
+
+        return expires
+
+
+class SystemClock(Clock):
+    """The real time."""
+
+    def now(self) -> int:
+        """Get the current time in epoch seconds."""
+        return int(time.time())
+
+
+class FrozenClock(Clock):
+    """A time which only changes when told to."""
+
+    def __init__(self, now: Union[int, datetime]):
+        """Initialise the clock.
+
+        :param now: The time to start at as epoch seconds or a `datetime`
+        """
+        super().__init__()
+        self._now = _to_timestamp(now)
+
+    def now(self) -> int:
+        """Get the current time in epoch seconds."""
+        return self._now
+
+    def set(self, now: Union[int, datetime]) -> None:
+        """Set the time.
+
+        :param now: The time as epoch seconds or a `datetime`
+        """
+        self._now = _to_timestamp(now)
+
+    def advance(self, seconds: Union[int, timedelta]) -> None:
+        """Move the time on.
+
+        :param seconds: How many seconds to move on by (int or timedelta)
+        """
+        if isinstance(seconds, timedelta):
+            seconds = int(seconds.total_seconds())
+
+        self._now += seconds
+
+
+# The clock everything uses unless it's given another
+SYSTEM_CLOCK = SystemClock()
+
+
+def _to_timestamp(value: Union[int, datetime]) -> int:
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+
+    return int(value)
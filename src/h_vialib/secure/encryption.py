@@ -1,22 +1,64 @@
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from hashlib import blake2b
+from typing import Any, NamedTuple, Optional
 
 from joserfc import jwe
 from joserfc.jwk import OctKey
 
+from h_vialib.secure.clock import Clock
+from h_vialib.secure.expiry import quantized_expiry
+
+
+class EncryptionResult(NamedTuple):
+    """The outcome for one item of a batch encryption or decryption.
+
+    Exactly one of `value` (the encrypted string or decrypted dict) or
+    `error` (the exception raised for this item) will be set.
+    """
+
+    value: Any = None
+    error: Optional[Exception] = None
+
 
 class Encryption:
     JWE_ALGORITHM = "dir"
     JWE_ENCRYPTION = "A128CBC-HS256"
 
-    def __init__(self, secret: bytes):
+    JWE_COMPRESSION = "DEF"
+
+    def __init__(self, secret: bytes, compress_threshold: Optional[int] = None):
+        """Initialise the encryption.
+
+        Compressed JWEs are decrypted transparently whatever the threshold.
+        Compression leaks the size of the compressed content, so this should
+        not be used where an attacker can mix their own data in with secrets.
+
+        :param secret: Secret to encrypt with
+        :param compress_threshold: DEFLATE compress payloads which are at
+            least this many bytes as JSON (optional, default: never compress)
+        """
         self._key = OctKey.import_key(secret.ljust(32)[:32])
+        self._compress_threshold = compress_threshold
+
+        # joserfc doesn't modify the header, so we can build it once
+        self._protected = {"alg": self.JWE_ALGORITHM, "enc": self.JWE_ENCRYPTION}
+        self._compressed_protected = {**self._protected, "zip": self.JWE_COMPRESSION}
 
     def encrypt_dict(self, payload: dict) -> str:
         """Encrypt a dictionary as a JWE."""
-        protected = {"alg": self.JWE_ALGORITHM, "enc": self.JWE_ENCRYPTION}
-        return jwe.encrypt_compact(
-            protected, json.dumps(payload).encode("utf-8"), self._key
-        )
+        plaintext = json.dumps(payload).encode("utf-8")
+
+        protected = self._protected
+        if (
+            self._compress_threshold is not None
+            and len(plaintext) >= self._compress_threshold
+        ):
+            protected = self._compressed_protected
+
+        return jwe.encrypt_compact(protected, plaintext, self._key)
 
     def decrypt_dict(self, encrypted_json: str) -> dict:
         """Return `encrypted_json` decrypted and deserialized to a dict."""
@@ -28,3 +70,120 @@ class Encryption:
         assert data
 
         return json.loads(data)
+
+    def encrypt_many(
+        self, payloads: list, max_workers: Optional[int] = None
+    ) -> list[EncryptionResult]:
+        """Encrypt a batch of dictionaries as JWEs.
+
+        A failure to encrypt one item is reported in its result and does not
+        stop the rest of the batch.
+
+        :param payloads: A list of dicts to encrypt
+        :param max_workers: Spread the work over a pool of this many threads
+            (optional, default: no thread pool)
+        :return: A list of `EncryptionResult` in the same order as `payloads`
+        """
+        return self._map(self.encrypt_dict, payloads, max_workers)
+
+    def decrypt_many(
+        self, encrypted_jsons: list, max_workers: Optional[int] = None
+    ) -> list[EncryptionResult]:
+        """Decrypt a batch of JWEs from `encrypt_dict` or `encrypt_many`.
+
+        A failure to decrypt one item is reported in its result and does not
+        stop the rest of the batch.
+
+        :param encrypted_jsons: A list of JWE strings to decrypt
+        :param max_workers: Spread the work over a pool of this many threads
+            (optional, default: no thread pool)
+        :return: A list of `EncryptionResult` in the same order as
+            `encrypted_jsons`
+        """
+        return self._map(self.decrypt_dict, encrypted_jsons, max_workers)
+
+    @staticmethod
+    def _map(function, items, max_workers):
+        def apply(item):
+            try:
+                return EncryptionResult(value=function(item))
+            # We want any failure to be reported against the item, rather
+            # than losing the rest of the batch
+            except Exception as err:  # pylint:disable=broad-exception-caught
+                return EncryptionResult(error=err)
+
+        if not max_workers:
+            return [apply(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(apply, items))
+
+
+class CachedEncryption(Encryption):
+    """Encryption which reuses the JWE for identical payloads.
+
+    Every JWE gets a fresh random IV, so encrypting the same payload twice
+    gives different results. That makes any URL containing one different
+    every time, so HTTP caches never get a hit.
+
+    This keeps the JWE for each payload (keyed on a digest of its canonical
+    JSON) until the current `quantized_expiry` window rolls over, so the same
+    payload gives the same JWE in that window and a new one in the next.
+    """
+
+    # How many JWEs to keep in any one expiry window
+    MAX_ITEMS_PER_WINDOW = 10000
+
+    def __init__(
+        self,
+        secret: bytes,
+        max_age,
+        compress_threshold: Optional[int] = None,
+        clock: Optional[Clock] = None,
+    ):
+        """Initialise the encryption.
+
+        :param secret: Secret to encrypt with
+        :param max_age: The max age to calculate the `quantized_expiry`
+            windows with (int, or timedelta)
+        :param compress_threshold: DEFLATE compress payloads which are at
+            least this many bytes as JSON (optional, default: never compress)
+        :param clock: `Clock` to work out the windows with (default: the
+            system clock)
+        """
+        super().__init__(secret, compress_threshold=compress_threshold)
+        self._max_age = max_age
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._window: Optional[datetime] = None
+        self._cache: dict = {}
+
+    def encrypt_dict(self, payload: dict) -> str:
+        """Encrypt a dictionary as a JWE, reusing any we have for it."""
+        window = quantized_expiry(self._max_age, clock=self._clock)
+
+        # Keying the digest stops anyone with access to memory from checking
+        # guesses of the payloads against it
+        digest = blake2b(
+            json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8"),
+            key=self._key.raw_value,
+        ).digest()
+
+        with self._lock:
+            if window != self._window:
+                self._window = window
+                self._cache = {}
+
+            encrypted = self._cache.get(digest)
+
+        if encrypted is None:
+            encrypted = super().encrypt_dict(payload)
+
+            with self._lock:
+                if window == self._window and (
+                    len(self._cache) < self.MAX_ITEMS_PER_WINDOW
+                ):
+                    self._cache[digest] = encrypted
+
+        return encrypted
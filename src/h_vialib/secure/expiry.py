@@ -1,12 +1,19 @@
 """Functions for calculating expiry."""
 
 from datetime import datetime, timedelta, timezone
+from typing import Optional, Union
 
-# An arbitrary time in the past to quantize our expiry times to
-YEAR_ZERO = datetime(year=2020, month=1, day=1, tzinfo=timezone.utc)
+# This has always been importable from here
+from h_vialib.secure.clock import YEAR_ZERO  # pylint:disable=unused-import
+from h_vialib.secure.clock import SYSTEM_CLOCK, Clock
 
+# A max age in seconds, or as a timedelta
+MaxAge = Union[int, timedelta]
 
-def quantized_expiry(max_age, divisions=2):
+
+def quantized_expiry(
+    max_age: MaxAge, divisions: int = 2, clock: Optional[Clock] = None
+) -> datetime:
     """Create a quantized expiry time.
 
     This allows you to repeatedly issue the same expiry time over a period of
@@ -29,45 +36,80 @@ def quantized_expiry(max_age, divisions=2):
 
     :param max_age: The maximum age to issue (int, or timedelta)
     :param divisions: How many subdivisions of the max age for quantization
+    :param clock: `Clock` to get the time from (default: the system clock)
     :return: A datetime object
     """
-    max_age = _to_int(max_age)
-    quantization = max_age // divisions
+    clock = clock or SYSTEM_CLOCK
 
     # Timezone aware dates are annoying, but allow you to include the TZ in a
     # serialisation, which is required for cookie expiry times
-    delta = datetime.now(tz=timezone.utc) - YEAR_ZERO
-
-    quantized_expire = (delta.total_seconds() // quantization) * quantization
-
-    return YEAR_ZERO + timedelta(seconds=quantized_expire + max_age)
+    return datetime.fromtimestamp(
+        clock.window_expiry(_to_int(max_age), divisions), tz=timezone.utc
+    )
 
 
-def as_expires(expires=None, max_age=None):
+def as_expires(
+    expires: Optional[datetime] = None,
+    max_age: Optional[MaxAge] = None,
+    clock: Optional[Clock] = None,
+) -> datetime:
     """Convert either an expiry time or max age to an expiry time.
 
     :param expires: Datetime by which this token will expire
     :param max_age: ... or max age in seconds after which this will expire
         (or timedelta)
+    :param clock: `Clock` to get the time from (default: the system clock)
     :return: An expiry datetime object
 
     :raise ValueError: if neither expires nor max_age is specified
     """
-
     if expires:
-        if not isinstance(expires, datetime):
-            raise ValueError(
-                f"Expected expires to be a datetime, not: '{type(expires)}'"
-            )
+        _check_expires(expires)
         return expires
 
+    return datetime.fromtimestamp(
+        as_expires_timestamp(None, max_age, clock), tz=timezone.utc
+    )
+
+
+def as_expires_timestamp(
+    expires: Union[datetime, int, None] = None,
+    max_age: Optional[MaxAge] = None,
+    clock: Optional[Clock] = None,
+) -> int:
+    """Convert either an expiry time or max age to epoch seconds.
+
+    This is the same as `as_expires`, without making any datetime objects
+    unless it's given one.
+
+    :param expires: Datetime (or epoch seconds) by which this token will
+        expire
+    :param max_age: ... or max age in seconds after which this will expire
+        (or timedelta)
+    :param clock: `Clock` to get the time from (default: the system clock)
+    :return: An expiry time in epoch seconds
+
+    :raise ValueError: if neither expires nor max_age is specified
+    """
+    if expires:
+        if isinstance(expires, int):
+            return expires
+
+        _check_expires(expires)
+        return int(expires.timestamp())
+
     if not max_age:
         raise ValueError("You must specify an expiry time")
 
-    return datetime.now(tz=timezone.utc) + _to_delta(max_age)
+    return (clock or SYSTEM_CLOCK).now() + _to_int(max_age)
+
 
+def _check_expires(expires: object) -> None:
+    if not isinstance(expires, datetime):
+        raise ValueError(f"Expected expires to be a datetime, not: '{type(expires)}'")
 
-def _to_int(max_age):
+
+def _to_int(max_age: Optional[MaxAge]) -> int:
     if max_age is None:
         raise ValueError("max_age cannot be None")
 
@@ -80,15 +122,3 @@ def _to_int(max_age):
     raise ValueError(
         f"Expected max_age to be a timedelta or int, not: '{type(max_age)}'"
     )
-
-
-def _to_delta(max_age):
-    if isinstance(max_age, timedelta):
-        return max_age
-
-    if isinstance(max_age, int):
-        return timedelta(seconds=max_age)
-
-    raise ValueError(
-        f"Expected max_age to be a timedelta or int, not: '{type(max_age)}'"
-    )
@@ -0,0 +1,151 @@
+"""Signing of Via URLs ahead of the quantized expiry window rolling over."""
+
+import threading
+from datetime import timedelta
+
+from h_vialib.secure.expiry import _to_int
+from h_vialib.secure.url import SecureURL, ViaSecureURL
+
+
+class PrewarmedViaSecureURL(ViaSecureURL):
+    """A ViaSecureURL which caches signed URLs and can sign them in advance.
+
+    As `quantized_expiry` snaps every token to the same boundary, all signed
+    URLs change at the same instant. This keeps the signed URLs for each expiry
+    window, and can sign a set of hot URLs for the next window shortly before
+    the boundary passes, so the first requests after it are still cache hits.
+    """
+
+    # How many URLs to keep signed in any one expiry window
+    MAX_URLS_PER_WINDOW = 10000
+
+    def __init__(self, secret, **kwargs):
+        """Initialise the signer.
+
+        :param secret: The secret to sign and check URLs with
+        :param kwargs: Any other arguments for `ViaSecureURL`
+        """
+        super().__init__(secret, **kwargs)
+
+        # Mapping of expiry time in epoch seconds -> {url: signed_url}
+        self._windows = {}
+        self._lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def create(self, url, max_age=None):
+        """Create a secure token for a Via proxied URL, reusing any we have.
+
+        :param url: The whole URL of the request to Via with all params
+        :param max_age: The time after which the secure token will expire
+            (optional, default: one hour)
+        :type max_age: datetime.timedelta
+        :return: The URL with a token added
+        """
+        if max_age is None:
+            max_age = self.MAX_AGE
+
+        return self._create_for_window(url, self._clock.window_expiry(_to_int(max_age)))
+
+    def prewarm(self, urls, max_age=None):
+        """Sign URLs for the expiry window after the current one.
+
+        :param urls: An iterable of URLs which will be passed to `create`
+        :param max_age: The max age which will be passed to `create`
+        :return: The expiry time of the window signed for in epoch seconds
+        """
+        max_age = _to_int(self.MAX_AGE if max_age is None else max_age)
+        expires = self._clock.window_expiry(max_age) + self._window_length(max_age)
+        for url in urls:
+            self._create_for_window(url, expires)
+
+        return expires
+
+    def start(self, urls, max_age=None, lead_time=timedelta(seconds=30)):
+        """Start pre-warming URLs in a background thread.
+
+        Every window the URLs will be signed `lead_time` before the boundary
+        passes, until `stop` is called.
+
+        :param urls: An iterable of URLs which will be passed to `create`
+        :param max_age: The max age which will be passed to `create`
+        :param lead_time: How long before the boundary to sign the URLs
+        :raise RuntimeError: If pre-warming has already been started
+        """
+        if self._thread is not None:
+            raise RuntimeError("Pre-warming has already been started")
+
+        if max_age is None:
+            max_age = self.MAX_AGE
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._prewarm_loop,
+            args=(list(urls), max_age, lead_time),
+            name="h_vialib-prewarm",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop any background pre-warming and wait for it to finish."""
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _prewarm_loop(self, urls, max_age, lead_time):
+        max_age = _to_int(max_age)
+        lead_time = lead_time.total_seconds()
+
+        while True:
+            # The next window starts when the current one stops being issued
+            roll_over = (
+                self._clock.window_expiry(max_age)
+                - max_age
+                + self._window_length(max_age)
+            )
+
+            wait = roll_over - lead_time - self._clock.now()
+            if wait > 0 and self._stop.wait(wait):
+                return
+
+            self.prewarm(urls, max_age)
+
+            # Don't go around again until we are into the next window
+            wait = roll_over - self._clock.now()
+            if self._stop.wait(max(wait, 0) + 1):
+                return
+
+    def _create_for_window(self, url, expires):
+        with self._lock:
+            signed_url = self._windows.get(expires, {}).get(url)
+
+        if signed_url:
+            return signed_url
+
+        signed_url = SecureURL.create(self, url, payload={}, expires=expires)
+
+        with self._lock:
+            if expires not in self._windows:
+                self._evict_expired()
+                self._windows[expires] = {}
+
+            window = self._windows[expires]
+            if len(window) < self.MAX_URLS_PER_WINDOW:
+                window[url] = signed_url
+
+        return signed_url
+
+    def _evict_expired(self):
+        now = self._clock.now()
+        for expires in [expires for expires in self._windows if expires < now]:
+            del self._windows[expires]
+
+    @staticmethod
+    def _window_length(max_age):
+        # This matches the default number of divisions in `window_expiry`
+        return max_age // 2
@@ -0,0 +1,77 @@
+"""Revocation of individual tokens before they expire."""
+
+import os
+
+
+class RevocationList:
+    """A list of revoked tokens loaded from a file.
+
+    The tokens are held in a set, so checking one is a single hash lookup.
+
+    The file has one token per line. Blank lines and lines starting with "#"
+    are ignored. The list can be reloaded while it is in use, and each check
+    sees either the whole of the old list or the whole of the new one.
+    """
+
+    def __init__(self, path=None):
+        """Initialise the list.
+
+        :param path: Path of the file to load tokens from (optional, the
+            list starts empty without one)
+        """
+        self._path = path
+        self._mtime = None
+
+        # Only ever replaced as a whole, so checks never see part of a list
+        self._revoked = frozenset()
+        if path:
+            self.reload()
+
+    def is_revoked(self, token):
+        """Check if a token is revoked.
+
+        :param token: The token to check
+        :return: True if the token has been revoked
+        """
+        return token in self._revoked
+
+    def replace(self, tokens):
+        """Replace the revoked tokens.
+
+        :param tokens: An iterable of the tokens which are revoked
+        """
+        self._revoked = frozenset(tokens)
+
+    def reload(self):
+        """Reload the tokens from the file.
+
+        :raise ValueError: If the list wasn't created with a file
+        :raise OSError: If the file can't be read
+        """
+        if not self._path:
+            raise ValueError("This revocation list has no file to load from")
+
+        mtime = os.stat(self._path).st_mtime_ns
+        with open(self._path, encoding="utf-8") as revoked_file:
+            self.replace(
+                line
+                for line in (line.strip() for line in revoked_file)
+                if line and not line.startswith("#")
+            )
+
+        self._mtime = mtime
+
+    def reload_if_changed(self):
+        """Reload the tokens from the file if it has been modified.
+
+        This is cheap enough to call often, for example once a second.
+
+        :return: True if the file was reloaded
+        :raise ValueError: If the list wasn't created with a file
+        :raise OSError: If the file can't be read
+        """
+        if self._path and os.stat(self._path).st_mtime_ns == self._mtime:
+            return False
+
+        self.reload()
+        return True
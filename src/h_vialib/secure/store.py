@@ -0,0 +1,112 @@
+"""Storage of signed Via URLs shared between processes."""
+
+import os
+import sqlite3
+import threading
+
+
+class SignedURLStore:
+    """A SQLite backed store of signed URLs shared between processes.
+
+    Every worker process signing the same URLs in the same expiry window will
+    produce identical links, so they can share the work by pointing at the
+    same file. As the file outlives the processes the store is also warm
+    straight after a deploy.
+
+    Signed URLs are keyed on the URL, a digest of the options and secret it
+    was signed with and the expiry window it was signed for. Whenever a URL is stored for
+    a new window, the older windows are deleted as they are no longer issued.
+
+    SQLite connections can't be shared between threads or across a fork, so
+    each thread in each process opens its own connection.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS signed_url (
+            url TEXT NOT NULL,
+            options_digest BLOB NOT NULL,
+            expires INTEGER NOT NULL,
+            signed_url TEXT NOT NULL,
+            PRIMARY KEY (url, options_digest, expires)
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, path, timeout=0.1):
+        """Initialise the store.
+
+        :param path: Path to the SQLite database file (created if missing)
+        :param timeout: How long to wait for a lock on the database in
+            seconds, before treating a read as a miss or skipping a write
+        """
+        self._path = path
+        self._timeout = timeout
+
+        self._local = threading.local()
+        # The latest expiry window stored in by this process
+        self._latest_expires = None
+
+        with self._connection() as connection:
+            connection.execute(self._SCHEMA)
+
+    def get(self, url, options_digest, expires):
+        """Get a signed URL.
+
+        :param url: The URL that was signed
+        :param options_digest: Digest of the options and secret it was signed
+            with
+        :param expires: The expiry window as an epoch timestamp
+        :return: The signed URL or None if there isn't one
+        """
+        try:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT signed_url FROM signed_url"
+                    " WHERE url = ? AND options_digest = ? AND expires = ?",
+                    (url, options_digest, expires),
+                )
+                .fetchone()
+            )
+        except sqlite3.OperationalError:
+            # The database is locked, so carry on without it
+            return None
+
+        return row[0] if row else None
+
+    def put(self, url, options_digest, expires, signed_url):
+        """Store a signed URL.
+
+        :param url: The URL that was signed
+        :param options_digest: Digest of the options and secret it was signed
+            with
+        :param expires: The expiry window as an epoch timestamp
+        :param signed_url: The signed URL
+        """
+        try:
+            with self._connection() as connection:
+                connection.execute(
+                    "INSERT OR IGNORE INTO signed_url VALUES (?, ?, ?, ?)",
+                    (url, options_digest, expires, signed_url),
+                )
+
+                if expires != self._latest_expires:
+                    self._latest_expires = expires
+                    connection.execute(
+                        "DELETE FROM signed_url WHERE expires < ?", (expires,)
+                    )
+        except sqlite3.OperationalError:
+            # The database is locked, so the next caller can store it instead
+            pass
+
+    def _connection(self):
+        pid = os.getpid()
+        if getattr(self._local, "pid", None) != pid:
+            connection = sqlite3.connect(self._path, timeout=self._timeout)
+            # WAL lets readers carry on while another process is writing
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+
+            self._local.connection = connection
+            self._local.pid = pid
+
+        return self._local.connection
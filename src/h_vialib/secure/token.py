@@ -1,54 +1,192 @@
 """JWT based tokens which can be used to create verifiable, expiring tokens."""
 
+import json
+import re
+import threading
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import Any, ClassVar, NoReturn, Optional, Union
+
 from joserfc import jwt
 from joserfc.errors import JoseError
 from joserfc.jwk import OctKey
+from mypy_extensions import mypyc_attr
 
 from h_vialib.exceptions import InvalidToken, MissingToken
-from h_vialib.secure.expiry import as_expires
+from h_vialib.secure.clock import SYSTEM_CLOCK, Clock
+from h_vialib.secure.expiry import MaxAge, as_expires_timestamp
+from h_vialib.secure.revocation import RevocationList
+
+
+def _header_segments(algorithm: str) -> frozenset[str]:
+    """Get the header segments of the tokens we create.
+
+    There are two, as the JWT library we used to use (python-jose) put the
+    header fields in a different order.
+    """
+    # The header doesn't depend on the key or payload
+    token = jwt.encode({"alg": algorithm}, {}, OctKey.import_key(bytes(32)))
+    legacy_header = json.dumps(
+        {"alg": algorithm, "typ": "JWT"}, separators=(",", ":")
+    ).encode("utf-8")
 
+    return frozenset(
+        (
+            token.split(".")[0],
+            urlsafe_b64encode(legacy_header).decode("ascii").rstrip("="),
+        )
+    )
 
+
+# When compiled with mypyc, other code can still sub-class this
+@mypyc_attr(allow_interpreted_subclasses=True)
 class SecureToken:
     """A standardized and simplified JWT token."""
 
-    TOKEN_ALGORITHM = "HS256"
+    TOKEN_ALGORITHM: ClassVar[str] = "HS256"
+
+    _HEADERS: ClassVar[frozenset[str]] = _header_segments(TOKEN_ALGORITHM)
+    # A HS256 signature is 32 bytes which is 43 base64 chars. The payload is
+    # at least one more, and there are two dots.
+    _MIN_LENGTH: ClassVar[int] = len(min(_HEADERS, key=len)) + 1 + 2 + 43
+    _MAX_LENGTH: ClassVar[int] = 8192
+
+    # An integer expiry claim in a JSON payload. A JSON string can't contain
+    # an unescaped quote, so anything this matches is a key.
+    _EXPIRES: ClassVar[re.Pattern] = re.compile(rb'"exp"\s*:\s*(-?\d{1,20})\s*[,}]')
 
-    def __init__(self, secret):
+    # The checks made before verifying the signature, in the order they are
+    # made. Each is cheaper than the one after, and all are much cheaper than
+    # the signature.
+    PRECHECKS: ClassVar[tuple[str, ...]] = (
+        "length",
+        "segments",
+        "header",
+        "payload",
+        "expired",
+    )
+
+    def __init__(
+        self,
+        secret: Union[str, bytes],
+        revocation_list: Optional[RevocationList] = None,
+        clock: Optional[Clock] = None,
+    ):
         """Initialise a token creator.
 
         :param secret: The secret to sign and check tokens with
+        :param revocation_list: `RevocationList` of tokens to reject even
+            though they haven't expired
+        :param clock: `Clock` to create and check expiry times with (default:
+            the system clock)
         """
         self._key = OctKey.import_key(secret)
+        self._revocation_list = revocation_list
+        self._clock = clock or SYSTEM_CLOCK
+
+        self._rejections = dict.fromkeys(self.PRECHECKS, 0)
+        self._rejections_lock = threading.Lock()
 
-    def create(self, payload=None, expires=None, max_age=None) -> str:
+    def create(
+        self,
+        payload: Optional[dict[str, Any]] = None,
+        expires: Union[datetime, int, None] = None,
+        max_age: Optional[MaxAge] = None,
+    ) -> str:
         """Create a secure token.
 
         :param payload: Dict of information to put in the token
-        :param expires: Datetime by which this token with expire
+        :param expires: Datetime (or epoch seconds) by which this token with
+            expire
         :param max_age: ... or max age in seconds after which this will expire
         :return: A JWT encoded token as a string
 
         :raise ValueError: if neither expires nor max_age is specified
         """
-        payload["exp"] = int(as_expires(expires, max_age).timestamp())
+        if payload is None:
+            payload = {}
+
+        payload["exp"] = as_expires_timestamp(expires, max_age, self._clock)
         return jwt.encode({"alg": self.TOKEN_ALGORITHM}, payload, self._key)
 
-    def verify(self, token: str) -> dict:
+    def verify(self, token: Optional[str]) -> dict[str, Any]:
         """Decode a token and check for validity.
 
         :param token: Token string to check
         :return: The token payload if valid
 
-        :raise InvalidToken: If the token is invalid or expired
+        :raise InvalidToken: If the token is invalid, expired or revoked
         :raise MissingToken: If no token is provided
         """
         if not token:
             raise MissingToken("Missing secure token")
 
+        self._check_not_revoked(token)
+
+        return self._decode(token)
+
+    def rejections(self) -> dict[str, int]:
+        """Get how many tokens each of the pre-checks has rejected.
+
+        :return: A dict of the name of each check in `PRECHECKS` to the
+            number of tokens it has rejected
+        """
+        with self._rejections_lock:
+            return dict(self._rejections)
+
+    def _check_not_revoked(self, token: str) -> None:
+        if self._revocation_list is not None and self._revocation_list.is_revoked(
+            token
+        ):
+            raise InvalidToken("Secure token has been revoked")
+
+    def _decode(self, token: str) -> dict[str, Any]:
+        self._precheck(token)
+
         try:
             claims = jwt.decode(token, self._key).claims
-            jwt.JWTClaimsRegistry().validate(claims)
+            jwt.JWTClaimsRegistry(now=self._clock.now).validate(claims)
         except JoseError as err:
             raise InvalidToken() from err
 
         return claims
+
+    def _precheck(self, token: str) -> None:
+        # Reject anything we can without checking the signature, as much of
+        # what we are sent is garbage or has already expired
+        if not self._MIN_LENGTH <= len(token) <= self._MAX_LENGTH:
+            self._reject("length", "Secure token has an invalid length")
+
+        segments = token.split(".")
+        if len(segments) != 3:
+            self._reject("segments", "Secure token is not a JWT")
+
+        if segments[0] not in self._HEADERS:
+            self._reject("header", "Secure token has an unexpected header")
+
+        # We don't parse the JSON here. It's slower, and the payload could be
+        # nested deep enough to exhaust the stack before we know who sent it.
+        try:
+            payload = urlsafe_b64decode(
+                segments[1] + "=" * (-len(segments[1]) % 4)
+            ).strip()
+        except ValueError:
+            payload = b""
+        if not (payload.startswith(b"{") and payload.endswith(b"}")):
+            self._reject("payload", "Secure token has a malformed payload")
+
+        # Every token we create has an expiry at the top level, so if there's
+        # only one it's that. Anything else is left for the full check.
+        expires = self._EXPIRES.search(payload)
+        if (
+            expires
+            and int(expires.group(1)) < self._clock.now()
+            and payload.count(b'"exp"') == 1
+        ):
+            self._reject("expired", "Secure token has expired")
+
+    def _reject(self, precheck: str, message: str) -> NoReturn:
+        with self._rejections_lock:
+            self._rejections[precheck] += 1
+
+        raise InvalidToken(message)
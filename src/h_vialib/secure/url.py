@@ -1,35 +1,116 @@
 """Routines for signing and checking URLs."""
 
-from base64 import b64encode
-from datetime import timedelta
-from hashlib import blake2b
+import hmac
+import re
+import struct
+import threading
+from base64 import b64encode, urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+from hashlib import blake2b, sha256
 from hmac import compare_digest
+from typing import Any, ClassVar, Optional, Union
 from urllib.parse import parse_qs, parse_qsl, urlencode, urlparse
 
-from h_vialib.exceptions import InvalidToken
-from h_vialib.secure.expiry import quantized_expiry
+from mypy_extensions import mypyc_attr
+
+from h_vialib.exceptions import InvalidToken, MissingToken
+from h_vialib.secure.clock import Clock
+from h_vialib.secure.expiry import MaxAge, _to_int, as_expires_timestamp
+from h_vialib.secure.revocation import RevocationList
 from h_vialib.secure.token import SecureToken
+from h_vialib.secure.verification_cache import VerificationCache
 
 
+# When compiled with mypyc, other code can still sub-class these
+@mypyc_attr(allow_interpreted_subclasses=True)
 class SecureURL(SecureToken):
-    """Sign and check URLs with a JWT."""
+    """Sign and check URLs with a JWT.
+
+    There are two ways of hashing the URL, and tokens record which they used
+    so both can always be checked:
+
+     * Version 1 parses the query, removes the token and re-encodes the
+       rest, so the token can be anywhere in the URL
+     * Version 2 always appends the token as the last parameter, and hashes
+       the URL exactly as it is up to the token's value. This is a slice and
+       a single hash to check, but any change to the URL (even re-encoding
+       it) will stop it from matching.
+
+    Instances are safe to share between threads.
+    """
 
     # We want to keep our tokens as skinny as possible, so we'll use a short
     # name for the hash parameter we store inside the JWT
-    _HASH_PARAM = "h"
-
-    def __init__(self, secret, token_param):
+    _HASH_PARAM: ClassVar[str] = "h"
+    # The URL hash version. This is left out of the JWT for version 1.
+    _VERSION_PARAM: ClassVar[str] = "v"
+    URL_HASH_VERSIONS: ClassVar[tuple[int, ...]] = (1, 2)
+
+    # Compact tokens are a binary alternative to the JWT for tokens which
+    # carry no payload beyond the expiry. They are a version byte and the
+    # expiry packed together, followed by a truncated MAC of both plus the URL
+    # hash. This comes to 21 bytes, which is exactly 28 base64 chars with no
+    # padding. As base64 has no "." in it, they can't be confused with a JWT.
+    # The version byte is the URL hash version.
+    _COMPACT_HEADER: ClassVar[struct.Struct] = struct.Struct(">BI")
+    _COMPACT_MAC_SIZE: ClassVar[int] = 16
+    # `urlsafe_b64decode` skips anything outside the alphabet, so we check
+    # the token is exactly that. Otherwise many different strings would be
+    # the same token, and only one of them would be on a revocation list.
+    _COMPACT_TOKEN: ClassVar[re.Pattern] = re.compile(r"[A-Za-z0-9_-]{28}")
+
+    # pylint:disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        secret: Union[str, bytes],
+        token_param: str,
+        compact: bool = False,
+        verification_cache: Optional[VerificationCache] = None,
+        revocation_list: Optional[RevocationList] = None,
+        clock: Optional[Clock] = None,
+        url_hash_version: int = 1,
+    ):
         """Initialise the SecureURL.
 
         :param secret: Secret to sign and check with
         :param token_param: The URL parameter to use for the token
+        :param compact: Create compact binary tokens instead of JWTs. Both
+            kinds are accepted when verifying regardless of this setting.
+        :param verification_cache: `VerificationCache` to share verified URLs
+            with other processes
+        :param revocation_list: `RevocationList` of tokens to reject even
+            though they haven't expired
+        :param clock: `Clock` to create and check expiry times with (default:
+            the system clock)
+        :param url_hash_version: The URL hash version to create tokens with.
+            Tokens with either version are accepted when verifying.
+        :raise ValueError: If the URL hash version isn't one we know
         """
-        super().__init__(secret)
-        self._token_param = token_param
+        if url_hash_version not in self.URL_HASH_VERSIONS:
+            raise ValueError(f"Unknown URL hash version: {url_hash_version}")
 
-    def create(
-        self, url, payload, expires=None, max_age=None
-    ):  # pylint: disable=arguments-renamed
+        super().__init__(secret, revocation_list=revocation_list, clock=clock)
+        self._token_param = token_param
+        self._compact = compact
+        self._url_hash_version = url_hash_version
+
+        self._verification_cache = verification_cache
+        # Cache entries are keyed with the secret, so processes with different
+        # secrets can't see each other's entries, or predict them
+        self._cache_key = blake2b(
+            self._key.raw_value, person=b"h_vialib.cache"
+        ).digest()
+
+        # Keyed HMAC contexts for compact tokens, one per thread
+        self._mac_contexts = threading.local()
+
+    def create(  # type: ignore[override] # pylint: disable=arguments-renamed
+        self,
+        url: Optional[str],
+        payload: dict[str, Any],
+        expires: Union[datetime, int, None] = None,
+        max_age: Optional[MaxAge] = None,
+    ) -> str:
         """Create a signed URL which can be checked with this class.
 
         The entire URL should be added that you want to sign, without any
@@ -38,48 +119,187 @@ class SecureURL(SecureToken):
 
         :param url: The URL to sign
         :param payload: Dict of extra information to put in the token
-        :param expires: Datetime by which this token with expire
+        :param expires: Datetime (or epoch seconds) by which this token with
+            expire
         :param max_age: ... or max age in seconds after which this will expire
         :return: A URL with an extra parameter
 
-        :raise ValueError: if neither expires nor max_age is specified, or no
-            URL is provided
+        :raise ValueError: if neither expires nor max_age is specified, no
+            URL is provided, or the payload has any of the keys we use
         """
         if not url:
             raise ValueError("A URL is required to create a token")
 
-        payload[self._HASH_PARAM] = self._hash_url_v1(url)
+        if self._HASH_PARAM in payload or self._VERSION_PARAM in payload:
+            raise ValueError(
+                f"The payload cannot contain '{self._HASH_PARAM}' or"
+                f" '{self._VERSION_PARAM}'"
+            )
+
+        if self._compact and payload:
+            raise ValueError("Compact tokens cannot carry a payload")
 
-        token = super().create(payload, expires, max_age)
+        if self._url_hash_version == 2:
+            prefix, fragment = self._prefix_v2(url)
+            token = self._create_token(
+                self._digest_url_v2(prefix), payload, expires, max_age
+            )
+            return prefix + token + fragment
 
+        token = self._create_token(self._digest_url_v1(url), payload, expires, max_age)
         return self._add_token(url, token)
 
-    def verify(self, url):  # pylint: disable=arguments-renamed
+    def _create_token(
+        self,
+        digest: bytes,
+        payload: dict[str, Any],
+        expires: Union[datetime, int, None],
+        max_age: Optional[MaxAge],
+    ) -> str:
+        if self._compact:
+            return self._create_compact(
+                as_expires_timestamp(expires, max_age, self._clock), digest
+            )
+
+        # A copy, so the same payload can be used for more than one URL
+        payload = {**payload, self._HASH_PARAM: b64encode(digest).decode("utf-8")}
+        if self._url_hash_version != 1:
+            payload[self._VERSION_PARAM] = self._url_hash_version
+
+        return super().create(payload, expires, max_age)
+
+    def verify(  # pylint: disable=arguments-renamed
+        self, url: Optional[str]
+    ) -> dict[str, Any]:
         """Check a URL to see if it's been signed by this service.
 
         :param url: URL to check
         :return: A dict of details from the token if verified
 
-        :raises InvalidToken: If the token is invalid or the URL does not match
+        :raises InvalidToken: If the token is invalid, revoked or the URL does
+            not match
+        :raises MissingToken: If there's no URL or it has no token
         """
-        token = self._get_token(url)
-        decoded = super().verify(token)
+        if not url:
+            raise MissingToken("Missing secure token")
+
+        token = None
+        if self._revocation_list is not None:
+            # Before the cache, so revoking a token takes effect immediately
+            token = self._get_token(url)
+            if token:
+                self._check_not_revoked(token)
+
+        if self._verification_cache is None:
+            return self._verify(url, token)
+
+        # The token is in the URL, so a digest of the whole URL covers both
+        digest = blake2b(
+            url.encode("utf-8"),
+            key=self._cache_key,
+            digest_size=self._verification_cache.DIGEST_SIZE,
+        ).digest()
+
+        expires = self._verification_cache.get(digest, now=self._clock.now())
+        if expires is not None:
+            return {"exp": expires}
+
+        decoded = self._verify(url, token)
+
+        # The cache only has room for the expiry, so we can't cache the rest
+        if decoded.keys() == {"exp"}:
+            self._verification_cache.put(digest, decoded["exp"])
+
+        return decoded
+
+    def _verify(self, url: str, token: Optional[str] = None) -> dict[str, Any]:
+        if token is None:
+            token = self._get_token(url)
+
+        if token and "." not in token:
+            return self._verify_compact(url, token)
+
+        if not token:
+            raise MissingToken("Missing secure token")
+
+        # Any revocation has already been checked in `verify`
+        decoded = self._decode(token)
 
         decoded_hash = decoded.get(self._HASH_PARAM)
         if not decoded_hash:
             raise InvalidToken("Secure URL token contains no URL hash")
 
-        comparison_hash = self._hash_url_v1(url)
+        comparison_hash = b64encode(
+            self._digest_url(url, decoded.get(self._VERSION_PARAM, 1))
+        ).decode("utf-8")
         if not compare_digest(decoded_hash, comparison_hash):
             raise InvalidToken("Secure URL hash mismatch")
 
-        # This is of no interest to anyone bar us, and removing it prevents any
-        # external code from ending up relying on any specifics of the hash
-        decoded.pop("h")
+        # These are of no interest to anyone bar us, and removing them prevents
+        # any external code from ending up relying on any specifics of the hash
+        decoded.pop(self._HASH_PARAM)
+        # We leave version 1 out, so a "v" of 1 is from the payload of a
+        # token made before we checked for it
+        if decoded.get(self._VERSION_PARAM, 1) != 1:
+            decoded.pop(self._VERSION_PARAM)
 
         return decoded
 
-    def _hash_url_v1(self, url):
+    def _create_compact(self, expires: int, digest: bytes) -> str:
+        header = self._COMPACT_HEADER.pack(self._url_hash_version, expires)
+        mac = self._compact_mac(header, digest)
+
+        return urlsafe_b64encode(header + mac).decode("ascii")
+
+    def _verify_compact(self, url: str, token: str) -> dict[str, Any]:
+        if not self._COMPACT_TOKEN.fullmatch(token):
+            raise InvalidToken("Malformed compact token")
+
+        # 28 base64 chars always decode to exactly the header and MAC
+        data = urlsafe_b64decode(token)
+        version, expires = self._COMPACT_HEADER.unpack_from(data)
+
+        header_size = self._COMPACT_HEADER.size
+        if version not in self.URL_HASH_VERSIONS:
+            raise InvalidToken("Unsupported compact token")
+
+        mac = self._compact_mac(data[:header_size], self._digest_url(url, version))
+        if not compare_digest(data[header_size:], mac):
+            raise InvalidToken("Secure URL hash mismatch")
+
+        if expires < self._clock.now():
+            raise InvalidToken("Secure URL token has expired")
+
+        return {"exp": expires}
+
+    def _compact_mac(self, header: bytes, digest: bytes) -> bytes:
+        # Keying an HMAC costs two extra hash blocks, so each thread keys one
+        # once and copies it. HMAC objects are not safe to share across
+        # threads, so we don't share one between them.
+        context = getattr(self._mac_contexts, "context", None)
+        if context is None:
+            context = hmac.new(self._key.raw_value, digestmod=sha256)
+            self._mac_contexts.context = context
+
+        mac = context.copy()
+        mac.update(header + digest)
+
+        return mac.digest()[: self._COMPACT_MAC_SIZE]
+
+    def _digest_url(self, url: str, version: Any) -> bytes:
+        if version == 2:
+            prefix, suffix = self._split_v2(url)
+            if suffix is None:
+                raise InvalidToken("Secure URL token is not the last parameter")
+
+            return self._digest_url_v2(prefix)
+
+        if version == 1:
+            return self._digest_url_v1(url)
+
+        raise InvalidToken("Unsupported URL hash version")
+
+    def _digest_url_v1(self, url: str) -> bytes:
         url = self._strip_token(url)
 
         # We don't use this hash for authentication, just verification, so 60
@@ -91,15 +311,66 @@ class SecureURL(SecureToken):
         digest = blake2b(digest_size=15)
         digest.update(url.encode("utf-8"))
 
-        # We use base64 as it saves us a ton of space
-        return b64encode(digest.digest()).decode("utf-8")
+        return digest.digest()
+
+    @staticmethod
+    def _digest_url_v2(prefix: str) -> bytes:
+        # The same size as v1 for the same reasons, but over the URL exactly
+        # as it is up to and including `<token_param>=`
+        return blake2b(prefix.encode("utf-8"), digest_size=15).digest()
+
+    def _prefix_v2(self, url: str) -> tuple[str, str]:
+        """Get the prefix to append a v2 token to, and any fragment."""
+        if self._token_param + "=" in url:
+            url = self._strip_token(url)
+
+        url, hash_sign, fragment = url.partition("#")
+        if "?" not in url:
+            url += "?"
+        elif not url.endswith(("?", "&")):
+            url += "&"
+
+        return url + self._token_param + "=", hash_sign + fragment
+
+    def _split_v2(self, url: str) -> tuple[str, Optional[str]]:
+        """Split a URL around the value of its last token.
+
+        :return: A tuple of the URL up to the value of the token, and the
+            fragment after it (or None if there's anything else after it)
+        """
+        start = -1
+        for separator in "?&":
+            start = max(start, url.rfind(separator + self._token_param + "="))
+        if start < 0:
+            return url, None
+
+        start += len(self._token_param) + 2
+        end = len(url)
+        for terminator in "&#":
+            position = url.find(terminator, start)
+            if position >= 0:
+                end = min(end, position)
+
+        suffix = url[end:]
+        if suffix and not suffix.startswith("#"):
+            return url[:start], None
+
+        return url[:start], suffix
+
+    def _get_token(self, url: str) -> Optional[str]:
+        # A v2 token is the last thing in the URL, so we can slice it out. We
+        # only trust this if it has nothing which `parse_qsl` would decode.
+        prefix, suffix = self._split_v2(url)
+        if suffix is not None:
+            token = url[len(prefix) : len(url) - len(suffix)]
+            if "%" not in token and "+" not in token:
+                return token
 
-    def _get_token(self, url):
         params = dict(parse_qsl(urlparse(url).query))
 
         return params.get(self._token_param)
 
-    def _strip_token(self, url):
+    def _strip_token(self, url: str) -> str:
         parsed_url = urlparse(url)
         query = [
             item for item in parse_qsl(parsed_url.query) if item[0] != self._token_param
@@ -107,7 +378,7 @@ class SecureURL(SecureToken):
 
         return parsed_url._replace(query=urlencode(query)).geturl()
 
-    def _add_token(self, url, token):
+    def _add_token(self, url: str, token: str) -> str:
         parsed_url = urlparse(url)
         query = parse_qs(parsed_url.query)
         query[self._token_param] = [token]
@@ -115,24 +386,48 @@ class SecureURL(SecureToken):
         return parsed_url._replace(query=urlencode(query, doseq=True)).geturl()
 
 
+@mypyc_attr(allow_interpreted_subclasses=True)
 class ViaSecureURL(SecureURL):
     """A token for signing proxied URLs."""
 
-    MAX_AGE = timedelta(hours=1)
-
-    def __init__(self, secret):
-        super().__init__(secret, token_param="via.sec")
-
-    def create(self, url, max_age=None):  # pylint: disable=arguments-differ
+    MAX_AGE: ClassVar[timedelta] = timedelta(hours=1)
+
+    # pylint:disable=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self,
+        secret: Union[str, bytes],
+        compact: bool = False,
+        verification_cache: Optional[VerificationCache] = None,
+        revocation_list: Optional[RevocationList] = None,
+        clock: Optional[Clock] = None,
+        url_hash_version: int = 1,
+    ):
+        super().__init__(
+            secret,
+            token_param="via.sec",
+            compact=compact,
+            verification_cache=verification_cache,
+            revocation_list=revocation_list,
+            clock=clock,
+            url_hash_version=url_hash_version,
+        )
+
+    def create(  # type: ignore[override] # pylint: disable=arguments-differ
+        self, url: Optional[str], max_age: Optional[MaxAge] = None
+    ) -> str:
         """Create a secure token for a Via proxied URL.
 
         :param url: The whole URL of the request to Via with all params
         :param max_age: The time after which the secure token will expire
             (optional, default: one hour)
         :type max_age: datetime.timedelta
-        :return: A JWT encoded token as a string
+        :return: The URL with a JWT (or compact) token added
         """
         if max_age is None:
             max_age = self.MAX_AGE
 
-        return super().create(url, payload={}, expires=quantized_expiry(max_age))
+        # The expiry is the same for everything signed in the same window, so
+        # the clock keeps it rather than working it out every time
+        return super().create(
+            url, payload={}, expires=self._clock.window_expiry(_to_int(max_age))
+        )
@@ -0,0 +1,95 @@
+"""A cache of verified tokens shared between processes."""
+
+import mmap
+import os
+import struct
+import time
+from hashlib import blake2b
+
+
+class VerificationCache:
+    """A fixed size hash table of verified token digests in shared memory.
+
+    Each worker process which opens the same file maps the same memory, so a
+    token verified by any one of them can skip verification in the others.
+
+    The table only stores a digest of the token and its expiry time. Each slot
+    is the digest, the expiry and a checksum of both. Reads take no locks, and
+    neither do writes. A reader which catches a slot half written sees a
+    checksum which doesn't match, and treats it as a miss.
+
+    Each digest has exactly one slot, so a new entry replaces whatever was
+    there before. Expired entries are never returned, and they are replaced
+    as new tokens come in.
+
+    Processes sharing a file should use the same number of slots, or they will
+    look in different places and miss each other's entries.
+    """
+
+    DIGEST_SIZE = 16
+    _SLOT = struct.Struct(f">{DIGEST_SIZE}sQ8s")
+
+    def __init__(self, path, slots=65536):
+        """Open (or create) a cache.
+
+        :param path: Path of the file to map. Use a file on a RAM backed file
+            system (like `/dev/shm`) to avoid any disk IO.
+        :param slots: How many tokens the cache can hold
+        """
+        self._slots = slots
+        size = slots * self._SLOT.size
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Only ever grow the file, in case another process uses more slots
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+
+            self._memory = mmap.mmap(fd, size)
+        finally:
+            # The mapping stays valid once the file is closed
+            os.close(fd)
+
+    def get(self, digest, now=None):
+        """Get the expiry of a verified token.
+
+        :param digest: Digest of the token (`DIGEST_SIZE` bytes)
+        :param now: The current time as an epoch timestamp to check the
+            expiry against (default: the system time)
+        :return: The expiry as an epoch timestamp, or None if the token is
+            not in the cache or has expired
+        """
+        offset = self._offset(digest)
+        slot = self._memory[offset : offset + self._SLOT.size]
+
+        stored_digest, expires, check = self._SLOT.unpack(slot)
+        if (
+            stored_digest != digest
+            or check != self._check(digest, expires)
+            or expires < (time.time() if now is None else now)
+        ):
+            return None
+
+        return expires
+
+    def put(self, digest, expires):
+        """Record a verified token.
+
+        :param digest: Digest of the token (`DIGEST_SIZE` bytes)
+        :param expires: The expiry of the token as an epoch timestamp
+        """
+        offset = self._offset(digest)
+        self._memory[offset : offset + self._SLOT.size] = self._SLOT.pack(
+            digest, expires, self._check(digest, expires)
+        )
+
+    def close(self):
+        """Unmap the cache from this process."""
+        self._memory.close()
+
+    def _offset(self, digest):
+        return (int.from_bytes(digest[:8], "big") % self._slots) * self._SLOT.size
+
+    @staticmethod
+    def _check(digest, expires):
+        return blake2b(digest + expires.to_bytes(8, "big"), digest_size=8).digest()
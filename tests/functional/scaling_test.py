@@ -0,0 +1,151 @@
+"""Check that the time taken grows linearly with the size of the input.
+
+Each operation is timed at a range of input sizes, and a straight line is
+fitted to log(time) against log(size). The slope of that line is how the time
+grows: 1 for linear, 2 for quadratic and so on. Timings are noisy, so we only
+fail when the slope is clearly more than linear.
+"""
+
+import math
+import timeit
+from urllib.parse import urlencode
+
+import pytest
+
+from h_vialib import Configuration
+from h_vialib._flat_dict import FlatDict
+from h_vialib._params import Params
+from h_vialib.secure import SecureURL
+
+SIZES = (250, 500, 1000, 2000, 4000)
+MAX_SLOPE = 1.5
+# Roughly how long to spend timing each size in seconds, and in how many runs
+BUDGET = 0.1
+REPEATS = 5
+
+
+def growth(function, make_input, sizes=SIZES):
+    """Get the slope of log(time) against log(size) for a function.
+
+    :param function: A single argument function to time
+    :param make_input: A function which makes an input of a given size
+    :param sizes: The input sizes to time
+    :return: The fitted slope
+    """
+    points = []
+    for size in sizes:
+        value = make_input(size)
+        timer = timeit.Timer(lambda value=value: function(value))
+        number = max(1, int(BUDGET / REPEATS / timer.timeit(number=1)))
+        # The quickest run is the one with the least interference
+        best = min(timer.repeat(repeat=REPEATS, number=number)) / number
+
+        points.append((math.log(size), math.log(best)))
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / sum(
+        (x - mean_x) ** 2 for x, _ in points
+    )
+
+
+def test_growth_detects_quadratic_functions():
+    def quadratic(items):
+        return [item for item in items if item in items]
+
+    assert (
+        growth(quadratic, lambda size: list(range(size)), sizes=(100, 200, 400, 800))
+        > MAX_SLOPE
+    )
+
+
+def test_growth_measures_linear_functions():
+    assert growth(sum, range) < MAX_SLOPE
+
+
+SECURE_URL = SecureURL("not_a_very_secret_secret", "via.sec")
+COMPACT_SECURE_URL = SecureURL("not_a_very_secret_secret", "via.sec", compact=True)
+V2_SECURE_URL = SecureURL(
+    "not_a_very_secret_secret", "via.sec", compact=True, url_hash_version=2
+)
+
+
+def wide_params(size):
+    return {f"via.client.key{i}": str(i) for i in range(size)}
+
+
+def deep_key(size):
+    return ".".join(["via", "client"] + [f"k{i}" for i in range(size)])
+
+
+def many_params_url(size):
+    return "http://example.com/path?" + urlencode(
+        [(f"via.option{i}", "1") if i % 2 else (f"param{i}", "1") for i in range(size)]
+    )
+
+
+def long_url(size):
+    return f"http://example.com/{'a' * size * 10}?url=http://example.com&via.a=1"
+
+
+def deep_key_url(size):
+    return f"http://example.com/?{deep_key(size)}=1"
+
+
+def signed(secure_url, make_url):
+    return lambda size: secure_url.create(make_url(size), {}, max_age=3600)
+
+
+@pytest.mark.parametrize(
+    "function,make_input",
+    (
+        pytest.param(
+            FlatDict.flatten,
+            lambda size: FlatDict.unflatten(wide_params(size)),
+            id="flatten-keys",
+        ),
+        pytest.param(
+            FlatDict.flatten,
+            lambda size: FlatDict.unflatten({deep_key(size): "1"}),
+            id="flatten-depth",
+        ),
+        pytest.param(FlatDict.unflatten, wide_params, id="unflatten-keys"),
+        pytest.param(
+            FlatDict.unflatten, lambda size: {deep_key(size): "1"}, id="unflatten-depth"
+        ),
+        pytest.param(
+            Params.separate,
+            lambda size: list(wide_params(size).items()) + [("a", "1")] * size,
+            id="separate",
+        ),
+        pytest.param(
+            Configuration.extract_from_url, many_params_url, id="extract-params"
+        ),
+        pytest.param(Configuration.extract_from_url, deep_key_url, id="extract-depth"),
+        pytest.param(Configuration.extract_from_url, long_url, id="extract-length"),
+        pytest.param(Configuration.strip_from_url, many_params_url, id="strip-params"),
+        pytest.param(Configuration.strip_from_url, long_url, id="strip-length"),
+        pytest.param(
+            SECURE_URL.verify, signed(SECURE_URL, many_params_url), id="verify-params"
+        ),
+        pytest.param(
+            SECURE_URL.verify, signed(SECURE_URL, long_url), id="verify-length"
+        ),
+        pytest.param(
+            COMPACT_SECURE_URL.verify,
+            signed(COMPACT_SECURE_URL, many_params_url),
+            id="verify-compact-params",
+        ),
+        pytest.param(
+            V2_SECURE_URL.verify,
+            signed(V2_SECURE_URL, many_params_url),
+            id="verify-v2-params",
+        ),
+        pytest.param(
+            V2_SECURE_URL.verify, signed(V2_SECURE_URL, long_url), id="verify-v2-length"
+        ),
+    ),
+)
+def test_it_scales_linearly(function, make_input):
+    assert growth(function, make_input) < MAX_SLOPE
@@ -2,12 +2,21 @@ from h_vialib._flat_dict import FlatDict
 
 
 class TestFlatDict:
-    NESTED = {"a": {"b": {"c": 1}}, "d": [2, 3], "e": 4}
+    NESTED = {"a": {"b": {"c": 1}, "f": {}, "g": 5}, "d": [2, 3], "e": 4}
 
-    FLAT = {"a.b.c": 1, "d": [2, 3], "e": 4}
+    FLAT = {"a.b.c": 1, "a.g": 5, "d": [2, 3], "e": 4}
 
     def test_flatten(self):
-        assert FlatDict.flatten(self.NESTED) == self.FLAT
+        assert list(FlatDict.flatten(self.NESTED).items()) == list(self.FLAT.items())
+
+    def test_flatten_deeply_nested_dicts(self):
+        key = ".".join(f"k{i}" for i in range(5000))
+
+        assert FlatDict.flatten(FlatDict.unflatten({key: 1})) == {key: 1}
 
     def test_unflatten(self):
-        assert FlatDict.unflatten(self.FLAT) == self.NESTED
+        assert FlatDict.unflatten(self.FLAT) == {
+            "a": {"b": {"c": 1}, "g": 5},
+            "d": [2, 3],
+            "e": 4,
+        }
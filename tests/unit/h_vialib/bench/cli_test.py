@@ -0,0 +1,315 @@
+import io
+import json
+import sys
+from collections import Counter
+from importlib.machinery import EXTENSION_SUFFIXES
+from types import SimpleNamespace
+
+import pytest
+from h_matchers import Any
+
+from h_vialib.bench.cli import (
+    Entry,
+    Operations,
+    Result,
+    compiled_modules,
+    format_load_result,
+    format_results,
+    gil_enabled,
+    load_corpus,
+    main,
+    summarise,
+    time_calls,
+    time_threaded_calls,
+)
+from h_vialib.bench.server import LoadResult
+
+
+class TestLoadCorpus:
+    def test_it(self):
+        entries = load_corpus(
+            [
+                "# A comment\n",
+                "http://example.com/a\n",
+                "\n",
+                'http://example.com/b\t{"content_type": "pdf"}\n',
+                "http://example.com/c\t \n",
+            ]
+        )
+
+        assert entries == [
+            Entry("http://example.com/a", {}),
+            Entry("http://example.com/b", {"content_type": "pdf"}),
+            Entry("http://example.com/c", {}),
+        ]
+
+    def test_it_raises_for_bad_arguments(self):
+        with pytest.raises(ValueError):
+            load_corpus(["http://example.com\t[1, 2]"])
+
+
+class TestOperations:
+    @pytest.mark.parametrize("name", Operations.NAMES)
+    def test_every_operation_runs(self, name):
+        operations = Operations(
+            "not_a_very_secret_secret",
+            "http://via.example.com",
+            "http://viahtml.example.com",
+        )
+        entries = [
+            Entry("http://example.com/?via.client.focus=1", {}),
+            Entry("http://example.com/b.pdf", {"headers": {"Cookie": "a=b"}}),
+            Entry("http://example.com/c", {"content_type": "html"}),
+        ]
+
+        function, inputs = operations.prepare(name, entries)
+
+        assert len(inputs) == len(entries)
+        for item in inputs:
+            function(item)
+
+
+class TestTimeCalls:
+    def test_it(self):
+        calls = []
+
+        timings = time_calls(calls.append, [1, 2], iterations=3)
+
+        assert calls == [1, 2, 1, 2, 1, 2]
+        assert timings == [Any.int()] * 6
+
+
+class TestTimeThreadedCalls:
+    def test_it(self):
+        calls = []
+
+        timings, elapsed_ns = time_threaded_calls(
+            calls.append, [1, 2], iterations=3, threads=4
+        )
+
+        assert sorted(calls) == [1, 1, 1, 2, 2, 2]
+        assert timings == [Any.int()] * 6
+        assert elapsed_ns == Any.int()
+
+
+class TestGILEnabled:
+    @pytest.mark.parametrize("enabled", (False, True))
+    def test_it(self, monkeypatch, enabled):
+        monkeypatch.setattr(sys, "_is_gil_enabled", lambda: enabled, raising=False)
+
+        assert gil_enabled() == enabled
+
+    def test_it_without_free_threading_support(self, monkeypatch):
+        monkeypatch.delattr(sys, "_is_gil_enabled", raising=False)
+
+        assert gil_enabled()
+
+
+class TestSummarise:
+    def test_it(self):
+        result = summarise("op", list(range(100, 0, -1)), percentiles=(50, 99, 100))
+
+        assert result == Result(
+            operation="op",
+            calls=100,
+            total_ns=5050,
+            percentiles={50: 51, 99: 100, 100: 100},
+        )
+        assert result.throughput == pytest.approx(100 * 1e9 / 5050)
+
+    def test_it_with_elapsed_time(self):
+        result = summarise("op", [100, 100], elapsed_ns=100)
+
+        assert result.elapsed_ns == 100
+        assert result.throughput == pytest.approx(2 * 1e9 / 100)
+
+    def test_it_with_no_timings(self):
+        result = summarise("op", [], percentiles=(50,))
+
+        assert result.percentiles == {50: 0}
+        assert not result.throughput
+
+
+class TestFormatResults:
+    def test_it(self):
+        table = format_results(
+            [Result("url_for", 2, 4000, {50: 1500, 100: 2500})]
+        ).splitlines()
+
+        assert table[0].split() == [
+            "operation",
+            "calls",
+            "ops/s",
+            "p50",
+            "us",
+            "max",
+            "us",
+        ]
+        assert table[1].split() == ["url_for", "2", "500,000", "1.5", "2.5"]
+
+    def test_it_with_no_results(self):
+        assert format_results([]).split() == ["operation", "calls", "ops/s"]
+
+
+class TestFormatLoadResult:
+    def test_it(self):
+        result = LoadResult(
+            requests=3,
+            elapsed_ns=2_000_000,
+            statuses=Counter({401: 1, 200: 2}),
+            verify_timings=[1000, 2000, 3000],
+        )
+
+        assert format_load_result(result, skipped=2).splitlines() == [
+            "requests      3 in 0.00s (1,500 requests/s)",
+            "statuses      200: 2, 401: 1",
+            "verify        p50 2.0us, p90 3.0us, p99 3.0us, max 3.0us",
+            "verify share  0% of elapsed time",
+            "skipped       2 links to Via HTML",
+        ]
+
+    def test_it_without_skipped_links(self):
+        result = LoadResult(1, 1, Counter({200: 1}), [1])
+
+        assert "skipped" not in format_load_result(result)
+
+
+class TestCompiledModules:
+    def test_it(self, monkeypatch):
+        compiled = SimpleNamespace(
+            __file__="/src/h_vialib/fast" + EXTENSION_SUFFIXES[0]
+        )
+        modules = {
+            "h_vialib.fast": compiled,
+            "other.fast": compiled,
+            "h_vialib.no_file": SimpleNamespace(),
+        }
+        # Patch the modules the CLI sees, as in a compiled build some of our
+        # real modules are compiled too
+        monkeypatch.setattr("h_vialib.bench.cli.sys", SimpleNamespace(modules=modules))
+
+        assert compiled_modules() == ["h_vialib.fast"]
+
+
+class TestMain:
+    def test_it(self, corpus):
+        stdout = io.StringIO()
+
+        exit_code = main([corpus, "-n", "2", "-o", "url_for", "-o", "verify"], stdout)
+
+        assert not exit_code
+        lines = stdout.getvalue().splitlines()
+        assert [line.split()[:2] for line in lines[1:-1]] == [
+            ["url_for", "4"],
+            ["verify", "4"],
+        ]
+        assert lines[-1] == f"compiled: {', '.join(compiled_modules()) or 'none'}"
+
+    def test_it_with_threads(self, corpus):
+        stdout = io.StringIO()
+
+        exit_code = main([corpus, "-n", "2", "-o", "verify", "--threads", "3"], stdout)
+
+        assert not exit_code
+        lines = stdout.getvalue().splitlines()
+        assert lines[1].split()[:2] == ["verify", "4"]
+        assert lines[-1] == Any.string.matching(r"threads: 3 \(GIL (en|dis)abled\)")
+
+    def test_it_cant_cprofile_threads(self, corpus):
+        with pytest.raises(SystemExit):
+            main([corpus, "--threads", "2", "--profile", "cprofile"])
+
+    def test_it_with_a_signed_url_store(self, corpus, tmp_path):
+        stdout = io.StringIO()
+        store = tmp_path / "store.db"
+
+        main(
+            [corpus, "-n", "1", "-o", "url_for", "--signed-url-store", str(store)],
+            stdout,
+        )
+
+        assert "url_for" in stdout.getvalue()
+        assert store.exists()
+
+    def test_it_runs_everything_by_default(self, corpus):
+        stdout = io.StringIO()
+
+        main([corpus, "-n", "1"], stdout)
+
+        assert len(stdout.getvalue().splitlines()) == len(Operations.NAMES) + 2
+
+    def test_it_reads_stdin(self, monkeypatch):
+        monkeypatch.setattr("sys.stdin", io.StringIO("http://example.com\n"))
+        stdout = io.StringIO()
+
+        main(["-", "-n", "1", "-o", "strip_from_url"], stdout)
+
+        assert "strip_from_url" in stdout.getvalue()
+
+    def test_it_defaults_to_stdout(self, corpus, capsys):
+        main([corpus, "-n", "1", "-o", "strip_from_url"])
+
+        assert "strip_from_url" in capsys.readouterr().out
+
+    def test_it_with_cprofile(self, corpus):
+        stdout = io.StringIO()
+
+        main([corpus, "-n", "1", "-o", "url_for", "--profile", "cprofile"], stdout)
+
+        assert "function calls" in stdout.getvalue()
+
+    def test_it_with_tracemalloc(self, corpus):
+        stdout = io.StringIO()
+
+        main(
+            [
+                corpus,
+                "-n",
+                "1",
+                "-o",
+                "url_for",
+                "--profile",
+                "tracemalloc",
+                "--top",
+                "3",
+            ],
+            stdout,
+        )
+
+        assert "Top 3 allocation sites:" in stdout.getvalue()
+
+    @pytest.mark.parametrize("http", (False, True))
+    def test_load(self, corpus, http):
+        stdout = io.StringIO()
+
+        exit_code = main(
+            [corpus, "-n", "2", "--load", "--threads", "2"]
+            + (["--http"] if http else []),
+            stdout,
+        )
+
+        assert not exit_code
+        report = stdout.getvalue()
+        assert "requests      4 in" in report
+        assert "statuses      200: 4" in report
+
+    def test_load_with_only_html_links(self, tmp_path):
+        corpus = tmp_path / "corpus.txt"
+        corpus.write_text('http://example.com\t{"content_type": "html"}\n')
+        stdout = io.StringIO()
+
+        exit_code = main([str(corpus), "--load"], stdout)
+
+        assert exit_code == 1
+        assert stdout.getvalue() == "No links to Via in the corpus\n"
+
+    @pytest.fixture
+    def corpus(self, tmp_path):
+        corpus = tmp_path / "corpus.txt"
+        corpus.write_text(
+            "http://example.com/a?via.client.focus=1\n"
+            + "http://example.com/b\t"
+            + json.dumps({"content_type": "pdf", "headers": {"a": "b"}})
+            + "\n"
+        )
+        return str(corpus)
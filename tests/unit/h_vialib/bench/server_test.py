@@ -0,0 +1,116 @@
+from collections import Counter
+
+import pytest
+from h_matchers import Any
+from webob import Request
+
+from h_vialib import ViaClient
+from h_vialib.bench.server import (
+    LoadResult,
+    StandInVia,
+    request_in_process,
+    request_over_http,
+    run_load,
+    serve,
+)
+
+SECRET = "not_a_very_secret_secret"
+
+
+class TestStandInVia:
+    @pytest.mark.parametrize(
+        "url,content_type,endpoint",
+        (
+            ("http://example.com", None, "/route"),
+            ("http://example.com", "pdf", "/pdf"),
+            ("https://youtu.be/dQw4w9WgXcQ", None, "/video/youtube"),
+        ),
+    )
+    def test_it_serves_signed_links(self, app, client, url, content_type, endpoint):
+        link = client.url_for(url, content_type, options={"via.client.focus": "1"})
+
+        response = Request.blank(link).get_response(app)
+
+        assert response.status_code == 200
+        assert response.json == {
+            "endpoint": endpoint,
+            "url": Any.string(),
+            "via": Any.dict().containing({"sec": Any.string()}),
+            "h": Any.dict().containing({"focus": "1"}),
+        }
+        assert app.verify_timings == [Any.int()]
+
+    def test_it_rejects_unsigned_links(self, app):
+        response = Request.blank("http://via.example.com/pdf?url=a").get_response(app)
+
+        assert response.status_code == 401
+        assert app.verify_timings == [Any.int()]
+
+    def test_it_returns_404_for_other_paths(self, app):
+        response = Request.blank("http://via.example.com/other").get_response(app)
+
+        assert response.status_code == 404
+        assert not app.verify_timings
+
+
+class TestLoadResult:
+    def test_it(self):
+        result = LoadResult(
+            requests=10,
+            elapsed_ns=2_000_000_000,
+            statuses=Counter({200: 10}),
+            verify_timings=[100_000_000] * 10,
+        )
+
+        assert result.requests_per_second == 5
+        assert result.verify_share == 0.5
+
+    def test_it_with_no_time_elapsed(self):
+        result = LoadResult(0, 0, Counter(), [])
+
+        assert not result.requests_per_second
+        assert not result.verify_share
+
+
+class TestRunLoad:
+    @pytest.mark.parametrize("threads", (1, 3))
+    def test_it(self, app, client, threads):
+        links = [
+            client.url_for("http://example.com", "pdf"),
+            "http://via.example.com/pdf?url=unsigned",
+        ]
+
+        result = run_load(app, links, requests=10, threads=threads)
+
+        assert result.requests == 10
+        assert result.statuses == {200: 5, 401: 5}
+        assert len(result.verify_timings) == 10
+        assert result.elapsed_ns > 0
+
+    def test_it_over_http(self, app):
+        with serve(app) as service_url:
+            client = ViaClient(SECRET, service_url=service_url)
+            links = [
+                client.url_for("http://example.com", "pdf"),
+                f"{service_url}/pdf?url=unsigned",
+            ]
+
+            result = run_load(
+                app, links, requests=4, threads=2, send_request=request_over_http
+            )
+
+        assert result.statuses == {200: 2, 401: 2}
+
+
+def test_request_in_process(app):
+    assert request_in_process(app, "http://via.example.com/other") == 404
+
+
+@pytest.fixture
+def app():
+    return StandInVia(SECRET)
+
+
+@pytest.fixture
+def client():
+    return ViaClient(SECRET, service_url="http://via.example.com")
@@ -1,7 +1,25 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
 import pytest
 from h_matchers import Any
 
-from h_vialib import ContentType, ViaClient, ViaDoc
+from h_vialib import (
+    ContentType,
+    ContentTypeClassifier,
+    ViaClient,
+    ViaClientRegistry,
+    ViaDoc,
+    ViaDocBatch,
+)
+from h_vialib.secure import (
+    SYSTEM_CLOCK,
+    FrozenClock,
+    SignedURLStore,
+    ViaSecureURL,
+    quantized_expiry,
+)
 
 
 class TestViaDoc:
@@ -13,6 +31,9 @@ class TestViaDoc:
             ("http://example.com", ContentType.PDF, ContentType.PDF),
             # We know about Google Drive links and assume them to be PDF
             ("https://drive.google.com/uc?id=0&export=download", None, ContentType.PDF),
+            # But links ending in ".pdf" still need routing by default
+            ("http://example.com/file.pdf", None, None),
+            ("http://example.com/file.pdf", ContentType.HTML, ContentType.HTML),
         ),
     )
     def test_content_type(self, url, content_type, expected_content_type):
@@ -20,6 +41,83 @@ class TestViaDoc:
 
         assert doc.content_type == expected_content_type
 
+    @pytest.mark.parametrize("content_type", (None, ContentType.YOUTUBE))
+    def test_youtube_urls_are_canonicalized(self, content_type):
+        doc = ViaDoc("https://youtu.be/dQw4w9WgXcQ?t=1", content_type)
+
+        assert doc.url == "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+        assert doc.content_type == ContentType.YOUTUBE
+
+    def test_content_type_with_a_classifier(self):
+        classifier = ContentTypeClassifier(html_extensions=("html",))
+
+        doc = ViaDoc("http://example.com/file.html", classifier=classifier)
+
+        assert doc.content_type == ContentType.HTML
+
+    def test_it_has_no_dict(self):
+        assert not hasattr(ViaDoc("http://example.com"), "__dict__")
+
+
+class TestViaDocBatch:
+    def test_it(self):
+        batch = ViaDocBatch(
+            [
+                "http://example.com",
+                "https://drive.google.com/uc?id=0&export=download",
+                "https://youtu.be/dQw4w9WgXcQ?t=1",
+            ]
+        )
+
+        assert len(batch) == 3
+        assert list(batch) == [
+            ("http://example.com", None),
+            ("https://drive.google.com/uc?id=0&export=download", ContentType.PDF),
+            ("https://www.youtube.com/watch?v=dQw4w9WgXcQ", ContentType.YOUTUBE),
+        ]
+
+    def test_it_with_content_types(self):
+        batch = ViaDocBatch(
+            ["http://example.com/file.pdf", "http://example.com"],
+            content_types=["html", None],
+        )
+
+        assert list(batch) == [
+            ("http://example.com/file.pdf", ContentType.HTML),
+            ("http://example.com", None),
+        ]
+
+    def test_it_with_a_classifier(self):
+        classifier = ContentTypeClassifier(html_extensions=("html",))
+
+        batch = ViaDocBatch(["http://example.com/file.html"], classifier=classifier)
+
+        assert list(batch) == [("http://example.com/file.html", ContentType.HTML)]
+
+    def test_it_raises_if_the_content_types_dont_match_the_urls(self):
+        with pytest.raises(ValueError):
+            ViaDocBatch(["http://example.com"], content_types=[])
+
+    def test_append_raises_with_an_unknown_content_type(self):
+        batch = ViaDocBatch()
+
+        with pytest.raises(ValueError):
+            batch.append("http://example.com", "video")
+
+        assert not len(batch)  # pylint:disable=use-implicit-booleaness-not-len
+
+    def test_getitem(self):
+        batch = ViaDocBatch(
+            ["http://example.com", "http://example.com/file.pdf"],
+            content_types=[None, "pdf"],
+        )
+
+        doc = batch[1]
+
+        assert isinstance(doc, ViaDoc)
+        assert doc.url == "http://example.com/file.pdf"
+        assert doc.content_type == ContentType.PDF
+
 
 class TestViaClient:
     VIA_URL = "http://via.localhost"
@@ -53,6 +151,26 @@ class TestViaClient:
             expected_query
         )
 
+    def test_url_for_with_a_classifier(self):
+        client = ViaClient(
+            service_url=self.VIA_URL,
+            secret="this_is_not_a_secret",
+            classifier=ContentTypeClassifier(pdf_hosts=("example.com",)),
+        )
+
+        final_url = client.url_for("http://example.com")
+
+        assert final_url == Any.url.matching(self.VIA_URL + "/pdf").containing_query(
+            {"url": "http://example.com"}
+        )
+
+    def test_url_for_detects_youtube(self, client):
+        final_url = client.url_for("https://youtu.be/dQw4w9WgXcQ")
+
+        assert final_url == Any.url.matching(
+            self.VIA_URL + "/video/youtube"
+        ).containing_query({"url": "https://www.youtube.com/watch?v=dQw4w9WgXcQ"})
+
     @pytest.mark.parametrize("content_type,path", ((None, "/route"), ("pdf", "/pdf")))
     def test_url_for_with_blocked_for(self, client, content_type, path):
         url = "http://example.com&a=1&a=2"
@@ -107,6 +225,38 @@ class TestViaClient:
             expected_query
         )
 
+    def test_url_for_with_html_preserves_the_original_query(self, client):
+        url = "http://example.com/path?a=%7E&b=x+y&&c&d=&via.sec=OLD#fragment"
+
+        final_url = client.url_for(url, "html")
+
+        assert final_url == (
+            self.VIAHTML_URL
+            + "/http://example.com/path?"
+            + "via.client.ignoreOtherConfiguration=1&via.client.openSidebar=1"
+            + "&via.external_link_mode=new-tab&a=%7E&b=x+y&c&d=#fragment"
+        )
+
+    def test_url_for_with_html_and_no_options(self, client):
+        client.options = {}
+
+        final_url = client.url_for("http://example.com/path?a=1", "html")
+
+        assert final_url == self.VIAHTML_URL + "/http://example.com/path?a=1"
+
+    def test_url_for_with_html_lets_the_url_override_options(self, client):
+        url = "http://example.com/path?via.client.openSidebar=0"
+
+        final_url = client.url_for(url, "html")
+
+        assert final_url == Any.url.matching(self.VIAHTML_URL + "/" + url).with_query(
+            {
+                "via.client.ignoreOtherConfiguration": "1",
+                "via.external_link_mode": "new-tab",
+                "via.client.openSidebar": "0",
+            }
+        )
+
     @pytest.mark.parametrize("content_type", (None, "pdf", "html"))
     def test_url_for_allows_you_to_override_options(self, client, content_type):
         override = {"via.client.openSidebar": "0"}
@@ -136,6 +286,31 @@ class TestViaClient:
             {"via.secret.query": "secure query"}
         )
 
+    def test_url_for_with_reuse_secrets(self, CachedEncryption):
+        client = ViaClient(
+            service_url=self.VIA_URL, secret="this_is_not_a_secret", reuse_secrets=True
+        )
+        CachedEncryption.return_value.encrypt_dict.return_value = "secure headers"
+
+        final_url = client.url_for("http://example.com", headers={"some": "header"})
+
+        CachedEncryption.assert_called_once_with(
+            b"this_is_not_a_secret",
+            max_age=ViaSecureURL.MAX_AGE,
+            compress_threshold=None,
+            clock=SYSTEM_CLOCK,
+        )
+        assert final_url == Any.url().containing_query(
+            {"via.secret.headers": "secure headers"}
+        )
+
+    def test_it_passes_the_compression_threshold(self, Encryption):
+        ViaClient(secret="this_is_not_a_secret", compress_secrets_threshold=512)
+
+        Encryption.assert_called_once_with(
+            b"this_is_not_a_secret", compress_threshold=512
+        )
+
     @pytest.mark.parametrize("content_type", (None, "pdf", "html"))
     def test_url_for_raises_without_a_service_url(self, content_type):
         client = ViaClient(
@@ -162,10 +337,143 @@ class TestViaClient:
 
         assert signed_url == Any.url.with_path(path)
 
+    @pytest.mark.parametrize("reuse_secrets", (False, True))
+    def test_url_for_batch(self, reuse_secrets):
+        client = ViaClient(
+            service_url=self.VIA_URL,
+            html_service_url=self.VIAHTML_URL,
+            secret="not_a_very_secret_secret",
+            reuse_secrets=reuse_secrets,
+        )
+        urls = [
+            "http://example.com",
+            "http://example.com/file.pdf",
+            "https://youtu.be/dQw4w9WgXcQ",
+        ]
+        kwargs = {"options": {"a": "b"}, "blocked_for": "lms"}
+
+        via_urls = client.url_for_batch(
+            ViaDocBatch(urls, content_types=["html", None, None]), **kwargs
+        )
+
+        assert via_urls == [
+            client.url_for(urls[0], "html", **kwargs),
+            client.url_for(urls[1], **kwargs),
+            client.url_for(urls[2], **kwargs),
+        ]
+
+    def test_url_for_batch_encrypts_secrets_once(self, client, Encryption):
+        Encryption.return_value.encrypt_dict.return_value = "secure"
+        batch = ViaDocBatch(["http://example.com/1.pdf", "http://example.com/2.pdf"])
+
+        via_urls = client.url_for_batch(batch, query={"a": "b"}, headers={"c": "d"})
+
+        assert Encryption.return_value.encrypt_dict.call_count == 2
+        assert (
+            via_urls
+            == [
+                Any.url().containing_query(
+                    {"via.secret.query": "secure", "via.secret.headers": "secure"}
+                )
+            ]
+            * 2
+        )
+
+    def test_url_for_with_a_signed_url_store(self, tmp_path):
+        store = SignedURLStore(str(tmp_path / "store.db"))
+        client = ViaClient(
+            secret="not_a_very_secret_secret",
+            service_url=self.VIA_URL,
+            signed_url_store=store,
+        )
+        other_client = ViaClient(
+            secret="not_a_very_secret_secret",
+            service_url=self.VIA_URL,
+            signed_url_store=store,
+        )
+
+        via_url = client.url_for("http://example.com", options={"a": "b"})
+        stored_via_url = other_client.url_for("http://example.com", options={"a": "b"})
+        other_options_url = other_client.url_for(
+            "http://example.com", options={"a": "c"}
+        )
+
+        assert stored_via_url == via_url
+        assert other_options_url != via_url
+        assert ViaSecureURL("not_a_very_secret_secret").verify(stored_via_url)
+        connection = sqlite3.connect(str(tmp_path / "store.db"))
+        assert connection.execute("SELECT COUNT(*) FROM signed_url").fetchone() == (2,)
+
+    def test_url_for_with_a_signed_url_store_shared_between_secrets(self, tmp_path):
+        store = SignedURLStore(str(tmp_path / "store.db"))
+        client = ViaClient(
+            secret="not_a_very_secret_secret",
+            service_url=self.VIA_URL,
+            signed_url_store=store,
+        )
+        other_client = ViaClient(
+            secret="another_not_very_secret_secret",
+            service_url=self.VIA_URL,
+            signed_url_store=store,
+        )
+
+        via_url = client.url_for("http://example.com")
+        other_via_url = other_client.url_for("http://example.com")
+
+        assert other_via_url != via_url
+        assert ViaSecureURL("another_not_very_secret_secret").verify(other_via_url)
+
+    def test_url_for_with_a_signed_url_store_uses_the_clock(self, tmp_path):
+        # Long after the real time, so nothing is stored for this window yet
+        clock = FrozenClock(datetime(2100, 1, 1, tzinfo=timezone.utc))
+        client = ViaClient(
+            secret="not_a_very_secret_secret",
+            service_url=self.VIA_URL,
+            signed_url_store=SignedURLStore(str(tmp_path / "store.db")),
+            clock=clock,
+        )
+
+        via_url = client.url_for("http://example.com")
+
+        assert ViaSecureURL("not_a_very_secret_secret", clock=clock).verify(
+            via_url
+        ) == {
+            "exp": int(quantized_expiry(ViaSecureURL.MAX_AGE, clock=clock).timestamp())
+        }
+        assert client.url_for("http://example.com") == via_url
+
+    @pytest.mark.parametrize("secret", ("query", "headers"))
+    def test_url_for_doesnt_store_secrets(self, secret, tmp_path):
+        client = ViaClient(
+            secret="not_a_very_secret_secret",
+            service_url=self.VIA_URL,
+            signed_url_store=SignedURLStore(str(tmp_path / "store.db")),
+        )
+
+        client.url_for("http://example.com", **{secret: {"a": "b"}})
+
+        connection = sqlite3.connect(str(tmp_path / "store.db"))
+        assert not connection.execute("SELECT * FROM signed_url").fetchall()
+
+    def test_it_can_be_shared_between_threads(self, client):
+        urls = [f"http://example.com/{i}" for i in range(200)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            via_urls = list(executor.map(client.url_for, urls))
+
+        for url, via_url in zip(urls, via_urls):
+            assert via_url == Any.url.matching(
+                self.VIA_URL + "/route"
+            ).containing_query({"url": url})
+
     @pytest.fixture
     def Encryption(self, patch):
         return patch("h_vialib.client.Encryption")
 
+    @pytest.fixture
+    def CachedEncryption(self, patch):
+        return patch("h_vialib.client.CachedEncryption")
+
     @pytest.fixture
     def client(self, Encryption):  # pylint:disable=unused-argument
         return ViaClient(
@@ -173,3 +481,84 @@ class TestViaClient:
             html_service_url=self.VIAHTML_URL,
             secret="this_is_not_a_secret",
         )
+
+
+class TestViaClientRegistry:
+    def test_it_returns_working_clients(self, registry):
+        client = registry.get(SECRET, service_url="http://via.example.com")
+
+        assert isinstance(client, ViaClient)
+        assert client.url_for("http://example.com") == Any.url.matching(
+            "http://via.example.com/route"
+        ).containing_query({"url": "http://example.com"})
+
+    def test_it_reuses_clients(self, registry):
+        client = registry.get(SECRET, "http://via.example.com", reuse_secrets=True)
+
+        assert (
+            registry.get(SECRET, "http://via.example.com", reuse_secrets=True) is client
+        )
+        assert len(registry) == 1
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        (
+            {"secret": "this_is_another_secret"},
+            {"service_url": "http://other.example.com"},
+            {"html_service_url": "http://html.example.com"},
+            {"reuse_secrets": True},
+        ),
+    )
+    def test_it_keys_on_the_configuration(self, registry, kwargs):
+        client = registry.get(SECRET, "http://via.example.com")
+
+        other = registry.get(
+            **{"secret": SECRET, "service_url": "http://via.example.com", **kwargs}
+        )
+
+        assert other is not client
+        assert len(registry) == 2
+
+    def test_it_evicts_the_least_recently_used_client(self):
+        registry = ViaClientRegistry(max_size=2)
+        client_a = registry.get(SECRET, "http://a.example.com")
+        client_b = registry.get(SECRET, "http://b.example.com")
+        registry.get(SECRET, "http://a.example.com")
+
+        registry.get(SECRET, "http://c.example.com")
+
+        assert len(registry) == 2
+        assert registry.get(SECRET, "http://a.example.com") is client_a
+        assert registry.get(SECRET, "http://b.example.com") is not client_b
+
+    def test_it_doesnt_keep_secrets_in_its_keys(self, registry):
+        registry.get(SECRET, "http://via.example.com")
+
+        # pylint:disable=protected-access
+        assert SECRET not in repr(list(registry._clients))
+
+    def test_clear(self, registry):
+        registry.get(SECRET, "http://via.example.com")
+
+        registry.clear()
+
+        assert not registry
+
+    def test_it_can_be_shared_between_threads(self, registry):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            clients = list(
+                executor.map(
+                    lambda i: registry.get(SECRET, f"http://{i % 3}.example.com"),
+                    range(30),
+                )
+            )
+
+        assert len(registry) == 3
+        assert len({id(client) for client in clients}) == 3
+
+    @pytest.fixture
+    def registry(self):
+        return ViaClientRegistry()
+
+
+SECRET = "this_is_not_a_secret"
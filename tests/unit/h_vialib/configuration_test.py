@@ -1,3 +1,5 @@
+import json
+from collections.abc import Generator
 from unittest.mock import patch
 
 import pytest
@@ -61,6 +63,58 @@ class TestConfiguration:
         assert stripped_url == url
         urlparse.assert_not_called()
 
+    def test_extract_many(self, url_with_params):
+        urls = [
+            url_with_params,
+            "http://example.com/other?via.client.focus=other",
+            "http://example.com/plain?a=1",
+            "http://example.com/plain",
+            url_with_params,
+            # Params are only decoded once the query is parsed
+            "http://example.com/encoded?%76ia.client.openSidebar=1",
+            None,
+        ]
+
+        generator = Configuration.extract_many(urls)
+
+        assert isinstance(generator, Generator)
+        results = list(generator)
+        assert results == [Configuration.extract_from_url(url) for url in urls]
+
+    def test_extract_many_without_defaults(self, url_with_params):
+        results = list(
+            Configuration.extract_many([url_with_params], add_defaults=False)
+        )
+
+        assert results == [Configuration.extract_from_url(url_with_params, False)]
+
+    def test_extract_many_only_parses_each_query_once(self, url_with_params, patch):
+        parse_qsl = patch("h_vialib.configuration.parse_qsl", return_value=[])
+
+        list(Configuration.extract_many([url_with_params] * 3))
+
+        parse_qsl.assert_called_once()
+
+    def test_strip_many(self, url_with_params):
+        urls = [
+            url_with_params,
+            "http://example.com/other?" + url_with_params.split("?")[1],
+            "http://example.com/plain?a=1",
+            "http://example.com/no_query_via",
+        ]
+
+        results = Configuration.strip_many(urls)
+
+        assert isinstance(results, Generator)
+        assert list(results) == [Configuration.strip_from_url(url) for url in urls]
+
+    def test_strip_many_only_parses_each_query_once(self, url_with_params, patch):
+        parse_qsl = patch("h_vialib.configuration.parse_qsl", return_value=[])
+
+        list(Configuration.strip_many([url_with_params] * 3))
+
+        parse_qsl.assert_called_once()
+
     def test_add_to_url(self):
         url = "http://example.com?a=1&a=2&via.client.focus=3"
 
@@ -80,6 +134,87 @@ class TestConfiguration:
         # Original via settings are wiped
         assert url_with_config != Any.url().containing_query({"via.client.focus": "3"})
 
+    def test_client_config_json(self):
+        config_json = Configuration.client_config_json(
+            {"focus": {"user": "</script><!--&"}, "openSidebar": True, "theme": None}
+        )
+
+        assert config_json == (
+            '{"focus":{"user":"\\u003c/script\\u003e\\u003c!--\\u0026"},'
+            '"openSidebar":true,"theme":null}'
+        )
+        assert json.loads(config_json) == {
+            "focus": {"user": "</script><!--&"},
+            "openSidebar": True,
+            "theme": None,
+        }
+
+    def test_client_config_json_escapes_line_separators(self):
+        config_json = Configuration.client_config_json({"a": "é\u2028\u2029"})
+
+        assert config_json == '{"a":"é\\u2028\\u2029"}'
+
+    def test_client_config_json_is_cached(self, json_dumps):
+        first = Configuration.client_config_json({"a": "1", "b": ["c", {"d": "e"}]})
+        second = Configuration.client_config_json({"a": "1", "b": ["c", {"d": "e"}]})
+
+        assert first == second
+        json_dumps.assert_called_once()
+
+    def test_client_config_json_ignores_key_order(self):
+        assert Configuration.client_config_json(
+            {"a": "1", "b": "2"}
+        ) == Configuration.client_config_json({"b": "2", "a": "1"})
+
+    @pytest.mark.parametrize(
+        "config,other_config",
+        (
+            ({"a": True}, {"a": 1}),
+            ({"a": ["1"]}, {"a": {"1": None}}),
+            ({"a": "1"}, {"a": 1}),
+        ),
+    )
+    def test_client_config_json_distinguishes_types(self, config, other_config):
+        assert Configuration.client_config_json(
+            config
+        ) != Configuration.client_config_json(other_config)
+
+    def test_client_config_json_cache_is_bounded(self):
+        Configuration.CLIENT_CONFIG_JSON_CACHE_SIZE = 2
+
+        for value in range(5):
+            Configuration.client_config_json({"a": value})
+
+        # pylint:disable=protected-access
+        assert len(Configuration._client_config_json_cache) == 2
+
+    def test_client_config_json_cache_evicts_the_least_recently_used(self, json_dumps):
+        Configuration.CLIENT_CONFIG_JSON_CACHE_SIZE = 2
+
+        Configuration.client_config_json({"a": "1"})
+        Configuration.client_config_json({"a": "2"})
+        Configuration.client_config_json({"a": "1"})
+        # This makes way for itself by evicting {"a": "2"}
+        Configuration.client_config_json({"a": "3"})
+        Configuration.client_config_json({"a": "1"})
+        Configuration.client_config_json({"a": "3"})
+        assert json_dumps.call_count == 3
+
+        Configuration.client_config_json({"a": "2"})
+        assert json_dumps.call_count == 4
+
+    @pytest.fixture(autouse=True)
+    def clear_client_config_json_cache(self):
+        # pylint:disable=protected-access
+        Configuration._client_config_json_cache.clear()
+        yield
+        Configuration._client_config_json_cache.clear()
+        Configuration.CLIENT_CONFIG_JSON_CACHE_SIZE = 1024
+
+    @pytest.fixture
+    def json_dumps(self, patch):
+        return patch("h_vialib.configuration.json.dumps", side_effect=json.dumps)
+
     def assert_correct_params(self, via_params, client_params):
         assert via_params == {"setting": "setting_last"}
         assert client_params == Any.dict().containing({"focus": "focus_last"})
@@ -0,0 +1,122 @@
+import pytest
+
+from h_vialib import ContentType, ContentTypeClassifier
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+YOUTUBE_URLS = (
+    f"https://www.youtube.com/watch?v={VIDEO_ID}",
+    f"http://youtube.com/watch?v={VIDEO_ID}",
+    f"https://www.youtube.com/watch?feature=share&v={VIDEO_ID}&t=10s",
+    f"https://www.youtube.com/watch/?v={VIDEO_ID}",
+    f"https://m.youtube.com/watch?v={VIDEO_ID}",
+    f"https://music.youtube.com/watch?v={VIDEO_ID}&list=abc",
+    f"https://youtu.be/{VIDEO_ID}",
+    f"https://youtu.be/{VIDEO_ID}?t=42",
+    f"https://www.youtube.com/embed/{VIDEO_ID}?autoplay=1",
+    f"https://www.youtube-nocookie.com/embed/{VIDEO_ID}",
+    f"https://www.youtube.com/shorts/{VIDEO_ID}",
+    f"https://www.youtube.com/live/{VIDEO_ID}?feature=share",
+    f"https://www.youtube.com/v/{VIDEO_ID}",
+)
+
+
+class TestContentTypeClassifier:
+    @pytest.mark.parametrize(
+        "url,content_type",
+        (
+            ("http://example.com", None),
+            ("http://example.com/", None),
+            ("http://example.com/file.html", None),
+            # We know about Google Drive links and assume them to be PDF
+            ("https://drive.google.com/uc?id=0&export=download", ContentType.PDF),
+            ("https://DRIVE.google.com/uc?id=0&export=download", ContentType.PDF),
+            ("https://drive.google.com/uc?id=0", None),
+            # Links ending in ".pdf" can be HTML paywalls, so Via routes them
+            ("http://example.com/file.pdf", None),
+        ),
+    )
+    def test_classify_with_defaults(self, url, content_type):
+        assert ContentTypeClassifier().classify(url) == content_type
+
+    @pytest.mark.parametrize(
+        "url,content_type",
+        (
+            ("http://example.com/file.pdf", ContentType.PDF),
+            ("https://example.com/a/b/file.PDF?a=b#c", ContentType.PDF),
+            ("http://example.com/file.pdf#page=2", ContentType.PDF),
+            ("http://example.com/file.pdfx", None),
+            ("http://example.com/file?name=file.pdf", None),
+            ("http://example.com/file", None),
+            ("http://example.pdf", None),
+            ("ftp://example.com/file.pdf", None),
+        ),
+    )
+    def test_classify_with_pdf_extensions(self, url, content_type):
+        classifier = ContentTypeClassifier(pdf_extensions=("pdf",))
+
+        assert classifier.classify(url) == content_type
+
+    @pytest.mark.parametrize(
+        "url,content_type",
+        (
+            ("https://arxiv.org/pdf/1234", ContentType.PDF),
+            ("https://export.arxiv.org/pdf/1234", ContentType.PDF),
+            ("https://arxiv.org/abs/1234", None),
+            ("https://pdfs.example.com", ContentType.PDF),
+            ("https://pdfs.example.com:8080/anything", ContentType.PDF),
+            ("https://pdfs.example.com.evil.com/anything", None),
+            ("https://example.com/file.doc", ContentType.PDF),
+            ("https://example.com/file.pdf", None),
+            ("https://example.com/file.htm", ContentType.HTML),
+            ("https://example.com/file.html?a=b", ContentType.HTML),
+            ("https://example.com/pattern", ContentType.PDF),
+        ),
+    )
+    def test_classify_with_configured_rules(self, url, content_type):
+        classifier = ContentTypeClassifier(
+            pdf_hosts=("arxiv.org/pdf/", "pdfs.example.com"),
+            pdf_patterns=(r"https://example\.com/pattern",),
+            pdf_extensions=("doc",),
+            html_extensions=("htm", "html"),
+        )
+
+        assert classifier.classify(url) == content_type
+
+    def test_classify_with_no_rules(self):
+        classifier = ContentTypeClassifier(pdf_patterns=(), youtube=False)
+
+        assert (
+            classifier.classify("https://drive.google.com/uc?id=0&export=download")
+            is None
+        )
+        assert classifier.classify(f"https://youtu.be/{VIDEO_ID}") is None
+
+    @pytest.mark.parametrize("url", YOUTUBE_URLS)
+    def test_classify_youtube(self, url):
+        assert ContentTypeClassifier().classify(url) == ContentType.YOUTUBE
+
+    @pytest.mark.parametrize("url", YOUTUBE_URLS)
+    def test_canonicalize_youtube(self, url):
+        assert (
+            ContentTypeClassifier().canonicalize(url)
+            == f"https://www.youtube.com/watch?v={VIDEO_ID}"
+        )
+
+    @pytest.mark.parametrize(
+        "url",
+        (
+            "https://www.youtube.com/",
+            "https://www.youtube.com/watch?v=tooShort",
+            f"https://www.youtube.com/watch?v={VIDEO_ID}toolong",
+            f"https://www.youtube.com/watch?other={VIDEO_ID}",
+            f"https://www.youtube.com/channel/{VIDEO_ID}",
+            f"https://www.youtube.com.evil.com/watch?v={VIDEO_ID}",
+            f"https://notyoutube.com/watch?v={VIDEO_ID}",
+        ),
+    )
+    def test_non_video_youtube_urls(self, url):
+        classifier = ContentTypeClassifier()
+
+        assert classifier.classify(url) is None
+        assert classifier.canonicalize(url) == url
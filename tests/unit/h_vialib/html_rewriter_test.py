@@ -0,0 +1,187 @@
+import pytest
+
+from h_vialib import HTMLLinkStripper
+
+HTML = (
+    b"<!DOCTYPE html><html><head>"
+    b'<link rel="stylesheet" HREF="/style.css?via.client.focus=1">'
+    b"</head><body>"
+    b'<a href="http://example.com/?a=1&amp;via.sec=TOKEN&amp;b=2">Link</a>'
+    b"<img src=http://example.com/image.png?via.external_link_mode=new-tab>"
+    b"<a href='/page?via.sec=TOKEN'>Single quoted</a>"
+    b'<a href = "/plain?a=1">Not changed</a>'
+    b'<a href="/plain?a=1" title="via.sec">Not changed</a>'
+    b'<a data-href="/page?via.sec=TOKEN">Not a URL attribute</a>'
+    b"<p>Some text which mentions via.sec=TOKEN and hrefs</p>"
+    b'<p>Use href="/page?via.sec=TOKEN" in text</p>'
+    b"<p title='href=\"/page?via.sec=TOKEN\"'>An attribute in a value</p>"
+    b'<a title="a>b" href="/gt?via.sec=TOKEN">A ">" in a value</a>'
+    b'<script>img.src="http://example.com/?a=1&via.sec=1&b=2"; a<b;</script>'
+    b"<STYLE>a[href='/page?via.sec=TOKEN'] {}</style >"
+    b'<textarea><a href="/page?via.sec=TOKEN"></textarea>'
+    b'<!-- <a href="/page?via.sec=TOKEN"> -->'
+    b"<!--><a href=/after-comment?via.sec=TOKEN>"
+    b"<?bogus <a href=/page?via.sec=TOKEN>"
+    b"</a href=/end-tag?via.sec=TOKEN>"
+    b"</body></html>"
+)
+
+STRIPPED_HTML = (
+    b"<!DOCTYPE html><html><head>"
+    b'<link rel="stylesheet" HREF="/style.css">'
+    b"</head><body>"
+    b'<a href="http://example.com/?a=1&amp;b=2">Link</a>'
+    b"<img src=http://example.com/image.png>"
+    b"<a href='/page'>Single quoted</a>"
+    b'<a href = "/plain?a=1">Not changed</a>'
+    b'<a href="/plain?a=1" title="via.sec">Not changed</a>'
+    b'<a data-href="/page?via.sec=TOKEN">Not a URL attribute</a>'
+    b"<p>Some text which mentions via.sec=TOKEN and hrefs</p>"
+    b'<p>Use href="/page?via.sec=TOKEN" in text</p>'
+    b"<p title='href=\"/page?via.sec=TOKEN\"'>An attribute in a value</p>"
+    b'<a title="a>b" href="/gt">A ">" in a value</a>'
+    b'<script>img.src="http://example.com/?a=1&via.sec=1&b=2"; a<b;</script>'
+    b"<STYLE>a[href='/page?via.sec=TOKEN'] {}</style >"
+    b'<textarea><a href="/page?via.sec=TOKEN"></textarea>'
+    b'<!-- <a href="/page?via.sec=TOKEN"> -->'
+    b"<!--><a href=/after-comment>"
+    b"<?bogus <a href=/page?via.sec=TOKEN>"
+    b"</a href=/end-tag?via.sec=TOKEN>"
+    b"</body></html>"
+)
+
+LONG_TAG = (
+    b'<a title="a>b" data-x=\'y\' class = z / data-y= "v" '
+    b"href=http://example.com/?a=1&via.foo=bar&b=2>"
+)
+
+
+class TestHTMLLinkStripper:
+    def test_it(self, stripper):
+        assert b"".join(stripper.strip([HTML])) == STRIPPED_HTML
+
+    @pytest.mark.parametrize("chunk_size", (1, 2, 3, 7, 16, 100))
+    def test_it_handles_attributes_split_between_chunks(self, stripper, chunk_size):
+        chunks = [HTML[i : i + chunk_size] for i in range(0, len(HTML), chunk_size)]
+
+        assert b"".join(stripper.strip(chunks)) == STRIPPED_HTML
+
+    def test_it_streams(self, stripper):
+        chunks = stripper.strip(iter([b"<p>First</p>", b'<a href="/a?via.sec=1">']))
+
+        assert next(chunks) == b"<p>First</p>"
+        assert next(chunks) == b'<a href="/a">'
+
+    def test_it_passes_through_html_without_via_params(self, stripper):
+        html = b'<a href="/a?b=1">Link</a>'
+
+        assert list(stripper.strip([html])) == [html]
+
+    def test_it_with_other_attributes(self):
+        stripper = HTMLLinkStripper(attributes=("action",))
+
+        stripped = b"".join(
+            stripper.strip([b'<form action="/a?via.sec=1"><a href="/b?via.sec=1">'])
+        )
+
+        assert stripped == b'<form action="/a"><a href="/b?via.sec=1">'
+
+    @pytest.mark.parametrize("split", range(17, len(LONG_TAG)))
+    def test_it_passes_through_long_split_tags(self, split):
+        stripper = HTMLLinkStripper(max_carry=16)
+        chunks = [LONG_TAG[:split], LONG_TAG[split:] + b'<a href="/?via.sec=1">']
+
+        result = b"".join(stripper.strip(chunks))
+
+        # The tag was too long to hold back, so it isn't stripped, but the
+        # next one is
+        assert result == LONG_TAG + b'<a href="/">'
+
+    @pytest.mark.parametrize(
+        "name,stripped",
+        ((b"script", False), (b"scriptx" * 3, True), (b"a", True)),
+    )
+    def test_it_follows_long_split_tag_names(self, name, stripped):
+        stripper = HTMLLinkStripper(max_carry=1)
+        html = b"<" + name + b'><a href="/?via.sec=1"></' + name + b">"
+        chunks = [html[:2], html[2:4], html[4:]]
+
+        result = b"".join(stripper.strip(chunks))
+
+        assert result == (html.replace(b"?via.sec=1", b"") if stripped else html)
+
+    def test_it_follows_long_split_text_element_tags(self):
+        stripper = HTMLLinkStripper(max_carry=16)
+        chunks = [
+            b'<script data-long="' + b"x" * 20,
+            b"x" * 20,
+            b'"><a href="/?via.sec=1"></script>',
+        ]
+
+        assert b"".join(stripper.strip(chunks)) == b"".join(chunks)
+
+    @pytest.mark.parametrize("start", (b"<!--", b"<script>", b"<!DOCTYPE"))
+    @pytest.mark.parametrize("end", (b"", b"</scr", b"--"))
+    def test_it_passes_through_unfinished_markup_at_the_end(self, start, end):
+        html = start + b'<a href="/?via.sec=1"' + end
+
+        assert b"".join(HTMLLinkStripper().strip([html[:5], html[5:]])) == html
+
+    def test_it_bounds_the_carry(self):
+        stripper = HTMLLinkStripper(max_carry=10)
+        long_value = b'<a href="/' + b"a" * 20
+        chunks = [long_value, b'?via.sec=1">']
+
+        result = list(stripper.strip(chunks))
+
+        # The attribute was too long to hold back, so it isn't stripped
+        assert result == chunks
+
+    def test_it_strips_an_attribute_at_the_very_end(self, stripper):
+        stripped = b"".join(stripper.strip([b"<p>Text</p><img src=/a?via.sec=1"]))
+
+        assert stripped == b"<p>Text</p><img src=/a"
+
+    def test_it_leaves_urls_which_only_mention_via(self, stripper):
+        html = b'<a href="https://via.example.com/?a=1&amp;b=2">'
+
+        assert b"".join(stripper.strip([html])) == html
+
+    @pytest.mark.parametrize(
+        "query,stripped_query",
+        (
+            # Named references without a ";" which run into more of the name
+            (b"a=1&region=eu", b"a=1&amp;region=eu"),
+            (b"a=1&section=2", b"a=1&amp;section=2"),
+            (b"a=1&notify=1", b"a=1&amp;notify=1"),
+            (b"a=1&amp=1", b"a=1&amp;amp=1"),
+            (b"a=1&amp;b=2", b"a=1&amp;b=2"),
+            # Those which don't, and numeric references, are decoded
+            (b"a=1&#38;b=2", b"a=1&amp;b=2"),
+            (b"a=1&#x26;b=2", b"a=1&amp;b=2"),
+            (b"a=&copy", b"a=%C2%A9"),
+            (b"a=&copy-", b"a=%C2%A9-"),
+            (b"a=1&unknown;=2", b"a=1&amp;unknown%3B=2"),
+        ),
+    )
+    def test_it_decodes_references_like_a_browser(
+        self, stripper, query, stripped_query
+    ):
+        html = b'<a href="http://example.com/?via.a=1&' + query + b'">'
+
+        assert b"".join(stripper.strip([html])) == (
+            b'<a href="http://example.com/?' + stripped_query + b'">'
+        )
+
+    def test_it_leaves_links_it_cant_reencode(self, stripper):
+        # Latin-1 rather than UTF-8
+        html = b'<a href="http://example.com/?via.a=1&amp;q=caf\xe9">Caf\xe9</a>'
+
+        assert b"".join(stripper.strip([html])) == html
+
+    def test_it_handles_empty_input(self, stripper):
+        assert not list(stripper.strip([]))
+
+    @pytest.fixture
+    def stripper(self):
+        return HTMLLinkStripper()
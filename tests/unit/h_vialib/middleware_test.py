@@ -0,0 +1,77 @@
+from unittest.mock import create_autospec, sentinel
+
+import pytest
+from webob import Request, Response
+
+from h_vialib.exceptions import InvalidToken, MissingToken
+from h_vialib.middleware import ViaSecureURLMiddleware
+from h_vialib.secure import ViaSecureURL
+
+
+class TestViaSecureURLMiddleware:
+    def test_it_stores_claims_and_config(self, middleware, app, secure_url):
+        request = Request.blank("http://via.example.com/pdf?via.client.focus=1")
+
+        response = request.get_response(middleware)
+
+        secure_url.verify.assert_called_once_with(
+            "http://via.example.com/pdf?via.client.focus=1"
+        )
+        assert response.text == "OK"
+        environ = app.call_args[0][0]
+        assert environ[ViaSecureURLMiddleware.CLAIMS_KEY] == sentinel.claims
+        assert environ[ViaSecureURLMiddleware.CONFIG_KEY] == (
+            {},
+            {
+                "focus": "1",
+                "appType": "via",
+                "openSidebar": False,
+                "showHighlights": True,
+            },
+        )
+
+    @pytest.mark.parametrize("exception", (MissingToken("Missing"), InvalidToken()))
+    def test_it_rejects_bad_tokens(self, middleware, app, secure_url, exception):
+        secure_url.verify.side_effect = exception
+
+        response = Request.blank("http://via.example.com/pdf").get_response(middleware)
+
+        assert response.status_int == 401
+        app.assert_not_called()
+
+    def test_it_skips_exempt_paths(self, app, secure_url):
+        middleware = ViaSecureURLMiddleware(app, secure_url, exempt_paths=("/_status",))
+
+        Request.blank("http://via.example.com/_status").get_response(middleware)
+
+        secure_url.verify.assert_not_called()
+        environ = app.call_args[0][0]
+        assert environ[ViaSecureURLMiddleware.CLAIMS_KEY] is None
+
+    def test_it_with_real_tokens(self, app):
+        secure_url = ViaSecureURL("this_is_not_a_secret")
+        middleware = ViaSecureURLMiddleware(app, secure_url)
+        signed_url = secure_url.create("http://via.example.com/pdf?url=http://a.com")
+
+        assert Request.blank(signed_url).get_response(middleware).status_int == 200
+        assert (
+            Request.blank(signed_url + "&extra=1").get_response(middleware).status_int
+            == 401
+        )
+
+    @pytest.fixture
+    def app(self):
+        def app(_environ, start_response):
+            return Response("OK")(_environ, start_response)
+
+        return create_autospec(app, side_effect=app)
+
+    @pytest.fixture
+    def secure_url(self):
+        secure_url = create_autospec(ViaSecureURL, instance=True, spec_set=True)
+        secure_url.verify.return_value = sentinel.claims
+        return secure_url
+
+    @pytest.fixture
+    def middleware(self, app, secure_url):
+        return ViaSecureURLMiddleware(app, secure_url)
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from h_vialib.secure.clock import YEAR_ZERO, Clock, FrozenClock, SystemClock
+
+
+class TestClock:
+    def test_now_must_be_provided(self):
+        with pytest.raises(NotImplementedError):
+            Clock().now()
+
+    @pytest.mark.parametrize(
+        "offset,expires",
+        (
+            (0, 8),
+            (3, 8),
+            (4, 12),
+            (7, 12),
+            (8, 16),
+        ),
+    )
+    def test_window_expiry(self, offset, expires):
+        clock = FrozenClock(YEAR_ZERO + timedelta(seconds=offset))
+
+        assert clock.window_expiry(8) == YEAR_ZERO.timestamp() + expires
+
+    def test_window_expiry_follows_the_clock_forwards_and_backwards(self):
+        clock = FrozenClock(YEAR_ZERO)
+
+        assert clock.window_expiry(8) == YEAR_ZERO.timestamp() + 8
+        clock.advance(4)
+        assert clock.window_expiry(8) == YEAR_ZERO.timestamp() + 12
+        clock.advance(-1)
+        assert clock.window_expiry(8) == YEAR_ZERO.timestamp() + 8
+
+    def test_window_expiry_is_cached_per_max_age_and_divisions(self):
+        clock = FrozenClock(YEAR_ZERO + timedelta(seconds=3))
+
+        assert clock.window_expiry(8) == YEAR_ZERO.timestamp() + 8
+        assert clock.window_expiry(8, divisions=4) == YEAR_ZERO.timestamp() + 10
+        assert clock.window_expiry(6) == YEAR_ZERO.timestamp() + 9
+
+
+class TestSystemClock:
+    def test_now(self):
+        before = datetime.now(tz=timezone.utc).timestamp()
+
+        now = SystemClock().now()
+
+        assert isinstance(now, int)
+        assert before - 1 <= now <= datetime.now(tz=timezone.utc).timestamp()
+
+
+class TestFrozenClock:
+    @pytest.mark.parametrize("now", (1000, datetime.fromtimestamp(1000, timezone.utc)))
+    def test_now(self, now):
+        assert FrozenClock(now).now() == 1000
+
+    @pytest.mark.parametrize("now", (2000, datetime.fromtimestamp(2000, timezone.utc)))
+    def test_set(self, now):
+        clock = FrozenClock(1000)
+
+        clock.set(now)
+
+        assert clock.now() == 2000
+
+    @pytest.mark.parametrize("seconds", (30, timedelta(seconds=30)))
+    def test_advance(self, seconds):
+        clock = FrozenClock(1000)
+
+        clock.advance(seconds)
+
+        assert clock.now() == 1030
@@ -1,6 +1,13 @@
+from datetime import datetime, timezone
+
 import pytest
+from freezegun import freeze_time
+from joserfc import jwe
+from joserfc.jwk import OctKey
+
+from h_vialib.secure import CachedEncryption, Encryption, EncryptionResult, FrozenClock
 
-from h_vialib.secure import Encryption
+KEY = OctKey.import_key(b"VERY SECRET".ljust(32))
 
 
 class TestEncryption:
@@ -22,6 +29,98 @@ class TestEncryption:
 
         assert plain_text_dict == {"some": "data"}
 
+    @pytest.mark.parametrize("size,compressed", ((10, False), (1000, True)))
+    def test_encrypt_dict_compresses_large_payloads(self, secret, size, compressed):
+        encryption = Encryption(secret, compress_threshold=100)
+        payload_dict = {"cookie": "a" * size}
+
+        encrypted = encryption.encrypt_dict(payload_dict)
+
+        assert ("zip" in jwe.decrypt_compact(encrypted, KEY).protected) == compressed
+        assert encryption.decrypt_dict(encrypted) == payload_dict
+
+    def test_compressed_jwes_are_smaller(self, encryption, secret):
+        payload_dict = {"cookie": "a" * 1000}
+
+        compressed = Encryption(secret, compress_threshold=0).encrypt_dict(payload_dict)
+
+        assert len(compressed) < len(encryption.encrypt_dict(payload_dict)) / 5
+        # Decryption doesn't depend on the threshold
+        assert encryption.decrypt_dict(compressed) == payload_dict
+
+    @pytest.mark.parametrize("max_workers", (None, 4))
+    def test_encrypt_many_decrypt_many_round_trip(self, encryption, max_workers):
+        payloads = [{"item": i} for i in range(10)]
+
+        encrypted = encryption.encrypt_many(payloads, max_workers=max_workers)
+        decrypted = encryption.decrypt_many(
+            [result.value for result in encrypted], max_workers=max_workers
+        )
+
+        assert decrypted == [EncryptionResult(value=payload) for payload in payloads]
+
+    @pytest.mark.parametrize("max_workers", (None, 4))
+    def test_encrypt_many_reports_failures(self, encryption, max_workers):
+        results = encryption.encrypt_many(
+            [{"a": 1}, {"not": object()}, {"b": 2}], max_workers=max_workers
+        )
+
+        assert [result.value is None for result in results] == [False, True, False]
+        assert isinstance(results[1].error, TypeError)
+        assert results[0].error is None and results[2].error is None
+
+    def test_decrypt_many_reports_failures(self, encryption):
+        encrypted = encryption.encrypt_dict({"a": 1})
+
+        results = encryption.decrypt_many([encrypted, "not a JWE", encrypted])
+
+        assert results[0] == results[2] == EncryptionResult(value={"a": 1})
+        assert results[1].value is None
+        assert isinstance(results[1].error, Exception)
+
+
+@freeze_time("2022-12-22 00:10:00")
+class TestCachedEncryption:
+    def test_it_reuses_jwes_for_identical_payloads(self, cached_encryption):
+        encrypted = cached_encryption.encrypt_dict({"a": 1, "b": 2})
+
+        assert cached_encryption.encrypt_dict({"b": 2, "a": 1}) == encrypted
+        assert cached_encryption.decrypt_dict(encrypted) == {"a": 1, "b": 2}
+
+    def test_it_does_not_reuse_jwes_for_different_payloads(self, cached_encryption):
+        assert cached_encryption.encrypt_dict({"a": 1}) != (
+            cached_encryption.encrypt_dict({"a": 2})
+        )
+
+    def test_it_does_not_reuse_jwes_in_the_next_window(self, cached_encryption):
+        encrypted = cached_encryption.encrypt_dict({"a": 1})
+
+        with freeze_time("2022-12-22 00:40:00"):
+            assert cached_encryption.encrypt_dict({"a": 1}) != encrypted
+
+    def test_it_uses_the_clock_for_the_windows(self, secret):
+        clock = FrozenClock(datetime(2022, 12, 22, tzinfo=timezone.utc))
+        cached_encryption = CachedEncryption(secret, max_age=3600, clock=clock)
+        encrypted = cached_encryption.encrypt_dict({"a": 1})
+
+        clock.advance(1799)
+        assert cached_encryption.encrypt_dict({"a": 1}) == encrypted
+
+        clock.advance(1)
+        assert cached_encryption.encrypt_dict({"a": 1}) != encrypted
+
+    def test_it_stops_caching_when_the_window_is_full(self, cached_encryption):
+        cached_encryption.MAX_ITEMS_PER_WINDOW = 1
+        cached_encryption.encrypt_dict({"a": 1})
+
+        encrypted = cached_encryption.encrypt_dict({"a": 2})
+
+        assert cached_encryption.encrypt_dict({"a": 2}) != encrypted
+
+    @pytest.fixture
+    def cached_encryption(self, secret):
+        return CachedEncryption(secret, max_age=3600)
+
 
 class TestEncryptionPatched:
     """Tests for h_vialib.secure.encryption that patch joserfc."""
@@ -4,7 +4,13 @@ from datetime import timedelta, timezone
 import pytest
 from pytest import param
 
-from h_vialib.secure.expiry import YEAR_ZERO, as_expires, quantized_expiry
+from h_vialib.secure.clock import FrozenClock
+from h_vialib.secure.expiry import (
+    YEAR_ZERO,
+    as_expires,
+    as_expires_timestamp,
+    quantized_expiry,
+)
 
 
 class TestQuantizedExpiry:
@@ -42,21 +48,19 @@ class TestQuantizedExpiry:
             param(8, 2, 8, 16, id="Until we get to the next period"),
             # Specific scenarios
             param(8, 4, 2, 10, id="With more divisions the offset is smaller"),
-            param(8, 8, 3, 13, id="With max_age=divisions quantization is 1 second"),
-            param(9, 3, 2, 12, id="There's nothing special about even numbers"),
+            param(8, 8, 3, 11, id="With max_age=divisions quantization is 1 second"),
+            param(9, 3, 2, 9, id="There's nothing special about even numbers"),
         ),
     )
-    def test_quantization(
-        self, datetime, max_age, divisions, time_offset, expiry_offset
-    ):
+    def test_quantization(self, max_age, divisions, time_offset, expiry_offset):
         # Set it so that we are time_offset seconds past "YEAR_ZERO", making
         # all of our time offsets small and easy to see
-        datetime.now.return_value = YEAR_ZERO + timedelta(seconds=time_offset)
+        clock = FrozenClock(YEAR_ZERO + timedelta(seconds=time_offset))
 
-        expires = quantized_expiry(max_age=max_age, divisions=divisions)
+        expires = quantized_expiry(max_age=max_age, divisions=divisions, clock=clock)
 
         offset = (expires - YEAR_ZERO).seconds
-        assert offset, expiry_offset
+        assert offset == expiry_offset
 
     @pytest.mark.parametrize("max_age", (None, "foo"))
     def test_it_raises_with_invalid_max_age(self, max_age):
@@ -83,11 +87,12 @@ class TestAsExpires:
             as_expires(None, None)
 
     @pytest.mark.parametrize("max_age", (30, timedelta(seconds=30)))
-    def test_it_calculates_an_offset(self, datetime, max_age):
-        now = datetime.now.return_value = _datetime.utcnow()
-        result = as_expires(None, max_age=max_age)
+    def test_it_calculates_an_offset(self, max_age):
+        clock = FrozenClock(YEAR_ZERO)
+
+        result = as_expires(None, max_age=max_age, clock=clock)
 
-        assert result == now + timedelta(seconds=30)
+        assert result == YEAR_ZERO + timedelta(seconds=30)
 
     @pytest.mark.parametrize("max_age", (30, timedelta(seconds=30)))
     def test_it_returns_times_with_a_timezone(self, max_age):
@@ -96,6 +101,23 @@ class TestAsExpires:
         assert result.tzinfo == timezone.utc
 
 
-@pytest.fixture
-def datetime(patch):
-    return patch("h_vialib.secure.expiry.datetime")
+class TestAsExpiresTimestamp:
+    def test_it_converts_an_expiry(self):
+        assert as_expires_timestamp(YEAR_ZERO) == int(YEAR_ZERO.timestamp())
+
+    def test_it_passes_through_an_epoch_expiry(self):
+        assert as_expires_timestamp(1234) == 1234
+
+    def test_it_raises_if_expires_is_not_valid(self):
+        with pytest.raises(ValueError):
+            as_expires_timestamp("not a date")
+
+    def test_it_raise_if_no_value_is_provided(self):
+        with pytest.raises(ValueError):
+            as_expires_timestamp(None, None)
+
+    @pytest.mark.parametrize("max_age", (30, timedelta(seconds=30)))
+    def test_it_calculates_an_offset(self, max_age):
+        clock = FrozenClock(1000)
+
+        assert as_expires_timestamp(max_age=max_age, clock=clock) == 1030
@@ -0,0 +1,155 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import create_autospec
+
+import pytest
+from freezegun import freeze_time
+from h_matchers import Any
+
+from h_vialib.exceptions import InvalidToken
+from h_vialib.secure import (
+    PrewarmedViaSecureURL,
+    RevocationList,
+    SecureURL,
+    VerificationCache,
+    ViaSecureURL,
+)
+from h_vialib.secure.clock import FrozenClock
+
+URL = "http://via.example.com/route?url=http://example.com"
+
+
+@freeze_time("2022-12-22 00:10:00")
+class TestPrewarmedViaSecureURL:
+    def test_create(self, prewarmed):
+        signed_url = prewarmed.create(URL)
+
+        assert signed_url == Any.url().containing_query({"via.sec": Any.string()})
+        assert ViaSecureURL("this_is_not_a_secret").verify(signed_url)
+
+    def test_it_passes_other_arguments_on(self, tmp_path):
+        revocation_list = RevocationList()
+        prewarmed = PrewarmedViaSecureURL(
+            "this_is_not_a_secret",
+            compact=True,
+            verification_cache=VerificationCache(str(tmp_path / "cache")),
+            revocation_list=revocation_list,
+            url_hash_version=2,
+        )
+
+        signed_url = prewarmed.create(URL)
+
+        # Version 2 tokens are added to the end of the URL as it is
+        assert signed_url.startswith(URL + "&via.sec=")
+        assert prewarmed.verify(signed_url) == {"exp": Any.int()}
+        revocation_list.replace([signed_url.split("via.sec=")[1]])
+        with pytest.raises(InvalidToken):
+            prewarmed.verify(signed_url)
+
+    def test_create_reuses_signed_urls(self, prewarmed, create):
+        prewarmed.create(URL)
+        prewarmed.create(URL, max_age=timedelta(hours=1))
+
+        create.assert_called_once()
+
+    def test_create_resigns_in_the_next_window(self, prewarmed):
+        signed_url = prewarmed.create(URL)
+
+        with freeze_time("2022-12-22 00:40:00"):
+            assert prewarmed.create(URL) != signed_url
+
+    def test_create_stops_caching_when_the_window_is_full(self, prewarmed, create):
+        prewarmed.MAX_URLS_PER_WINDOW = 1
+
+        prewarmed.create(URL)
+        prewarmed.create(URL + "&other=1")
+        prewarmed.create(URL + "&other=1")
+
+        assert create.call_count == 3
+
+    def test_prewarm_signs_for_the_next_window(self, prewarmed, create):
+        expires = prewarmed.prewarm([URL])
+
+        assert expires == datetime(2022, 12, 22, 1, 30, tzinfo=timezone.utc).timestamp()
+        with freeze_time("2022-12-22 00:30:00"):
+            signed_url = prewarmed.create(URL)
+
+        create.assert_called_once()
+        assert ViaSecureURL("this_is_not_a_secret").verify(signed_url) == {
+            "exp": expires
+        }
+
+    def test_expired_windows_are_evicted(self, prewarmed, create):
+        prewarmed.create(URL)
+
+        with freeze_time("2022-12-22 02:00:00"):
+            prewarmed.create(URL + "&other=1")
+        with freeze_time("2022-12-22 00:10:00"):
+            prewarmed.create(URL)
+
+        assert create.call_count == 3
+
+    def test_start_prewarms_in_the_background(self, create):
+        # The background thread doesn't see `freeze_time` in compiled builds,
+        # so it gets a clock of its own
+        clock = FrozenClock(datetime(2022, 12, 22, 0, 10, tzinfo=timezone.utc))
+        prewarmed = PrewarmedViaSecureURL("this_is_not_a_secret", clock=clock)
+
+        # With a lead time of the whole window we are always due to pre-warm
+        prewarmed.start([URL], lead_time=timedelta(hours=1))
+        prewarmed.stop()
+
+        clock.set(datetime(2022, 12, 22, 0, 30, tzinfo=timezone.utc))
+        prewarmed.create(URL)
+
+        create.assert_called_once_with(
+            prewarmed,
+            URL,
+            payload=Any.dict(),
+            expires=datetime(2022, 12, 22, 1, 30, tzinfo=timezone.utc).timestamp(),
+        )
+
+    def test_start_prewarms_each_window(self, prewarmed, create):
+        prewarmed._stop = create_autospec(  # pylint:disable=protected-access
+            threading.Event, instance=True, spec_set=True
+        )
+        # Go around the loop twice before stopping
+        prewarmed._stop.wait.side_effect = (  # pylint:disable=protected-access
+            False,
+            False,
+            True,
+        )
+
+        prewarmed.start([URL], max_age=timedelta(hours=2))
+        prewarmed.stop()
+
+        # Wait for the lead time, wait for the boundary, then wait again
+        assert prewarmed._stop.wait.call_count == 3  # pylint:disable=protected-access
+        create.assert_called_once()
+
+    def test_start_waits_for_the_lead_time(self, prewarmed, create):
+        prewarmed.start([URL], lead_time=timedelta(seconds=0))
+        prewarmed.stop()
+
+        create.assert_not_called()
+
+    def test_start_can_only_be_called_once(self, prewarmed):
+        prewarmed.start([URL])
+
+        with pytest.raises(RuntimeError):
+            prewarmed.start([URL])
+
+        prewarmed.stop()
+
+    def test_stop_without_start(self, prewarmed):
+        prewarmed.stop()
+
+    @pytest.fixture
+    def create(self, patch):
+        return patch(
+            "h_vialib.secure.prewarm.SecureURL.create", side_effect=SecureURL.create
+        )
+
+    @pytest.fixture
+    def prewarmed(self):
+        return PrewarmedViaSecureURL("this_is_not_a_secret")
@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from h_vialib.secure import RevocationList
+
+
+class TestRevocationList:
+    def test_it_starts_empty(self):
+        assert not RevocationList().is_revoked("token")
+
+    def test_replace(self):
+        revocation_list = RevocationList()
+
+        revocation_list.replace(["token"])
+
+        assert revocation_list.is_revoked("token")
+        assert not revocation_list.is_revoked("other")
+
+    def test_it_loads_from_a_file(self, revoked_file):
+        revocation_list = RevocationList(str(revoked_file))
+
+        assert revocation_list.is_revoked("token-1")
+        assert revocation_list.is_revoked("token-2")
+        assert not revocation_list.is_revoked("# A comment")
+        assert not revocation_list.is_revoked("")
+
+    def test_reload_if_changed(self, revoked_file):
+        revocation_list = RevocationList(str(revoked_file))
+
+        assert not revocation_list.reload_if_changed()
+
+        revoked_file.write_text("token-3\n")
+        os.utime(revoked_file, ns=(0, 0))
+
+        assert revocation_list.reload_if_changed()
+        assert revocation_list.is_revoked("token-3")
+        assert not revocation_list.is_revoked("token-1")
+
+    @pytest.mark.parametrize("method", ("reload", "reload_if_changed"))
+    def test_reloading_without_a_file(self, method):
+        with pytest.raises(ValueError):
+            getattr(RevocationList(), method)()
+
+    @pytest.fixture
+    def revoked_file(self, tmp_path):
+        revoked_file = tmp_path / "revoked.txt"
+        revoked_file.write_text("# A comment\ntoken-1\n\n  token-2  \n")
+        return revoked_file
@@ -0,0 +1,82 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from h_vialib.secure import SignedURLStore
+
+URL = "http://example.com"
+DIGEST = b"digest"
+
+
+class TestSignedURLStore:
+    def test_it_round_trips(self, store):
+        store.put(URL, DIGEST, 100, "signed")
+
+        assert store.get(URL, DIGEST, 100) == "signed"
+
+    @pytest.mark.parametrize(
+        "url,digest,expires",
+        (
+            ("http://example.com/other", DIGEST, 100),
+            (URL, b"other", 100),
+            (URL, DIGEST, 200),
+        ),
+    )
+    def test_it_misses(self, store, url, digest, expires):
+        store.put(URL, DIGEST, 100, "signed")
+
+        assert store.get(url, digest, expires) is None
+
+    def test_it_keeps_the_first_url_stored(self, store):
+        store.put(URL, DIGEST, 100, "first")
+        store.put(URL, DIGEST, 100, "second")
+
+        assert store.get(URL, DIGEST, 100) == "first"
+
+    def test_it_is_shared_between_instances(self, store, tmp_path):
+        store.put(URL, DIGEST, 100, "signed")
+
+        assert SignedURLStore(str(tmp_path / "store.db")).get(URL, DIGEST, 100) == (
+            "signed"
+        )
+
+    def test_it_evicts_older_windows(self, store):
+        store.put(URL, DIGEST, 100, "old")
+        store.put(URL, DIGEST, 200, "new")
+
+        assert store.get(URL, DIGEST, 100) is None
+        assert store.get(URL, DIGEST, 200) == "new"
+
+    def test_it_can_be_used_from_threads(self, store):
+        store.put(URL, DIGEST, 100, "signed")
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(
+                executor.map(lambda _: store.get(URL, DIGEST, 100), range(8))
+            )
+
+        assert results == ["signed"] * 8
+
+    def test_it_reconnects_after_a_fork(self, store, patch):
+        getpid = patch("h_vialib.secure.store.os.getpid", return_value=1)
+        store.put(URL, DIGEST, 100, "signed")
+
+        getpid.return_value = 2
+
+        assert store.get(URL, DIGEST, 100) == "signed"
+
+    def test_it_carries_on_when_the_database_is_locked(self, tmp_path, patch):
+        connect = patch("h_vialib.secure.store.sqlite3.connect")
+        store = SignedURLStore(str(tmp_path / "store.db"))
+        connection = connect.return_value
+        connection.__enter__.return_value = connection
+        connection.execute.side_effect = sqlite3.OperationalError("locked")
+
+        store.put(URL, DIGEST, 100, "signed")
+
+        assert store.get(URL, DIGEST, 100) is None
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        return SignedURLStore(str(tmp_path / "store.db"), timeout=0)
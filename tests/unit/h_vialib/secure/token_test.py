@@ -1,3 +1,4 @@
+from base64 import urlsafe_b64encode
 from datetime import datetime, timedelta
 
 import pytest
@@ -8,6 +9,8 @@ from joserfc.errors import JoseError
 from joserfc.jwk import OctKey
 
 from h_vialib.exceptions import InvalidToken, MissingToken
+from h_vialib.secure.clock import FrozenClock
+from h_vialib.secure.revocation import RevocationList
 from h_vialib.secure.token import SecureToken
 
 key = OctKey.import_key("a_very_secret_secret")
@@ -17,6 +20,17 @@ def decode_token(token_string):
     return jwt.decode(token_string, key).claims
 
 
+def forged_token(payload):
+    """Get a token with our header and a bad signature."""
+    return ".".join(
+        (
+            "eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9",
+            urlsafe_b64encode(payload).decode("ascii").rstrip("="),
+            "x" * 43,
+        )
+    )
+
+
 # This were generated by python-jose but are different than the ones generated by joserfc
 # While the payload is the same the header key order is different:
 #    `typ` & `alg` avs `alg` & `typ`
@@ -83,6 +97,11 @@ class TestSecureToken:
         assert token_string == Any.string()
         assert decode_token(token_string) == {"a": 2, "exp": Any.int()}
 
+    def test_create_works_without_a_payload(self, token):
+        token_string = token.create(max_age=10)
+
+        assert decode_token(token_string) == {"exp": Any.int()}
+
     def test_create_fails_if_no_expiry_is_set(self, token):
         with pytest.raises(ValueError):
             token.create({})
@@ -101,16 +120,117 @@ class TestSecureToken:
         with pytest.raises(InvalidToken):
             token.verify(token_string)
 
+    def test_it_uses_the_clock(self):
+        clock = FrozenClock(datetime(2022, 12, 22))
+        token = SecureToken("a_very_secret_secret", clock=clock)
+
+        token_string = token.create({"a": 2}, max_age=10)
+        assert token.verify(token_string) == {
+            "a": 2,
+            "exp": int(datetime(2022, 12, 22).timestamp()) + 10,
+        }
+
+        clock.advance(11)
+        with pytest.raises(InvalidToken):
+            token.verify(token_string)
+
     @pytest.mark.parametrize("token_string", (None, ""))
     def test_verify_catches_there_being_no_value(self, token, token_string):
         with pytest.raises(MissingToken):
             token.verify(token_string)
 
+    @freeze_time("2022-12-22")
     @pytest.mark.parametrize("exception", [JoseError])
     def test_verify_translates_errors(self, token, jwt, exception):
         jwt.decode.side_effect = exception
         with pytest.raises(InvalidToken):
-            token.verify("fake_token")
+            token.verify(old_payloads[0][2])
+
+        jwt.decode.assert_called_once()
+
+    @freeze_time("2022-12-22")
+    @pytest.mark.parametrize(
+        "token_string,precheck",
+        (
+            ("too_short", "length"),
+            ("x" * 9000, "length"),
+            (old_payloads[0][2].replace(".", "", 1), "segments"),
+            (old_payloads[0][2] + ".extra", "segments"),
+            ("eyJhbGciOiJub25lIiwidHlwIjoiSldUIn0" + old_payloads[0][2][36:], "header"),
+            (old_payloads[0][2].replace(".eyJ", ".!!!"), "payload"),
+            (old_payloads[0][2].replace(".eyJ", ".WzF"), "payload"),
+            pytest.param(forged_token(b"[" * 5000), "payload", id="deeply-nested"),
+        ),
+    )
+    def test_verify_prechecks_tokens(self, token, jwt, token_string, precheck):
+        with pytest.raises(InvalidToken):
+            token.verify(token_string)
+
+        jwt.decode.assert_not_called()
+        assert token.rejections() == Any.dict().containing({precheck: 1})
+        assert sum(token.rejections().values()) == 1
+
+    def test_verify_prechecks_expiry(self, token, jwt):
+        with pytest.raises(InvalidToken):
+            # Created in 2022 and only valid for 10 seconds
+            token.verify(old_payloads[0][2])
+
+        jwt.decode.assert_not_called()
+        assert token.rejections()["expired"] == 1
+
+    @freeze_time("2022-12-22")
+    @pytest.mark.parametrize(
+        "payload",
+        (
+            b'{"exp":"soon"}',
+            b'{"exp":1.5}',
+            # We can't tell which of these is the real one without parsing
+            b'{"a":{"exp":1},"exp":9999999999}',
+        ),
+    )
+    def test_verify_leaves_unexpected_expiry_to_the_full_check(
+        self, token, jwt, payload
+    ):
+        jwt.decode.side_effect = JoseError
+
+        with pytest.raises(InvalidToken):
+            token.verify(forged_token(payload))
+
+        jwt.decode.assert_called_once()
+        assert not any(token.rejections().values())
+
+    @pytest.mark.parametrize(
+        "payload",
+        (
+            pytest.param(b"[" * 5000, id="list"),
+            pytest.param(
+                b'{"a":' + b"[" * 4000 + b"]" * 4000 + b',"exp":9999999999}',
+                id="object",
+            ),
+        ),
+    )
+    def test_verify_rejects_deeply_nested_payloads(self, token, payload):
+        with pytest.raises(InvalidToken):
+            token.verify(forged_token(payload))
+
+    def test_headers_match_the_tokens_we_create(self, token):
+        headers = SecureToken._HEADERS  # pylint:disable=protected-access
+
+        assert token.create(max_age=10).split(".")[0] in headers
+
+    def test_rejections_start_at_zero(self, token):
+        assert token.rejections() == dict.fromkeys(SecureToken.PRECHECKS, 0)
+
+    def test_verify_rejects_revoked_tokens(self, token):
+        revoked = token.create({"a": 2}, max_age=10)
+        other = token.create({"a": 3}, max_age=10)
+        revocation_list = RevocationList()
+        revocation_list.replace([revoked])
+        token = SecureToken("a_very_secret_secret", revocation_list=revocation_list)
+
+        assert token.verify(other) == {"a": 3, "exp": Any.int()}
+        with pytest.raises(InvalidToken):
+            token.verify(revoked)
 
     @pytest.fixture
     def token(self):
@@ -1,10 +1,20 @@
+import time
+from base64 import b64encode, urlsafe_b64decode, urlsafe_b64encode
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 import pytest
+from freezegun import freeze_time
 from h_matchers import Any
 
 from h_vialib.exceptions import InvalidToken, MissingToken
-from h_vialib.secure import SecureToken
+from h_vialib.secure import (
+    FrozenClock,
+    RevocationList,
+    SecureToken,
+    VerificationCache,
+    quantized_expiry,
+)
 from h_vialib.secure.url import SecureURL, ViaSecureURL
 
 
@@ -28,9 +38,43 @@ class TestSecureURL:
         with pytest.raises(ValueError):
             secure_url.create(bad_url, {}, max_age=10)
 
-    def test_verify_fails_with_a_missing_token(self, secure_url):
+    @pytest.mark.parametrize("version", (1, 2))
+    @pytest.mark.parametrize(
+        "payload", ({"v": 1}, {"v": 2}, {"v": 3}, {"h": "value"}, {"h": "", "v": 1})
+    )
+    def test_create_rejects_payloads_with_our_keys(self, version, payload):
+        secure_url = SecureURL(
+            "this_is_not_a_secret", "tok.sec", url_hash_version=version
+        )
+
+        with pytest.raises(ValueError):
+            secure_url.create("http://example.com", payload, max_age=10)
+
+    def test_create_doesnt_modify_the_payload(self, secure_url):
+        payload = {"a": 1}
+
+        secure_url.create("http://example.com", payload, max_age=10)
+
+        assert secure_url.create("http://example.com/other", payload, max_age=10)
+        assert payload == {"a": 1}
+
+    def test_verify_keeps_a_version_1_from_the_payload(self, secure_url):
+        # Tokens made before we checked could have one
+        url = "http://example.com?a=1"
+        digest = secure_url._digest_url_v1(url)  # pylint:disable=protected-access
+        token = SecureToken("this_is_not_a_secret").create(
+            {"h": b64encode(digest).decode("utf-8"), "v": 1}, max_age=10
+        )
+
+        assert secure_url.verify(f"{url}&tok.sec={token}") == {
+            "v": 1,
+            "exp": Any.int(),
+        }
+
+    @pytest.mark.parametrize("url", ("http://example.com", "", None))
+    def test_verify_fails_with_a_missing_token(self, secure_url, url):
         with pytest.raises(MissingToken):
-            secure_url.verify("http://example.com")
+            secure_url.verify(url)
 
     @pytest.mark.parametrize("payload", ({}, {"h": "not_a_hash_at_all"}))
     def test_verify_fails_with_bad_tokens(self, secure_url, payload):
@@ -53,12 +97,340 @@ class TestSecureURL:
         # of the original URL) is the same
         assert len(short_secure) - len(short_url) == len(long_secure) - len(long_url)
 
+    def test_round_tripping_compact_tokens(self, compact_secure_url):
+        url = "http://example.com?a=1&tok.sec=OLD_TOKEN&a=2"
+
+        signed_url = compact_secure_url.create(url, {}, max_age=10)
+        decoded = compact_secure_url.verify(signed_url)
+
+        assert signed_url == Any.url.matching(url).with_query(
+            [("a", "1"), ("a", "2"), ("tok.sec", Any.string.matching(r"^[\w-]{28}$"))]
+        )
+        assert decoded == {"exp": Any.int()}
+
+    def test_compact_tokens_are_shorter(self, secure_url, compact_secure_url):
+        url = "http://example.com?a=1"
+
+        signed_url = secure_url.create(url, {}, max_age=10)
+        compact_signed_url = compact_secure_url.create(url, {}, max_age=10)
+
+        assert len(compact_signed_url) < len(signed_url)
+
+    def test_verify_accepts_both_formats(self, secure_url, compact_secure_url):
+        url = "http://example.com?a=1"
+
+        assert secure_url.verify(compact_secure_url.create(url, {}, max_age=10))
+        assert compact_secure_url.verify(secure_url.create(url, {}, max_age=10))
+
+    def test_create_compact_rejects_payloads(self, compact_secure_url):
+        with pytest.raises(ValueError):
+            compact_secure_url.create("http://example.com", {"a": 1}, max_age=10)
+
+    @pytest.mark.parametrize(
+        "tamper",
+        (
+            # A different URL
+            lambda url: url.replace("a=1", "a=2"),
+            # A modified MAC
+            lambda url: url[:-1] + ("A" if url[-1] != "A" else "B"),
+            # An unknown version
+            lambda url: replace_token(url, lambda data: b"\x03" + data[1:]),
+            # A different version
+            lambda url: replace_token(url, lambda data: b"\x02" + data[1:]),
+            # A truncated token
+            lambda url: replace_token(url, lambda data: data[:-3]),
+            # Something which isn't base64 at all
+            lambda url: url.split("tok.sec=")[0] + "tok.sec=%21%21",
+            # Characters which base64 decoding would skip over
+            lambda url: url[:-5] + "!" + url[-5:],
+            lambda url: url[:-5] + "%0A" + url[-5:],
+            # Padding
+            lambda url: url + "%3D",
+        ),
+    )
+    def test_verify_rejects_bad_compact_tokens(self, compact_secure_url, tamper):
+        signed_url = compact_secure_url.create("http://example.com?a=1", {}, max_age=10)
+
+        with pytest.raises(InvalidToken):
+            compact_secure_url.verify(tamper(signed_url))
+
+    def test_verify_rejects_expired_compact_tokens(self, compact_secure_url):
+        with freeze_time("2022-12-22"):
+            signed_url = compact_secure_url.create("http://example.com", {}, max_age=10)
+
+        with pytest.raises(InvalidToken):
+            compact_secure_url.verify(signed_url)
+
+    @pytest.mark.parametrize("compact", (True, False))
+    def test_it_can_be_shared_between_threads(self, compact):
+        secure_url = SecureURL("this_is_not_a_secret", "tok.sec", compact=compact)
+
+        def round_trip(i):
+            url = f"http://example.com?a={i}"
+            return secure_url.verify(secure_url.create(url, {}, max_age=10))
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(round_trip, range(200)))
+
+        assert results == [{"exp": Any.int()}] * 200
+
+    @pytest.mark.parametrize("compact", (True, False))
+    def test_verify_with_a_verification_cache(self, compact, tmp_path, patch):
+        cache = VerificationCache(str(tmp_path / "cache"))
+        secure_url = SecureURL(
+            "this_is_not_a_secret", "tok.sec", compact, verification_cache=cache
+        )
+        signed_url = secure_url.create("http://example.com", {}, max_age=10)
+        # Another worker with the same secret
+        other_secure_url = SecureURL(
+            "this_is_not_a_secret", "tok.sec", compact, verification_cache=cache
+        )
+
+        decoded = secure_url.verify(signed_url)
+        _verify = patch("h_vialib.secure.url.SecureURL._verify")
+
+        assert other_secure_url.verify(signed_url) == decoded
+        _verify.assert_not_called()
+
+    def test_verification_cache_entries_are_keyed_on_the_secret(self, tmp_path):
+        cache = VerificationCache(str(tmp_path / "cache"))
+        secure_url = SecureURL(
+            "this_is_not_a_secret", "tok.sec", verification_cache=cache
+        )
+        signed_url = secure_url.create("http://example.com", {}, max_age=10)
+        secure_url.verify(signed_url)
+
+        other_secure_url = SecureURL(
+            "this_is_another_secret", "tok.sec", verification_cache=cache
+        )
+
+        with pytest.raises(InvalidToken):
+            other_secure_url.verify(signed_url)
+
+    def test_verification_cache_doesnt_cache_payloads(self, tmp_path):
+        cache = VerificationCache(str(tmp_path / "cache"))
+        secure_url = SecureURL(
+            "this_is_not_a_secret", "tok.sec", verification_cache=cache
+        )
+        signed_url = secure_url.create("http://example.com", {"a": "b"}, max_age=10)
+
+        secure_url.verify(signed_url)
+
+        assert secure_url.verify(signed_url) == {"a": "b", "exp": Any.int()}
+
+    def test_verification_cache_doesnt_cache_failures(self, tmp_path):
+        cache = VerificationCache(str(tmp_path / "cache"))
+        secure_url = SecureURL(
+            "this_is_not_a_secret", "tok.sec", verification_cache=cache
+        )
+
+        for _ in range(2):
+            with pytest.raises(InvalidToken):
+                secure_url.verify("http://example.com?tok.sec=invalid.to.ken")
+
+    def test_verification_cache_checks_expiry_with_the_clock(self, tmp_path):
+        clock = FrozenClock(int(time.time()))
+        secure_url = SecureURL(
+            "this_is_not_a_secret",
+            "tok.sec",
+            verification_cache=VerificationCache(str(tmp_path / "cache")),
+            clock=clock,
+        )
+        signed_url = secure_url.create("http://example.com", {}, max_age=10)
+        secure_url.verify(signed_url)
+
+        clock.advance(11)
+
+        with pytest.raises(InvalidToken):
+            secure_url.verify(signed_url)
+
+    @pytest.mark.parametrize("compact", (True, False))
+    @pytest.mark.parametrize("cached", (True, False))
+    def test_verify_rejects_revoked_tokens(self, compact, cached, tmp_path):
+        revocation_list = RevocationList()
+        secure_url = SecureURL(
+            "this_is_not_a_secret",
+            "tok.sec",
+            compact,
+            verification_cache=(
+                VerificationCache(str(tmp_path / "cache")) if cached else None
+            ),
+            revocation_list=revocation_list,
+        )
+        signed_url = secure_url.create("http://example.com", {}, max_age=10)
+        other_signed_url = secure_url.create("http://example.com/other", {}, max_age=10)
+        # Make sure any cache has this in it already
+        secure_url.verify(signed_url)
+
+        revocation_list.replace([signed_url.split("tok.sec=")[1]])
+
+        with pytest.raises(InvalidToken):
+            secure_url.verify(signed_url)
+        assert secure_url.verify(other_signed_url) == {"exp": Any.int()}
+
+    @pytest.mark.parametrize(
+        "alter",
+        (
+            lambda token: token[:5] + "!" + token[5:],
+            lambda token: token[:5] + "%0A" + token[5:],
+            lambda token: token + "%3D",
+        ),
+    )
+    def test_verify_rejects_altered_revoked_compact_tokens(self, alter):
+        revocation_list = RevocationList()
+        secure_url = SecureURL(
+            "this_is_not_a_secret",
+            "tok.sec",
+            compact=True,
+            revocation_list=revocation_list,
+        )
+        url, token = secure_url.create("http://example.com", {}, max_age=10).split(
+            "tok.sec="
+        )
+        revocation_list.replace([token])
+
+        with pytest.raises(InvalidToken):
+            secure_url.verify(url + "tok.sec=" + alter(token))
+
+    def test_verify_with_a_revocation_list_and_no_token(self):
+        secure_url = SecureURL(
+            "this_is_not_a_secret", "tok.sec", revocation_list=RevocationList()
+        )
+
+        with pytest.raises(MissingToken):
+            secure_url.verify("http://example.com")
+
     @pytest.fixture
     def secure_url(self):
         return SecureURL("this_is_not_a_secret", "tok.sec")
 
+    @pytest.fixture
+    def compact_secure_url(self):
+        return SecureURL("this_is_not_a_secret", "tok.sec", compact=True)
+
+
+class TestSecureURLVersion2:
+    @pytest.mark.parametrize(
+        "url,expected_prefix",
+        (
+            ("http://example.com", "http://example.com?"),
+            ("http://example.com/?", "http://example.com/?"),
+            ("http://example.com/?b=2&a=1%20x", "http://example.com/?b=2&a=1%20x&"),
+            ("http://example.com/?a=1&", "http://example.com/?a=1&"),
+            (
+                "http://example.com/?a=1&tok.sec=OLD_TOKEN&b=2",
+                "http://example.com/?a=1&b=2&",
+            ),
+        ),
+    )
+    def test_it_appends_the_token(self, secure_url, url, expected_prefix):
+        signed_url = secure_url.create(url, {}, max_age=10)
+
+        prefix, token = signed_url.split("tok.sec=")
+        assert prefix == expected_prefix
+        assert token == Any.string.matching("^[\\w.-]+$")
+
+    @pytest.mark.parametrize("compact", (True, False))
+    def test_round_tripping(self, compact):
+        secure_url = self.secure_url_v2(compact)
+        payload = {} if compact else {"extra": "value"}
+
+        signed_url = secure_url.create(
+            "http://example.com/?a=1", dict(payload), max_age=10
+        )
+
+        assert secure_url.verify(signed_url) == {**payload, "exp": Any.int()}
+
+    @pytest.mark.parametrize("compact", (True, False))
+    def test_it_keeps_fragments_after_the_token(self, compact):
+        secure_url = self.secure_url_v2(compact)
+
+        signed_url = secure_url.create("http://example.com/?a=1#frag", {}, max_age=10)
+
+        assert signed_url.endswith("#frag")
+        secure_url.verify(signed_url)
+        # Browsers don't send the fragment
+        secure_url.verify(signed_url.split("#")[0])
+
+    def test_it_marks_the_version_in_the_jwt(self, secure_url):
+        signed_url = secure_url.create("http://example.com", {}, max_age=10)
+
+        token = signed_url.split("tok.sec=")[1]
+        assert SecureToken("this_is_not_a_secret").verify(
+            token
+        ) == Any.dict().containing({"v": 2})
+
+    @pytest.mark.parametrize("compact", (True, False))
+    @pytest.mark.parametrize(
+        "tamper",
+        (
+            # A different URL
+            lambda url: url.replace("a=1", "a=2"),
+            # The same URL encoded differently
+            lambda url: url.replace("a=1", "%61=1"),
+            # Another parameter after the token
+            lambda url: url + "&b=2",
+        ),
+    )
+    def test_verify_rejects_modified_urls(self, compact, tamper):
+        secure_url = self.secure_url_v2(compact)
+        signed_url = secure_url.create("http://example.com/?a=1", {}, max_age=10)
+
+        with pytest.raises(InvalidToken):
+            secure_url.verify(tamper(signed_url))
+
+    @pytest.mark.parametrize("compact", (True, False))
+    def test_it_verifies_either_version(self, compact):
+        secure_url_v1 = SecureURL("this_is_not_a_secret", "tok.sec", compact=compact)
+        secure_url_v2 = self.secure_url_v2(compact)
+        url = "http://example.com/?a=1"
+
+        secure_url_v1.verify(secure_url_v2.create(url, {}, max_age=10))
+        secure_url_v2.verify(secure_url_v1.create(url, {}, max_age=10))
+
+    def test_verify_rejects_unknown_versions(self, secure_url):
+        token = SecureToken("this_is_not_a_secret").create(
+            {"h": "not_a_hash_at_all", "v": 3}, max_age=10
+        )
+
+        with pytest.raises(InvalidToken):
+            secure_url.verify(f"http://example.com/?tok.sec={token}")
+
+    def test_it_rejects_unknown_versions_when_creating(self):
+        with pytest.raises(ValueError):
+            SecureURL("this_is_not_a_secret", "tok.sec", url_hash_version=3)
+
+    @pytest.fixture
+    def secure_url(self):
+        return self.secure_url_v2(compact=False)
+
+    @staticmethod
+    def secure_url_v2(compact):
+        return SecureURL(
+            "this_is_not_a_secret", "tok.sec", compact=compact, url_hash_version=2
+        )
+
 
 class TestViaSecureURL:
+    @pytest.mark.parametrize("bad_url", (None, ""))
+    def test_create_requires_a_url(self, bad_url):
+        with pytest.raises(ValueError):
+            ViaSecureURL("this_is_not_a_secret").create(bad_url)
+
+    def test_verify_rejects_deeply_nested_payloads(self):
+        token = ".".join(
+            (
+                "eyJ0eXAiOiJKV1QiLCJhbGciOiJIUzI1NiJ9",
+                urlsafe_b64encode(b"[" * 5000).decode("ascii"),
+                "x" * 43,
+            )
+        )
+
+        with pytest.raises(InvalidToken):
+            ViaSecureURL("this_is_not_a_secret").verify(
+                f"http://example.com?via.sec={token}"
+            )
+
     @pytest.mark.parametrize(
         "given_max_age,expected_max_age",
         [
@@ -68,8 +440,8 @@ class TestViaSecureURL:
             (timedelta(hours=25), timedelta(hours=25)),
         ],
     )
-    def test_round_tripping(self, quantized_expiry, given_max_age, expected_max_age):
-        token = ViaSecureURL("this_is_not_a_secret")
+    def test_round_tripping(self, clock, given_max_age, expected_max_age):
+        token = ViaSecureURL("this_is_not_a_secret", clock=clock)
 
         signed_url = token.create("http://example.com?via.sec=OLD_TOKEN", given_max_age)
         decoded = token.verify(signed_url)
@@ -77,16 +449,55 @@ class TestViaSecureURL:
         assert signed_url == Any.url.matching(signed_url).with_query(
             {"via.sec": Any.string()}
         )
-        quantized_expiry.assert_called_once_with(expected_max_age)
         assert decoded == {
-            "exp": int(quantized_expiry.return_value.timestamp()),
+            "exp": int(quantized_expiry(expected_max_age, clock=clock).timestamp()),
         }
 
+    def test_round_tripping_compact_tokens(self, clock):
+        token = ViaSecureURL("this_is_not_a_secret", compact=True, clock=clock)
+
+        signed_url = token.create("http://example.com?via.sec=OLD_TOKEN")
+
+        assert token.verify(signed_url) == {
+            "exp": int(quantized_expiry(ViaSecureURL.MAX_AGE, clock=clock).timestamp()),
+        }
+
+    def test_it_uses_the_same_expiry_throughout_a_window(self, clock):
+        token = ViaSecureURL("this_is_not_a_secret", compact=True, clock=clock)
+        signed_url = token.create("http://example.com")
+
+        clock.advance(timedelta(minutes=29))
+        assert token.create("http://example.com") == signed_url
+
+        clock.advance(timedelta(minutes=1))
+        assert token.create("http://example.com") != signed_url
+
+    def test_it_can_create_version_2_tokens(self, clock):
+        token = ViaSecureURL("this_is_not_a_secret", clock=clock, url_hash_version=2)
+
+        signed_url = token.create("http://example.com/?a=1")
+
+        assert signed_url.startswith("http://example.com/?a=1&via.sec=")
+        assert token.verify(signed_url) == {"exp": Any.int()}
+
+    def test_it_checks_expiry_with_the_clock(self, clock):
+        token = ViaSecureURL("this_is_not_a_secret", compact=True, clock=clock)
+        signed_url = token.create("http://example.com")
+
+        clock.advance(timedelta(hours=1, seconds=1))
+
+        with pytest.raises(InvalidToken):
+            token.verify(signed_url)
+
     @pytest.fixture
-    def quantized_expiry(self, patch):
-        quantized_expiry = patch("h_vialib.secure.url.quantized_expiry")
-        quantized_expiry.return_value = datetime.now(tz=timezone.utc) + timedelta(
-            seconds=10
-        )
+    def clock(self):
+        # At the start of an expiry window
+        return FrozenClock(datetime(2022, 12, 22, tzinfo=timezone.utc))
+
 
-        return quantized_expiry
+def replace_token(url, modify):
+    url, token = url.split("tok.sec=")
+
+    return (
+        url + "tok.sec=" + urlsafe_b64encode(modify(urlsafe_b64decode(token))).decode()
+    )
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from h_vialib.secure import VerificationCache
+
+DIGEST = b"0123456789abcdef"
+
+
+class TestVerificationCache:
+    def test_it_round_trips(self, cache):
+        cache.put(DIGEST, self.future())
+
+        assert cache.get(DIGEST) == self.future()
+
+    def test_it_misses_for_unknown_digests(self, cache):
+        cache.put(DIGEST, self.future())
+
+        assert cache.get(b"fedcba9876543210") is None
+
+    def test_it_misses_for_expired_entries(self, cache):
+        cache.put(DIGEST, int(time.time()) - 1)
+
+        assert cache.get(DIGEST) is None
+
+    def test_it_checks_expiry_against_the_time_given(self, cache):
+        cache.put(DIGEST, 1000)
+
+        assert cache.get(DIGEST, now=1000) == 1000
+        assert cache.get(DIGEST, now=1001) is None
+
+    def test_it_misses_for_torn_entries(self, cache, tmp_path):
+        cache.put(DIGEST, self.future())
+        cache.close()
+        # Simulate a write which has only got as far as part of the expiry
+        offset = cache._offset(DIGEST)  # pylint:disable=protected-access
+        with open(tmp_path / "cache", "r+b") as cache_file:
+            cache_file.seek(offset + VerificationCache.DIGEST_SIZE)
+            cache_file.write(b"\xff\xff")
+
+        assert VerificationCache(str(tmp_path / "cache"), slots=16).get(DIGEST) is None
+
+    def test_new_entries_replace_old_ones_in_the_same_slot(self, tmp_path):
+        cache = VerificationCache(str(tmp_path / "cache"), slots=1)
+        other_digest = b"fedcba9876543210"
+
+        cache.put(DIGEST, self.future())
+        cache.put(other_digest, self.future())
+
+        assert cache.get(DIGEST) is None
+        assert cache.get(other_digest) == self.future()
+
+    def test_it_is_shared_through_the_file(self, cache, tmp_path):
+        # As a separate mapping of the file, this is the same as another process
+        VerificationCache(str(tmp_path / "cache"), slots=16).put(DIGEST, self.future())
+
+        assert cache.get(DIGEST) == self.future()
+
+    def test_it_doesnt_shrink_the_file(self, cache, tmp_path):
+        cache.put(DIGEST, self.future())
+
+        smaller_cache = VerificationCache(str(tmp_path / "cache"), slots=1)
+
+        assert (tmp_path / "cache").stat().st_size == 16 * 32
+        assert smaller_cache.get(b"fedcba9876543210") is None
+
+    @staticmethod
+    def future():
+        return 2_000_000_000
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        return VerificationCache(str(tmp_path / "cache"), slots=16)